@@ -0,0 +1,259 @@
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+import numpy as np
+from database import db_iter, transaction
+import archive
+import changes
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+EXPORT_DIR = os.environ.get('ANALYTICS_DIR', 'analytics')
+EXPORT_INTERVAL = float(os.environ.get('ANALYTICS_EXPORT_INTERVAL', 900))  # seconds between exports; 0 exports only on demand
+FORMAT = os.environ.get('ANALYTICS_FORMAT', 'parquet' if pq else 'npz')
+MAX_GROUPS = 100000
+BUCKETS = ('year', 'month', 'week', 'day')
+
+log = logging.getLogger(__name__)
+
+class QueryError(ValueError):
+    pass
+
+# dataset -> archive entity (hot table plus month partitions) and its columns as (name, kind, source column).
+# kinds: int (nullable ids, -1 when missing), float, str (dictionary encoded), time (datetime64[s]).
+DATASETS = {
+    'recycling': ('recycling', [('id', 'int', 'id'), ('user_id', 'int', 'user_id'), ('material', 'str', 'material_type'), ('location', 'str', 'location'), ('weight', 'float', 'weight'), ('impact', 'float', 'environmental_impact'), ('created_at', 'time', 'created_at')]),
+    'collections': ('collections', [('id', 'int', 'id'), ('user_id', 'int', 'user_id'), ('bin_id', 'int', 'bin_id'), ('status', 'str', 'status'), ('waste_type', 'str', 'waste_type'), ('priority', 'str', 'priority'), ('location', 'str', 'location'), ('weight', 'float', 'weight'), ('created_at', 'time', 'created_at')]),
+}
+
+class Frame:
+    # Column arrays of one exported dataset; str columns hold int32 codes into values[name].
+    def __init__(self, columns, values, meta):
+        self.columns, self.values, self.meta = columns, values, meta
+
+    def __len__(self): return len(self.columns['id'])
+
+def _encode(strings):
+    index = {}
+    codes = np.fromiter((index.setdefault(s or '', len(index)) for s in strings), np.int32, len(strings))
+    return codes, np.array(list(index), dtype=str)
+
+def _columns(dataset, rows):
+    # rows: iterable of tuples in DATASETS order -> Frame columns, built per batch to bound memory.
+    spec = DATASETS[dataset][1]
+    parts = [[] for _ in spec]
+    batch = []
+    def flush():
+        for i, ((_, kind, _), col) in enumerate(zip(spec, zip(*batch))):
+            if kind == 'int': parts[i].append(np.array([-1 if v is None else v for v in col], np.int64))
+            elif kind == 'float': parts[i].append(np.array([v or 0.0 for v in col], np.float64))
+            elif kind == 'time': parts[i].append(np.array(col, 'datetime64[s]'))
+            else: parts[i].append(col)
+        batch.clear()
+    for r in rows:
+        batch.append(r)
+        if len(batch) == 10000: flush()
+    if batch: flush()
+    columns, values = {}, {}
+    for (name, kind, _), chunks in zip(spec, parts):
+        if kind == 'str': columns[name], values[name] = _encode([s for c in chunks for s in c])
+        else: columns[name] = np.concatenate(chunks) if chunks else np.empty(0, 'datetime64[s]' if kind == 'time' else np.int64 if kind == 'int' else np.float64)
+    return columns, values
+
+def export(dataset, directory=EXPORT_DIR, fmt=FORMAT):
+    # One deferred read transaction: under WAL it sees a consistent snapshot of the hot table and every
+    # archive partition without taking the write lock, so writers carry on while the export runs.
+    entity, spec = DATASETS[dataset]
+    select = ', '.join(source for _, _, source in spec)
+    start = time.perf_counter()
+    with transaction(immediate=False):
+        version = changes.current_version()
+        tables = [archive.POLICIES[entity][0]] + [t for _, _, t, _ in archive.partitions(entity)]
+        columns, values = _columns(dataset, (r for t in tables for r in db_iter(f'SELECT {select} FROM {t}', batch=5000)))
+    meta = {'dataset': dataset, 'version': version, 'rows': len(columns['id']), 'exportedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'format': fmt}
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{dataset}.{fmt}')
+    tmp = path + '.tmp'
+    if fmt == 'parquet':
+        if pq is None: raise QueryError('Parquet export needs pyarrow')
+        arrays = {name: pa.DictionaryArray.from_arrays(columns[name], values[name]) if name in values else pa.array(columns[name]) for name, _, _ in spec}
+        pq.write_table(pa.table(arrays).replace_schema_metadata({'takatrack': json.dumps(meta)}), tmp, compression='zstd')
+    else:
+        with open(tmp, 'wb') as f: np.savez_compressed(f, __meta__=np.array(json.dumps(meta)), **columns, **{f'{k}__values': v for k, v in values.items()})
+    os.replace(tmp, path)
+    meta['exportMs'] = round((time.perf_counter() - start) * 1000, 1)
+    return meta
+
+def load(path):
+    if path.endswith('.parquet'):
+        table = pq.read_table(path)
+        meta = json.loads(table.schema.metadata[b'takatrack'])
+        columns, values = {}, {}
+        for name in table.column_names:
+            col = table.column(name).combine_chunks()
+            if pa.types.is_dictionary(col.type):
+                columns[name] = col.indices.to_numpy(zero_copy_only=False).astype(np.int32)
+                values[name] = col.dictionary.to_numpy(zero_copy_only=False).astype(str)
+            else: columns[name] = col.to_numpy(zero_copy_only=False)
+        return Frame(columns, values, meta)
+    with np.load(path) as f:
+        meta = json.loads(f['__meta__'].item())
+        values = {k[:-8]: f[k] for k in f.files if k.endswith('__values')}
+        columns = {k: f[k] for k in f.files if k != '__meta__' and not k.endswith('__values')}
+    return Frame(columns, values, meta)
+
+class Store:
+    # Latest export per dataset, loaded once and reloaded when the file on disk is replaced.
+    def __init__(self, directory=EXPORT_DIR):
+        self.directory = directory
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def _path(self, dataset):
+        for fmt in ('parquet', 'npz') if pq else ('npz',):
+            path = os.path.join(self.directory, f'{dataset}.{fmt}')
+            if os.path.exists(path): return path
+
+    def get(self, dataset):
+        path = self._path(dataset)
+        if path is None: return None
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            cached = self._frames.get(dataset)
+            if cached is None or cached[0] != (path, mtime):
+                cached = self._frames[dataset] = ((path, mtime), load(path))
+            return cached[1]
+
+    def version(self, dataset):
+        frame = self.get(dataset) if dataset in DATASETS else None
+        return frame.meta['version'] if frame else 0
+
+store = Store()
+
+def _factorize(v, missing, label):
+    # Integer keys -> (codes, size, label(code)). A small value range is coded as v - min without sorting;
+    # a wide one falls back to np.unique. Missing values get the last code and a None label.
+    present = v[~missing]
+    lo, hi = (int(present.min()), int(present.max())) if len(present) else (0, -1)
+    if hi - lo < 4 * len(v) + 1024:
+        return np.where(missing, hi - lo + 1, v - lo), hi - lo + 2, lambda c: None if c > hi - lo else label(lo + c)
+    uniq, codes = np.unique(np.where(missing, hi + 1, v), return_inverse=True)
+    return codes, len(uniq), lambda c: None if uniq[c] > hi else label(int(uniq[c]))
+
+def _keys(frame, name):
+    # (codes, size, label) for a group-by key; time buckets come from created_at.
+    if name in BUCKETS:
+        unit = {'year': 'Y', 'month': 'M', 'week': 'D', 'day': 'D'}[name]
+        t = frame.columns['created_at'].astype(f'datetime64[{unit}]')
+        if name == 'week': t = t - (t.astype(np.int64) + 3) % 7  # weeks start on Monday; 1970-01-01 was a Thursday
+        return _factorize(t.astype(np.int64), np.isnat(t), lambda v: str(np.datetime64(v, unit)))
+    if name in frame.values:
+        labels = frame.values[name].tolist()
+        return frame.columns[name], max(len(labels), 1), lambda c: labels[c] or None
+    v = frame.columns[name]
+    return _factorize(v, v == -1, lambda x: x)
+
+def _mask(frame, filters, start, end):
+    mask = np.ones(len(frame), bool)
+    t = frame.columns['created_at']
+    if start: mask &= t >= np.datetime64(start, 's')
+    if end: mask &= t < np.datetime64(end, 's')
+    for name, value in filters.items():
+        if name in frame.values:
+            hit = np.flatnonzero(frame.values[name] == value)
+            mask &= np.isin(frame.columns[name], hit)
+        else: mask &= frame.columns[name] == int(value)
+    return mask
+
+def aggregate(frame, group_by, filters=None, start=None, end=None):
+    # Vectorized GROUP BY: key codes are packed into one int64 per row, then np.bincount computes the
+    # count and every float column's sum in one pass each (after np.unique only if the key space is sparse).
+    spec = DATASETS[frame.meta['dataset']][1]
+    sums = [name for name, kind, _ in spec if kind == 'float']
+    mask = _mask(frame, filters or {}, start, end)
+    keys = [_keys(frame, name) for name in group_by]
+    dims = [size for _, size, _ in keys]
+    packed = np.ravel_multi_index([codes[mask] for codes, _, _ in keys], dims) if keys else np.zeros(int(mask.sum()), np.int64)
+    if math.prod(dims) <= 4 * len(packed) + 1024:
+        counts = np.bincount(packed, minlength=math.prod(dims))
+        groups = np.flatnonzero(counts)
+        counts = counts[groups]
+        totals = {name: np.bincount(packed, weights=frame.columns[name][mask], minlength=math.prod(dims))[groups] for name in sums}
+    else:
+        groups, inverse, counts = np.unique(packed, return_inverse=True, return_counts=True)
+        totals = {name: np.bincount(inverse, weights=frame.columns[name][mask], minlength=len(groups)) for name in sums}
+    if len(groups) > MAX_GROUPS: raise QueryError(f'More than {MAX_GROUPS} groups; narrow the query')
+    codes = np.unravel_index(groups, dims) if keys else []
+    out = []
+    for g in range(len(groups)):
+        row = {name: label(int(codes[k][g])) for k, (name, (_, _, label)) in enumerate(zip(group_by, keys))}
+        row['count'] = int(counts[g])
+        for name in sums: row[name] = round(float(totals[name][g]), 3)
+        out.append(row)
+    return out
+
+def query_args(dataset, args):
+    # group_by=material,month plus from/to on created_at and equality filters on any dimension column.
+    kinds = {name: kind for name, kind, _ in DATASETS[dataset][1] if kind in ('str', 'int') and name != 'id'}
+    group_by = [g for g in args.get('group_by', '').split(',') if g]
+    bad = [g for g in group_by if g not in kinds and g not in BUCKETS]
+    if bad or len(set(group_by)) != len(group_by): raise QueryError(f'group_by must be distinct names from {", ".join([*kinds, *BUCKETS])}')
+    filters = {name: args[name] for name in kinds if args.get(name)}
+    try:
+        for name, value in filters.items():
+            if kinds[name] == 'int': int(value)
+        start, end = args.get('from'), args.get('to')
+        for v in (start, end):
+            if v: np.datetime64(v, 's')
+    except ValueError: raise QueryError('Filters on ids must be integers and from/to ISO timestamps')
+    return group_by, filters, start, end
+
+class Exporter:
+    # Re-exports every dataset from a background thread every `interval` seconds.
+    def __init__(self, interval=EXPORT_INTERVAL):
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+        self.runs = self.failures = 0
+        self.last = {}
+
+    def run(self):
+        with self._lock:
+            self.last = {dataset: export(dataset) for dataset in DATASETS}
+            self.runs += 1
+            return self.last
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None: return
+        self._thread = threading.Thread(target=self._loop, name='analytics-exporter', daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            try: self.run()
+            except Exception:
+                self.failures += 1
+                log.exception('Analytics export failed; retrying next interval')
+            time.sleep(self.interval)
+
+    def metrics(self): return {'runs': self.runs, 'failures': self.failures, 'last': self.last, 'intervalSeconds': self.interval}
+
+exporter = Exporter()
+
+if __name__ == '__main__':
+    cmd = sys.argv[1] if len(sys.argv) > 1 else 'export'
+    if cmd == 'export':
+        for dataset, meta in exporter.run().items(): print(f'{dataset}: {meta["rows"]} row(s) at version {meta["version"]} as {meta["format"]} in {meta["exportMs"]} ms')
+    elif cmd == 'query' and len(sys.argv) >= 3 and sys.argv[2] in DATASETS:
+        frame = store.get(sys.argv[2])
+        if frame is None: sys.exit(f'No export for {sys.argv[2]}; run python analytics.py export')
+        for row in aggregate(frame, [g for g in (sys.argv[3] if len(sys.argv) > 3 else '').split(',') if g]): print(row)
+    else: sys.exit(f'Usage: python analytics.py [export | query {{{",".join(DATASETS)}}} [group,by,...]]')
@@ -3,34 +3,54 @@ from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
-from models import db, User, WasteBin, Collection, RecyclingRecord
+import os
+from models import db, User, WasteBin, Collection, RecyclingRecord, create_indexes
+from pagination import NEXT_CURSOR_HEADER
+from changes import VERSION_HEADER
+from security import Overloaded, jwt_cache
+import responses
+import metrics
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'takatrack-secret-key'
 app.config['JWT_SECRET_KEY'] = 'jwt-secret-key'
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=7)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///takatrack.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///takatrack.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db.init_app(app)
 jwt = JWTManager(app)
-CORS(app)
+CORS(app, expose_headers=[NEXT_CURSOR_HEADER, VERSION_HEADER])
+metrics.install(app)
+metrics.instrument_sqlalchemy()
+metrics.registry.gauge('cache_entries', 'Entries held by in-process caches.', lambda: {'responses': len(responses.body_cache), 'tokens': len(jwt_cache)})
+responses.install(app)
 
-from routes.auth import auth_bp
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    return jsonify({'message': 'Authentication is busy, retry shortly'}), 503, {'Retry-After': '1'}
+
+from routes.auth import auth_bp, jwt_identity
 from routes.dashboard import dashboard_bp
 from routes.waste import waste_bp
 from routes.recycling import recycling_bp
 from routes.notifications import notifications_bp
+from routes.changes import changes_bp
+from routes.events import events_blueprint
+from serializers import query as select_rows, serialize
 
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(dashboard_bp, url_prefix='/api/dashboard')
 app.register_blueprint(waste_bp, url_prefix='/api/waste')
 app.register_blueprint(recycling_bp, url_prefix='/api/recycling')
 app.register_blueprint(notifications_bp, url_prefix='/api/notifications')
+app.register_blueprint(changes_bp, url_prefix='/api/changes')
+app.register_blueprint(events_blueprint(jwt_identity), url_prefix='/api/events')
 
 def init_db():
     with app.app_context():
         db.create_all()
+        create_indexes()
         if User.query.count() == 0:
             users = [
                 User(email='demo@takatrack.com', name='Demo User', phone='1234567890', role='driver', password_hash=generate_password_hash('demo123')),
@@ -63,8 +83,8 @@ def health():
 
 @app.route('/api/drivers')
 def get_drivers():
-    drivers = User.query.filter_by(role='driver').all()
-    return jsonify([{**user.to_dict(), 'activeCollections': 0, 'totalCollected': 0, 'status': 'available'} for user in drivers])
+    drivers = select_rows('drivers').filter(User.role == 'driver')
+    return jsonify([{**user, 'activeCollections': 0, 'totalCollected': 0, 'status': 'available'} for user in serialize('drivers', drivers)])
 
 if __name__ == '__main__':
     init_db()
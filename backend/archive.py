@@ -0,0 +1,166 @@
+import heapq
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import request
+from database import db_exec, transaction
+from pagination import keyset_sql, keyset_stream
+import changes
+
+COLLECTIONS_AFTER_DAYS = float(os.environ.get('ARCHIVE_COLLECTIONS_DAYS', 30))
+RECYCLING_AFTER_DAYS = float(os.environ.get('ARCHIVE_RECYCLING_DAYS', 180))
+BATCH = int(os.environ.get('ARCHIVE_BATCH', 5000))
+INTERVAL = float(os.environ.get('ARCHIVE_INTERVAL', 3600))  # seconds between runs; 0 archives only on demand
+
+log = logging.getLogger(__name__)
+
+# entity -> (hot table, extra condition for rows allowed to leave it, days a row stays hot)
+POLICIES = {
+    'collections': ('collections', 'status = "completed"', COLLECTIONS_AFTER_DAYS),
+    'recycling': ('recycling_records', None, RECYCLING_AFTER_DAYS),
+}
+
+# Per-month contributions of an archived batch to the rollups scopes (see REBUILD in rollups.py).
+TOTALS = {
+    'collections': [
+        'SELECT month, "collection_status", status, COUNT(*), 0, 0 FROM temp.archive_batch WHERE status IS NOT NULL GROUP BY month, status',
+        'SELECT month, "driver", CAST(user_id AS TEXT), COUNT(*), COALESCE(SUM(CASE WHEN status = "completed" THEN weight ELSE 0 END), 0), 0 FROM temp.archive_batch WHERE user_id IS NOT NULL GROUP BY month, user_id',
+    ],
+    'recycling': [
+        'SELECT month, "recycling", "*", COUNT(*), COALESCE(SUM(weight), 0), COALESCE(SUM(environmental_impact), 0) FROM temp.archive_batch GROUP BY month',
+        'SELECT month, "recycling_user", CAST(user_id AS TEXT), COUNT(*), SUM(weight), SUM(environmental_impact) FROM temp.archive_batch WHERE user_id IS NOT NULL GROUP BY month, user_id',
+        'SELECT month, "recycling_material", material_type, COUNT(*), SUM(weight), SUM(environmental_impact) FROM temp.archive_batch GROUP BY month, material_type',
+    ],
+}
+
+TOTALS_UPSERT = 'INSERT INTO archive_totals (month, scope, key, count, weight, impact) {} ON CONFLICT (month, scope, key) DO UPDATE SET count = count + excluded.count, weight = weight + excluded.weight, impact = impact + excluded.impact'
+PARTITION_UPSERT = 'INSERT INTO archive_partitions (entity, month, table_name, rows) VALUES (?, ?, ?, ?) ON CONFLICT (entity, month) DO UPDATE SET rows = rows + excluded.rows, updated_at = CURRENT_TIMESTAMP'
+
+def candidates_sql(entity):
+    # Oldest eligible rows first, an index range scan on (status,) created_at.
+    table, where, _ = POLICIES[entity]
+    return f'SELECT * FROM {table} WHERE {where + " AND " if where else ""}created_at < ? ORDER BY created_at, id LIMIT ?'
+
+def partition_name(entity, month): return f'archive_{POLICIES[entity][0]}_{month.replace("-", "_")}'
+
+def _ensure_partition(entity, month):
+    # Same columns as the hot table (including ones added by migrations), without AUTOINCREMENT.
+    name, hot = partition_name(entity, month), POLICIES[entity][0]
+    ddl = db_exec('SELECT sql FROM sqlite_master WHERE type = "table" AND name = ?', [hot], 1)[0]
+    db_exec(re.sub(r'^CREATE TABLE\s+(IF NOT EXISTS\s+)?\S+', f'CREATE TABLE IF NOT EXISTS {name}', ddl, count=1).replace(' AUTOINCREMENT', ''))
+    db_exec(f'CREATE INDEX IF NOT EXISTS ix_{name}_created ON {name} (created_at, id)')
+    return name
+
+def _move(entity, cutoff, batch):
+    # One transaction: copy a batch into its month partitions, fold it into archive_totals,
+    # then delete it from the hot table. Rollups are unchanged; they already count these rows.
+    hot = POLICIES[entity][0]
+    columns = ', '.join(r[1] for r in db_exec(f'PRAGMA table_info({hot})', f=2))
+    db_exec('DROP TABLE IF EXISTS temp.archive_batch')
+    db_exec(f'CREATE TEMP TABLE archive_batch AS SELECT *, COALESCE(substr(created_at, 1, 7), "0000-00") AS month FROM ({candidates_sql(entity)})', [cutoff, batch])
+    months = db_exec('SELECT month, COUNT(*) FROM temp.archive_batch GROUP BY month', f=2)
+    for month, n in months:
+        name = _ensure_partition(entity, month)
+        db_exec(f'INSERT INTO {name} ({columns}) SELECT {columns} FROM temp.archive_batch WHERE month = ?', [month])
+        db_exec(PARTITION_UPSERT, [entity, month, name, n])
+    for q in TOTALS[entity]: db_exec(TOTALS_UPSERT.format(q))
+    ids = [r[0] for r in db_exec('SELECT id FROM temp.archive_batch', f=2)]
+    db_exec(f'DELETE FROM {hot} WHERE id IN (SELECT id FROM temp.archive_batch)')
+    # Archived rows leave the default listings, so the feed (and every cached page) sees them as deleted.
+    changes.record(entity, ids, 'delete')
+    db_exec('DROP TABLE temp.archive_batch')
+    return len(ids)
+
+def archive(entity, now=None, batch=BATCH):
+    # Moves every eligible row, BATCH rows per transaction so writers never wait long.
+    days = POLICIES[entity][2]
+    cutoff = ((now or datetime.utcnow()) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    moved = 0
+    while True:
+        with transaction(): n = _move(entity, cutoff, batch)
+        moved += n
+        if n < batch: return moved
+
+def partitions(entity=None):
+    if entity: return db_exec('SELECT entity, month, table_name, rows FROM archive_partitions WHERE entity = ? ORDER BY month DESC', [entity], 2)
+    return db_exec('SELECT entity, month, table_name, rows FROM archive_partitions ORDER BY entity, month DESC', f=2)
+
+def totals(scope, key='*'):
+    return db_exec('SELECT month, count, weight, impact FROM archive_totals WHERE scope = ? AND key = ? ORDER BY month', [scope, str(key)], 2)
+
+def requested(): return request.args.get('include_archived', '').lower() in ('1', 'true', 'yes')
+
+def _month_end(month):
+    y, m = map(int, month.split('-'))
+    return f'{y + m // 12:04d}-{m % 12 + 1:02d}'
+
+def history(entity, select, where, params, cursor, limit, key, alias=''):
+    # Keyset rows over the hot table plus every month partition, newest first. key(row) -> (created_at, id).
+    # Pages read partitions newest month first and stop once no older month can reach the page.
+    hot = POLICIES[entity][0]
+    sources = [(None, select)] + [(month, re.sub(rf'\bFROM {hot}\b', f'FROM {table}', select, count=1)) for _, month, table, _ in partitions(entity)]
+    if cursor: sources = [s for s in sources if s[0] is None or s[0] <= cursor[0][:7]]
+    if limit is None: return _merged(sources, where, params, cursor, key, alias)
+    rows = []
+    for month, q in sources:
+        if month is not None and len(rows) > limit and str(key(rows[limit])[0]) >= _month_end(month): break
+        rows += db_exec(*keyset_sql(q, where, params, cursor, limit, alias), 2)
+        rows.sort(key=key, reverse=True)
+        del rows[limit + 1:]
+    return rows
+
+def _merged(sources, where, params, cursor, key, alias):
+    # Every source streams in keyset batches, so a slow reader never holds a pooled connection.
+    return heapq.merge(*(keyset_stream(q, where, params, cursor, None, key, alias) for _, q in sources), key=key, reverse=True)
+
+class Archiver:
+    # Runs archive() for every entity, then trims the change log to changes.KEEP entries, from a
+    # background thread every `interval` seconds.
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+        self.runs = self.failures = 0
+        self.moved = dict.fromkeys(POLICIES, 0)
+        self.pruned = 0
+        self.last_run_ms = 0.0
+
+    def run(self):
+        with self._lock:
+            start = time.perf_counter()
+            moved = {entity: archive(entity) for entity in POLICIES}
+            for entity, n in moved.items(): self.moved[entity] += n
+            self.pruned += changes.prune(changes.KEEP)
+            self.runs += 1
+            self.last_run_ms = (time.perf_counter() - start) * 1000
+            return moved
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None: return
+        self._thread = threading.Thread(target=self._loop, name='archiver', daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try: self.run()
+            except Exception:
+                self.failures += 1
+                log.exception('Archive run failed; retrying next interval')
+
+    def metrics(self): return {'runs': self.runs, 'failures': self.failures, 'moved': dict(self.moved), 'prunedChanges': self.pruned, 'lastRunMs': round(self.last_run_ms, 2), 'intervalSeconds': self.interval}
+
+archiver = Archiver()
+
+if __name__ == '__main__':
+    cmd = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    if cmd == 'run':
+        for entity, n in archiver.run().items(): print(f'{entity}: archived {n} row(s)')
+    elif cmd == 'status':
+        for entity, month, table, rows in partitions(): print(f'{entity} {month}: {rows} row(s) in {table}')
+        for entity, (table, _, days) in POLICIES.items(): print(f'{entity}: {db_exec(f"SELECT COUNT(*) FROM {table}", f=1)[0]} hot row(s), archived after {days:g} days')
+    else: sys.exit('Usage: python archive.py [run | status]')
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# Seeds synthetic datasets and load-tests every API route of server.py and app.py except the
+# long-lived /api/events stream.
+#
+#   python benchmark.py --sizes 1000,100000,1000000 --output bench.json
+#   python benchmark.py --compare bench-main.json --output bench-branch.json
+#
+# Each (target, size) pair runs in its own subprocess against its own database file, so
+# module-level state (connection pools, caches, SQLAlchemy engines) never leaks between runs.
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import seed
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TARGETS = ('server', 'app')
+DEFAULT_SIZES = '1000,100000,1000000'
+BENCH_END = '2025-01-01 00:00:00'  # newest synthetic created_at, fixed so runs are comparable
+MATERIALS = list(seed.MATERIAL_P)
+
+def bulk_load(conn, target, n, rng_seed=42):
+    # The same n rows for users, bins, collections and recycling records, in one transaction.
+    from werkzeug.security import generate_password_hash
+    conn.execute('BEGIN')
+    seed.load(seed.synthetic(n, n, n, n, end=BENCH_END, seed=rng_seed, password_hash=generate_password_hash('demo123')), seed.TABLES[target], conn.executemany)
+    conn.commit()
+
+def prepare_database(target, n, data_dir):
+    path = os.path.join(data_dir, f'{target}-{n}.db')
+    if os.path.exists(path): return path
+    tmp = path + '.tmp'
+    for p in (tmp, tmp + '-wal', tmp + '-shm'):
+        if os.path.exists(p): os.remove(p)
+    env = {**os.environ, **target_env(target, tmp)}
+    if target == 'server':
+        # seed.py creates the schema through init_schema(), then bulk loads with indexes deferred and rebuilds rollups.
+        subprocess.run([sys.executable, 'seed.py', 'synthetic', '--end', BENCH_END, *(f'--{entity}={n}' for entity in seed.TABLES[target])], env=env, cwd=HERE, check=True, stdout=subprocess.DEVNULL)
+        conn = sqlite3.connect(tmp, isolation_level=None)
+    else:
+        # Create the schema through the target itself so the benchmark follows its DDL.
+        subprocess.run([sys.executable, __file__, '--create-schema', target], env=env, cwd=HERE, check=True)
+        conn = sqlite3.connect(tmp, isolation_level=None)
+        conn.execute('PRAGMA journal_mode = WAL')
+        # Drop the target's own seed rows and restart ids at 1 so generated foreign keys line up.
+        for t in seed.TABLES[target].values(): conn.execute(f'DELETE FROM {t}')
+        if conn.execute('SELECT 1 FROM sqlite_master WHERE name = "sqlite_sequence"').fetchone(): conn.execute('DELETE FROM sqlite_sequence')
+        bulk_load(conn, target, n)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    shutil.move(tmp, path)
+    return path
+
+def target_env(target, path):
+    return {'DATABASE_PATH': path, 'ANALYTICS_DIR': path + '.analytics', 'WRITE_BEHIND_INTERVAL': '0.2', 'ARCHIVE_INTERVAL': '0', 'ANALYTICS_EXPORT_INTERVAL': '0'} if target == 'server' else {'DATABASE_URL': f'sqlite:///{os.path.abspath(path)}'}
+
+def create_schema(target):
+    if target == 'server':
+        import server
+        server.init_schema()
+    else:
+        import app
+        with app.app.app_context(): app.db.create_all(); app.create_indexes()
+
+def endpoints(n, rng):
+    # (name, method, path factory, body factory[, targets[, share]]); factories are called per request.
+    # targets limits a route to the apps that serve it; share scales --requests for expensive routes.
+    rid = lambda: rng.randint(1, n)
+    email = lambda: f'bench{time.time_ns()}{rng.random()}@takatrack.com'
+    return [
+        ('health', 'GET', lambda: '/api/health', None),
+        ('metrics', 'GET', lambda: '/api/metrics', None),
+        ('auth.register', 'POST', lambda: '/api/auth/register', lambda: {'email': email(), 'password': 'pw', 'name': 'Bench'}),
+        ('auth.login', 'POST', lambda: '/api/auth/login', lambda: {'email': 'demo@takatrack.com', 'password': 'demo123'}),
+        ('auth.me', 'GET', lambda: '/api/auth/me', None, ('app',)),
+        ('dashboard.stats', 'GET', lambda: '/api/dashboard/stats', None),
+        ('notifications', 'GET', lambda: '/api/notifications', None),
+        ('drivers', 'GET', lambda: '/api/drivers', None),
+        ('bins.all', 'GET', lambda: '/api/waste/bins', None),
+        ('bins.bbox', 'GET', lambda: '/api/waste/bins?bbox=36.80,-1.30,36.84,-1.27', None),
+        ('bins.radius', 'GET', lambda: '/api/waste/bins?lat=-1.2921&lng=36.8219&radius=1000', None),
+        ('bins.nearest', 'GET', lambda: '/api/waste/bins?lat=-1.2921&lng=36.8219&k=10', None),
+        ('bins.telemetry', 'POST', lambda: '/api/waste/bins/telemetry', lambda: [{'bin_id': rid(), 'fill_level': rng.randint(0, 100)} for _ in range(50)], ('server',)),
+        ('bins.telemetry.queue', 'GET', lambda: '/api/waste/bins/telemetry/queue', None, ('server',)),
+        ('collections.list', 'GET', lambda: '/api/waste/collections', None),
+        ('collections.stream', 'GET', lambda: '/api/waste/collections?format=ndjson&limit=1000', None),
+        ('collections.filtered', 'GET', lambda: '/api/waste/collections?status=pending&limit=50', None),
+        ('collections.create', 'POST', lambda: '/api/waste/collections', lambda: {'location': 'Bench Site', 'wasteType': 'general'}),
+        ('collections.update', 'PUT', lambda: f'/api/waste/collections/{rid()}', lambda: {'status': rng.choice(['pending', 'in_progress', 'completed'])}),
+        ('recycling.list', 'GET', lambda: '/api/recycling/records', None),
+        ('recycling.stream', 'GET', lambda: '/api/recycling/records?format=ndjson&limit=1000', None),
+        ('recycling.create', 'POST', lambda: '/api/recycling/records', lambda: {'material': rng.choice(MATERIALS), 'weight': rng.uniform(1, 10)}),
+        ('recycling.bulk', 'POST', lambda: '/api/recycling/records/bulk', lambda: [{'material': rng.choice(MATERIALS), 'weight': rng.uniform(1, 10)} for _ in range(100)], ('server',)),
+        ('recycling.stats', 'GET', lambda: '/api/recycling/stats', None),
+        ('changes', 'GET', lambda: '/api/changes?since=0&entities=bins', None),
+        ('routes.plan', 'GET', lambda: '/api/routes/plan?capacity=2000', None, ('server',)),
+        ('archive', 'GET', lambda: '/api/archive', None, ('server',)),
+        ('analytics.recycling', 'GET', lambda: '/api/analytics/recycling?group_by=material,month', None, ('server',)),
+        ('analytics.collections', 'GET', lambda: f'/api/analytics/collections?group_by=status,priority&user_id={rid()}', None, ('server',)),
+        # Re-reads every row of both datasets; a few runs are enough for its latency.
+        ('analytics.export', 'POST', lambda: '/api/analytics/export', None, ('server',), 0.05),
+    ]
+
+def request(base, method, path, body, headers):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(base + path, data=data, method=method, headers={**headers, **({'Content-Type': 'application/json'} if data else {})})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=120) as r:
+            r.read()
+            ok = r.status < 400
+    except urllib.error.HTTPError as e:
+        e.read()
+        ok = False
+    except OSError:
+        ok = False
+    return (time.perf_counter() - start) * 1000, ok
+
+def percentile(sorted_ms, p):
+    if not sorted_ms: return None
+    k = (len(sorted_ms) - 1) * p / 100
+    lo = int(k)
+    return sorted_ms[lo] + (sorted_ms[min(lo + 1, len(sorted_ms) - 1)] - sorted_ms[lo]) * (k - lo)
+
+def drive(target, base, n, requests, concurrency, warmup, only, headers):
+    rng = random.Random(7)
+    results = []
+    for name, method, path, body, *opts in endpoints(n, rng):
+        targets, share = opts[0] if opts else None, opts[1] if len(opts) > 1 else 1
+        if only and name not in only or targets and target not in targets: continue
+        for _ in range(warmup if share == 1 else 0): request(base, method, path(), body() if body else None, headers)
+        calls = [(path(), body() if body else None) for _ in range(max(1, round(requests * share)))]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            samples = list(pool.map(lambda c: request(base, method, c[0], c[1], headers), calls))
+        wall = time.perf_counter() - start
+        ms = sorted(s[0] for s in samples)
+        results.append({'endpoint': name, 'method': method, 'requests': len(samples), 'errors': sum(not s[1] for s in samples), 'throughput_rps': round(len(samples) / wall, 1), 'mean_ms': round(statistics.fmean(ms), 2), 'p50_ms': round(percentile(ms, 50), 2), 'p95_ms': round(percentile(ms, 95), 2), 'p99_ms': round(percentile(ms, 99), 2)})
+        print(f"  {name:<22} {results[-1]['throughput_rps']:>9} rps  p50 {results[-1]['p50_ms']:>9} ms  p95 {results[-1]['p95_ms']:>9} ms  p99 {results[-1]['p99_ms']:>9} ms  errors {results[-1]['errors']}", file=sys.stderr)
+    return results
+
+def run_worker(target, n, requests, concurrency, warmup, only):
+    # Runs inside the subprocess: serve the target on a free port and drive it.
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    headers = {}
+    if target == 'server':
+        import server, analytics
+        wsgi = server.app
+        headers['Authorization'] = 'Bearer ' + server.tokens.issue({'id': 1, 'role': 'driver'})
+        analytics.exporter.run()  # the analytics reports read the latest export
+    else:
+        import app
+        from flask_jwt_extended import create_access_token
+        wsgi = app.app
+        with wsgi.app_context(): headers['Authorization'] = 'Bearer ' + create_access_token(identity='1')
+    httpd = make_server('127.0.0.1', 0, wsgi, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try: return drive(target, f'http://127.0.0.1:{httpd.server_port}', n, requests, concurrency, warmup, only, headers)
+    finally: httpd.shutdown()
+
+def git_commit():
+    try: return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=HERE, capture_output=True, text=True).stdout.strip() or None
+    except OSError: return None
+
+def compare(baseline, current, threshold):
+    # Flags endpoints whose p95 grew by more than threshold (fraction) against the baseline run.
+    old = {(r['target'], r['size'], r['endpoint']): r for r in baseline['results']}
+    regressions = []
+    for r in current['results']:
+        b = old.get((r['target'], r['size'], r['endpoint']))
+        if not b or not b['p95_ms']: continue
+        change = (r['p95_ms'] - b['p95_ms']) / b['p95_ms']
+        marker = 'REGRESSION' if change > threshold else ''
+        print(f"{r['target']:<7}{r['size']:>9}  {r['endpoint']:<22} p95 {b['p95_ms']:>9} -> {r['p95_ms']:>9} ms ({change:+.0%}) {marker}")
+        if marker: regressions.append(r)
+    return regressions
+
+def main():
+    p = argparse.ArgumentParser(description='Seed synthetic data and benchmark every TakaTrack endpoint.')
+    p.add_argument('--targets', default=','.join(TARGETS), help='server (server.py) and/or app (app.py blueprints)')
+    p.add_argument('--sizes', default=DEFAULT_SIZES, help='rows per table, comma separated')
+    p.add_argument('--requests', type=int, default=200, help='requests per endpoint')
+    p.add_argument('--concurrency', type=int, default=8)
+    p.add_argument('--warmup', type=int, default=5)
+    p.add_argument('--endpoints', default='', help='comma separated endpoint names to run (default: all)')
+    p.add_argument('--data-dir', default=os.path.join(HERE, 'bench_data'))
+    p.add_argument('--output', help='write JSON results here')
+    p.add_argument('--compare', help='baseline JSON to compare p95 latencies against')
+    p.add_argument('--threshold', type=float, default=0.10, help='p95 growth that counts as a regression')
+    p.add_argument('--create-schema', help=argparse.SUPPRESS)
+    p.add_argument('--worker', help=argparse.SUPPRESS)
+    a = p.parse_args()
+
+    if a.create_schema: return create_schema(a.create_schema)
+    only = set(filter(None, a.endpoints.split(',')))
+    if a.worker:
+        target, n = a.worker.split(':')
+        json.dump(run_worker(target, int(n), a.requests, a.concurrency, a.warmup, only), sys.stdout)
+        return
+
+    os.makedirs(a.data_dir, exist_ok=True)
+    report = {'meta': {'commit': git_commit(), 'timestamp': datetime.utcnow().isoformat(), 'python': platform.python_version(), 'platform': platform.platform(), 'requests': a.requests, 'concurrency': a.concurrency}, 'results': []}
+    for target in a.targets.split(','):
+        for n in (int(float(s)) for s in a.sizes.split(',')):
+            print(f'[{target} @ {n} rows] seeding...', file=sys.stderr)
+            start = time.perf_counter()
+            path = prepare_database(target, n, a.data_dir)
+            # Benchmarks write; run against a scratch copy so the seeded file stays reusable.
+            run_path = path + '.run'
+            shutil.copyfile(path, run_path)
+            print(f'[{target} @ {n} rows] ready in {time.perf_counter() - start:.1f}s, driving endpoints', file=sys.stderr)
+            out = subprocess.run([sys.executable, __file__, '--worker', f'{target}:{n}', '--requests', str(a.requests), '--concurrency', str(a.concurrency), '--warmup', str(a.warmup), '--endpoints', a.endpoints], env={**os.environ, **target_env(target, run_path)}, cwd=HERE, stdout=subprocess.PIPE, check=True).stdout
+            report['results'] += [{'target': target, 'size': n, **r} for r in json.loads(out)]
+            for p_ in (run_path, run_path + '-wal', run_path + '-shm'):
+                if os.path.exists(p_): os.remove(p_)
+            shutil.rmtree(run_path + '.analytics', ignore_errors=True)
+
+    if a.output:
+        with open(a.output, 'w') as f: json.dump(report, f, indent=2)
+    else: json.dump(report, sys.stdout, indent=2)
+    if a.compare:
+        with open(a.compare) as f: regressions = compare(json.load(f), report, a.threshold)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import functools
+import os
+import sys
+import zlib
+from types import SimpleNamespace
+from flask import Response, g, make_response, request
+from database import db_exec, db_executemany, transaction
+import responses
+
+ENTITIES = ('bins', 'collections', 'recycling')
+FEED_LIMIT = 1000
+VERSION_HEADER = 'X-Change-Version'
+KEEP = int(os.environ.get('CHANGE_LOG_KEEP', 100000))  # entries left by the periodic prune
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS change_log (version INTEGER PRIMARY KEY AUTOINCREMENT, entity TEXT NOT NULL, entity_id INTEGER NOT NULL, op TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+    'CREATE INDEX IF NOT EXISTS ix_change_log_entity_version ON change_log (entity, version)',
+    # Highest version pruned from the log; entities with no newer entry report it as their version.
+    'CREATE TABLE IF NOT EXISTS change_log_horizon (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)',
+]
+
+def record(entity, ids, op='upsert'):
+    # Call inside the writer's transaction so the log entry commits (or rolls back) with the row.
+    db_executemany('INSERT INTO change_log (entity, entity_id, op) VALUES (?, ?, ?)', [(entity, i, op) for i in ids])
+
+def current_version(entities=ENTITIES):
+    # Max on (entity, version) is an index seek per entity, so this stays O(log n). The prune horizon
+    # keeps it from going back when an entity's last entries are pruned.
+    r = db_exec('SELECT MAX(v) FROM (' + ' UNION ALL '.join('SELECT MAX(version) v FROM change_log WHERE entity = ?' for _ in entities) + ' UNION ALL SELECT version FROM change_log_horizon)', list(entities), 1)
+    return r[0] or 0
+
+def oldest_version():
+    # First version still in the log; a feed cursor below oldest_version() - 1 missed pruned entries.
+    r = db_exec('SELECT COALESCE((SELECT version + 1 FROM change_log_horizon), (SELECT MIN(version) FROM change_log), 0)', f=1)
+    return r[0]
+
+def changes_since(since, entities=ENTITIES, limit=FEED_LIMIT):
+    # Latest op per (entity, id) after `since`, oldest first, plus the version to resume from.
+    rows = db_exec(f'SELECT version, entity, entity_id, op FROM change_log WHERE version > ? AND entity IN ({",".join("?" * len(entities))}) ORDER BY version LIMIT ?', [since, *entities, limit + 1], 2)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    latest = {}
+    for version, entity, entity_id, op in rows: latest[(entity, entity_id)] = op
+    return latest, (rows[-1][0] if rows else since), more
+
+def feed(since, entities, fetchers, log=None, limit=FEED_LIMIT):
+    # fetchers: entity -> fn(ids) returning current dicts with an 'id' key.
+    # log provides current_version/oldest_version/changes_since; defaults to server.py's SQLite change_log.
+    log = log or sqlite_log
+    current = log.current_version(entities)
+    if since > current or since < log.oldest_version() - 1:
+        return {'version': current, 'reset': True}
+    latest, version, more = log.changes_since(since, entities, limit)
+    out = {'version': version if more else max(version, current), 'hasMore': more, 'changes': {}, 'deleted': {}}
+    for entity in entities:
+        ids = [i for (e, i), op in latest.items() if e == entity and op != 'delete']
+        out['changes'][entity] = fetchers[entity](ids) if ids else []
+        out['deleted'][entity] = [i for (e, i), op in latest.items() if e == entity and op == 'delete']
+    return out
+
+sqlite_log = SimpleNamespace(current_version=current_version, oldest_version=oldest_version, changes_since=changes_since)
+
+def feed_args():
+    try: since = int(request.args.get('since', 0))
+    except ValueError: raise ValueError('since must be a version number')
+    entities = tuple(e for e in request.args.get('entities', ','.join(ENTITIES)).split(',') if e)
+    if not entities or any(e not in ENTITIES for e in entities): raise ValueError(f'entities must be drawn from {", ".join(ENTITIES)}')
+    return since, entities
+
+def make_etag(version, encoding=None):
+    return f'{version}-{zlib.crc32(request.full_path.encode()):08x}' + (f'-{encoding}' if encoding else '')
+
+def conditional(version_fn, generation_fn=None):
+    # ETag = data version + query (+ content encoding); a matching If-None-Match returns 304 without
+    # running the view, and other repeats of the same query and version are served from cached bytes.
+    # generation_fn covers state the view reads outside the database (None when there is none). The view
+    # finds the version in g.change_version instead of reading it again.
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET': return f(*args, **kwargs)
+            version = g.change_version = version_fn()
+            generation = generation_fn() if generation_fn else None
+            encoding = responses.negotiated_encoding()
+            tag = make_etag(version if generation is None else f'{version}.{generation}', encoding)
+            if tag in request.if_none_match:
+                r = Response(status=304)
+            else:
+                key = (request.full_path, version, generation, encoding, request.headers.get('Accept', ''))
+                r = responses.cached(key, lambda: make_response(f(*args, **kwargs)))
+                if r.status_code != 200: return r
+            r.set_etag(tag)
+            r.headers['Cache-Control'] = 'no-cache'
+            r.headers[VERSION_HEADER] = str(version)
+            return r
+        return wrapper
+    return decorator
+
+def versioned(*entities, generation=None): return conditional(lambda: current_version(entities), generation)
+
+def prune(keep=KEEP):
+    # Drop all but the newest `keep` entries; clients older than that get a reset. Run by archive.py's
+    # background thread after each archive pass.
+    with transaction():
+        latest = db_exec('SELECT MAX(version) FROM change_log', f=1)[0]
+        if latest is None or latest <= keep: return 0
+        pruned = db_exec('DELETE FROM change_log WHERE version <= ?', [latest - keep])
+        db_exec('INSERT INTO change_log_horizon (id, version) VALUES (1, ?) ON CONFLICT (id) DO UPDATE SET version = MAX(version, excluded.version)', [latest - keep])
+        return pruned
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == 'prune': print(f'Pruned {prune(int(sys.argv[2]))} change(s)')
+    else: sys.exit('Usage: python changes.py prune <entries-to-keep>')
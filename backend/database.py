@@ -0,0 +1,167 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DATABASE_PATH = os.environ.get('DATABASE_PATH', 'takatrack.db')
+POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 8))
+POOL_TIMEOUT = float(os.environ.get('DATABASE_POOL_TIMEOUT', 5))  # seconds to wait for a free connection
+
+PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA mmap_size = 134217728',
+]
+
+class PoolExhausted(RuntimeError):
+    pass
+
+class ConnectionPool:
+    # Long-lived connections in autocommit mode; transactions are opened explicitly with transaction().
+    def __init__(self, path=DATABASE_PATH, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path, self.size, self.timeout = path, size, timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        c = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, cached_statements=256)
+        for p in PRAGMAS: c.execute(p)
+        return c
+
+    def _acquire(self):
+        try: return self._idle.get_nowait()
+        except queue.Empty: pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try: return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try: return self._idle.get(timeout=self.timeout)
+        except queue.Empty: raise PoolExhausted(f'No database connection free after {self.timeout:g}s')
+
+    def _release(self, c):
+        if c.in_transaction: c.rollback()
+        self._idle.put(c)
+
+    @contextmanager
+    def connection(self):
+        # Re-entrant per thread: nested callers share the connection (and transaction) already held.
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+        c = self._local.conn = self._acquire()
+        try: yield c
+        finally:
+            self._local.conn = None
+            self._release(c)
+
+    @contextmanager
+    def transaction(self, immediate=True):
+        with self.connection() as c:
+            depth = getattr(self._local, 'depth', 0)
+            if depth == 0:
+                self._local.on_commit = []
+                c.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+            self._local.depth = depth + 1
+            try:
+                yield c
+            except BaseException:
+                self._local.depth = depth
+                if depth == 0:
+                    c.rollback()
+                    self._local.on_commit = []
+                raise
+            self._local.depth = depth
+            if depth == 0:
+                c.commit()
+                callbacks, self._local.on_commit = self._local.on_commit, []
+                for fn in callbacks: fn()
+
+    def after_commit(self, fn):
+        # Run fn once the enclosing transaction commits; outside a transaction run it now.
+        if getattr(self._local, 'depth', 0): self._local.on_commit.append(fn)
+        else: fn()
+
+    def close_all(self):
+        while True:
+            try: self._idle.get_nowait().close()
+            except queue.Empty: break
+            with self._lock: self._created -= 1
+
+pool = ConnectionPool()
+
+def configure(path, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+    global pool
+    pool.close_all()
+    pool = ConnectionPool(path, size, timeout)
+    return pool
+
+def connection(): return pool.connection()
+
+def transaction(immediate=True): return pool.transaction(immediate)
+
+def after_commit(fn): pool.after_commit(fn)
+
+# observer(seconds, rows) is told about every statement run through the db_* helpers (see metrics.py).
+observer = None
+
+def set_observer(fn):
+    global observer
+    observer = fn
+
+def db_exec(q, p=None, f=None):
+    start = time.perf_counter()
+    with pool.connection() as c:
+        r = c.execute(q, p or [])
+        out = r.fetchone() if f == 1 else r.fetchall() if f == 2 else r.rowcount
+    if observer: observer(time.perf_counter() - start, len(out) if f == 2 else int(out is not None) if f == 1 else 0)
+    return out
+
+def ensure_column(table, column, decl):
+    # Adds a column that CREATE TABLE IF NOT EXISTS cannot add to databases created before it existed.
+    if column not in [r[1] for r in db_exec(f'PRAGMA table_info({table})', f=2)]: db_exec(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+def db_insert(q, p=None):
+    start = time.perf_counter()
+    with pool.connection() as c: out = c.execute(q, p or []).lastrowid
+    if observer: observer(time.perf_counter() - start, 0)
+    return out
+
+def db_executemany(q, rows):
+    start = time.perf_counter()
+    with pool.connection() as c: out = c.executemany(q, rows).rowcount
+    if observer: observer(time.perf_counter() - start, 0)
+    return out
+
+def inserted_ids(n):
+    # Ids of the last n rows inserted on this thread's connection, e.g. by one db_executemany. Under
+    # BEGIN IMMEDIATE nothing else can insert, so AUTOINCREMENT ids are consecutive.
+    last = db_exec('SELECT last_insert_rowid()', f=1)[0]
+    return range(last - n + 1, last + 1)
+
+def db_iter(q, p=None, batch=500):
+    # Yields rows lazily so a large result never materializes as one list. The connection (and any read
+    # transaction) is held until the iterator is exhausted, so request paths stream with pagination.keyset_stream.
+    # Only time spent in SQLite counts towards the observer, not the consumer's.
+    spent, count = 0.0, 0
+    with pool.connection() as c:
+        start = time.perf_counter()
+        r = c.execute(q, p or [])
+        while True:
+            rows = r.fetchmany(batch)
+            spent += time.perf_counter() - start
+            if not rows: break
+            count += len(rows)
+            yield from rows
+            start = time.perf_counter()
+    if observer: observer(spent, count)
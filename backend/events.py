@@ -0,0 +1,80 @@
+import itertools
+import os
+import threading
+from collections import deque
+from responses import dumps
+
+TOPICS = ('bins', 'collections', 'recycling')
+CLIENT_BUFFER = int(os.environ.get('EVENTS_CLIENT_BUFFER', 100))
+MAX_CLIENTS = int(os.environ.get('EVENTS_MAX_CLIENTS', 5000))
+HEARTBEAT_SECONDS = 15
+
+# Only threading primitives are used, so under gevent/eventlet monkey-patching each idle
+# subscriber is a parked greenlet instead of an OS thread.
+
+class Subscriber:
+    def __init__(self, topics, buffer=CLIENT_BUFFER):
+        self.topics = frozenset(topics)
+        self.dropped = 0
+        self._events = deque(maxlen=buffer)
+        self._cond = threading.Condition()
+
+    def push(self, event):
+        # A slow client loses its oldest events rather than growing without bound; it is told to resync.
+        with self._cond:
+            if len(self._events) == self._events.maxlen: self.dropped += 1
+            self._events.append(event)
+            self._cond.notify()
+
+    def drain(self, timeout):
+        with self._cond:
+            if not self._events: self._cond.wait(timeout)
+            events, dropped = list(self._events), self.dropped
+            self._events.clear()
+            self.dropped = 0
+        return events, dropped
+
+class Broker:
+    def __init__(self, max_clients=MAX_CLIENTS):
+        self.max_clients = max_clients
+        self._topics = {t: set() for t in TOPICS}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.clients = 0
+
+    def subscribe(self, topics):
+        with self._lock:
+            if self.clients >= self.max_clients: return None
+            sub = Subscriber(topics)
+            for t in sub.topics: self._topics[t].add(sub)
+            self.clients += 1
+            return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            if sub not in self._topics[next(iter(sub.topics))]: return
+            for t in sub.topics: self._topics[t].discard(sub)
+            self.clients -= 1
+
+    def publish(self, topic, event, data):
+        with self._lock: subs = list(self._topics[topic])
+        message = (next(self._ids), topic, event, data)
+        for s in subs: s.push(message)
+
+broker = Broker()
+
+def publish(topic, event, data): broker.publish(topic, event, data)
+
+def sse_format(event_id, event, data):
+    return f'id: {event_id}\nevent: {event}\ndata: {dumps(data)}\n\n'
+
+def stream(sub, heartbeat=HEARTBEAT_SECONDS):
+    try:
+        yield f'retry: 5000\n: subscribed to {",".join(sorted(sub.topics))}\n\n'
+        while True:
+            events, dropped = sub.drain(heartbeat)
+            if dropped: yield sse_format(0, 'resync', {'dropped': dropped})
+            for event_id, topic, event, data in events: yield sse_format(event_id, event, {'topic': topic, **data})
+            if not events and not dropped: yield ': keepalive\n\n'
+    finally:
+        broker.unsubscribe(sub)
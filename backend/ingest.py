@@ -0,0 +1,83 @@
+import json
+import math
+import numpy as np
+from flask import request
+
+IMPACT_FACTORS = {'plastic': 2.0, 'paper': 1.5, 'glass': 0.5, 'metal': 3.0, 'electronic': 4.0}
+BIN_STATUSES = ('empty', 'half', 'full')
+MAX_ROWS = 50000
+MAX_ID = 2 ** 63 - 1  # SQLite INTEGER
+CHUNK = 900
+
+class IngestError(ValueError):
+    pass
+
+def environmental_impacts(materials, weights):
+    # One factor lookup per distinct material, then a single vectorized multiply over the batch.
+    kinds, codes = np.unique(np.asarray(materials, dtype=str), return_inverse=True)
+    factors = np.array([IMPACT_FACTORS.get(m, 1.0) for m in kinds.tolist()])
+    return (np.asarray(weights, dtype=float) * factors[codes]).tolist()
+
+def _id(value, name):
+    # int() would turn true into 1 and truncate 1.5 to 1, silently pointing at another row.
+    if isinstance(value, bool) or isinstance(value, float) and not value.is_integer(): raise ValueError(f'{name} must be an integer')
+    try: value = int(value)
+    except (TypeError, ValueError, OverflowError): raise ValueError(f'{name} must be an integer')
+    if not 0 < value <= MAX_ID: raise ValueError(f'{name} must be a positive integer')
+    return value
+
+def _number(value, name):
+    if isinstance(value, bool): raise ValueError(f'{name} must be a number')
+    try: value = float(value)
+    except (TypeError, ValueError): raise ValueError(f'{name} must be a number')
+    # float() accepts "nan" and "inf", and json.loads NaN/Infinity; neither can be stored.
+    if not math.isfinite(value): raise ValueError(f'{name} must be a finite number')
+    return value
+
+def read_rows(max_rows=MAX_ROWS):
+    # Yields (index, object or None, error or None) from a JSON array body or an NDJSON stream.
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        rows = (line for line in request.stream if line.strip())
+        parse = json.loads
+    else:
+        body = request.get_json(silent=True)
+        if not isinstance(body, list): raise IngestError('Send a JSON array or application/x-ndjson')
+        rows, parse = body, None
+    for i, raw in enumerate(rows):
+        if i >= max_rows: raise IngestError(f'At most {max_rows} rows per request')
+        try: obj = parse(raw) if parse else raw
+        except ValueError: yield i, None, 'Invalid JSON'; continue
+        yield (i, obj, None) if isinstance(obj, dict) else (i, None, 'Row must be an object')
+
+def recycling_row(obj, default_user_id):
+    material = obj.get('material')
+    if not material or not isinstance(material, str): raise ValueError('Material is required')
+    weight = _number(obj.get('weight'), 'Weight')
+    if weight <= 0: raise ValueError('Weight must be positive')
+    location = obj.get('location')
+    if location is None: location = 'Recycling Center'
+    elif not isinstance(location, str): raise ValueError('location must be a string')
+    return _id(obj.get('user_id', default_user_id), 'user_id'), material.lower(), weight, location
+
+def bin_reading(obj):
+    # A reading carries a status directly or a fill level in percent.
+    if obj.get('bin_id') is None: raise ValueError('bin_id is required')
+    bin_id = _id(obj['bin_id'], 'bin_id')
+    status = obj.get('status')
+    if status is None and obj.get('fill_level') is not None:
+        level = _number(obj['fill_level'], 'fill_level')
+        status = 'empty' if level < 25 else 'half' if level < 75 else 'full'
+    if status not in BIN_STATUSES: raise ValueError(f'status must be one of {", ".join(BIN_STATUSES)}')
+    return bin_id, status
+
+def validate(parser, *args):
+    # Splits read_rows() into ([(index, parsed)], [{'index', 'error'}]) without building intermediate objects.
+    good, errors = [], []
+    for i, obj, err in read_rows():
+        if err: errors.append({'index': i, 'error': err}); continue
+        try: good.append((i, parser(obj, *args)))
+        except ValueError as e: errors.append({'index': i, 'error': str(e)})
+    return good, errors
+
+def chunks(seq, size=CHUNK):
+    for i in range(0, len(seq), size): yield seq[i:i + size]
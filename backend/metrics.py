@@ -0,0 +1,193 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from flask import Response, request
+
+ENABLED = os.environ.get('METRICS', '1') != '0'
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 0))  # 0 keeps the sampling profiler off
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL_MS', 5)) / 1000
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+PREFIX = 'takatrack'
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets, self.counts, self.sum, self.count = buckets, [0] * len(buckets), 0.0, 0
+
+    def observe(self, value):
+        for i, b in enumerate(self.buckets):
+            if value <= b: self.counts[i] += 1; break
+        self.sum += value
+        self.count += 1
+
+class RequestStats:
+    __slots__ = ('start', 'queries', 'sql_seconds', 'rows', 'bytes', 'status', 'skip')
+
+    def __init__(self):
+        self.start, self.queries, self.sql_seconds, self.rows, self.bytes, self.status, self.skip = time.perf_counter(), 0, 0.0, 0, 0, 500, False
+
+class Registry:
+    # Per-route aggregates, merged once per request under a single lock; hot paths only touch a thread-local.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self.counters = defaultdict(Counter)
+        self.background = Counter()
+        self.gauges = {}
+
+    def record(self, route, method, status, s, elapsed):
+        with self._lock:
+            self.latency[(route, method, status)].observe(elapsed)
+            self.queries[(route, method)].observe(s.queries)
+            c = self.counters[(route, method)]
+            c['sql_queries'] += s.queries
+            c['sql_seconds'] += s.sql_seconds
+            c['rows'] += s.rows
+            c['response_bytes'] += s.bytes
+
+    def gauge(self, name, help_text, fn):
+        # fn() -> number, or dict of label value -> number (rendered with a "name" label).
+        self.gauges[name] = (help_text, fn)
+
+    def render(self):
+        out = []
+        def family(name, kind, help_text):
+            out.append(f'# HELP {PREFIX}_{name} {help_text}')
+            out.append(f'# TYPE {PREFIX}_{name} {kind}')
+        def histogram(name, labels, h):
+            cumulative = 0
+            for b, n in zip(h.buckets, h.counts):
+                cumulative += n
+                out.append(f'{PREFIX}_{name}_bucket{{{labels},le="{b}"}} {cumulative}')
+            out.append(f'{PREFIX}_{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+            out.append(f'{PREFIX}_{name}_sum{{{labels}}} {h.sum:.6f}')
+            out.append(f'{PREFIX}_{name}_count{{{labels}}} {h.count}')
+        with self._lock:
+            family('request_duration_seconds', 'histogram', 'Request latency by route.')
+            for (route, method, status), h in sorted(self.latency.items()): histogram('request_duration_seconds', f'route="{route}",method="{method}",status="{status}"', h)
+            family('request_sql_queries', 'histogram', 'SQL statements issued per request.')
+            for (route, method), h in sorted(self.queries.items()): histogram('request_sql_queries', f'route="{route}",method="{method}"', h)
+            for key, kind, help_text in [('sql_queries', 'counter', 'SQL statements issued.'), ('sql_seconds', 'counter', 'Time spent executing SQL.'), ('rows', 'counter', 'Rows read from the database.'), ('response_bytes', 'counter', 'Response bytes sent.')]:
+                family(f'{key}_total', kind, help_text)
+                for (route, method), c in sorted(self.counters.items()): out.append(f'{PREFIX}_{key}_total{{route="{route}",method="{method}"}} {c[key]:g}')
+                if key in self.background: out.append(f'{PREFIX}_{key}_total{{route="background",method=""}} {self.background[key]:g}')
+        for name, (help_text, fn) in sorted(self.gauges.items()):
+            family(name, 'gauge', help_text)
+            value = fn()
+            if isinstance(value, dict): out.extend(f'{PREFIX}_{name}{{name="{k}"}} {v:g}' for k, v in sorted(value.items()))
+            else: out.append(f'{PREFIX}_{name} {value:g}')
+        return '\n'.join(out) + '\n'
+
+registry = Registry()
+_local = threading.local()
+
+def current(): return getattr(_local, 'stats', None)
+
+def observe_query(seconds, rows=0):
+    # Called by database.py and the SQLAlchemy engine hooks; outside a request it counts as background work.
+    s = getattr(_local, 'stats', None)
+    if s is None:
+        with registry._lock:
+            b = registry.background
+            b['sql_queries'] += 1; b['sql_seconds'] += seconds; b['rows'] += rows
+        return
+    s.queries += 1
+    s.sql_seconds += seconds
+    s.rows += rows
+
+def add_rows(n):
+    s = getattr(_local, 'stats', None)
+    if s is not None: s.rows += n
+
+def instrument_sqlalchemy():
+    # Every Engine, present or future; rows are counted where results are serialized (serializers.py).
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    event.listen(Engine, 'before_cursor_execute', lambda conn, *a: conn.info.setdefault('query_start', []).append(time.perf_counter()))
+    event.listen(Engine, 'after_cursor_execute', lambda conn, *a: observe_query(time.perf_counter() - conn.info['query_start'].pop()))
+
+class Sampler:
+    # Opt-in wall-clock sampler: while a request runs, its thread's stack is sampled every interval;
+    # requests slower than PROFILE_SLOW_MS are written as collapsed stacks (flamegraph.pl / speedscope).
+    def __init__(self, interval=PROFILE_INTERVAL, directory=PROFILE_DIR):
+        self.interval, self.directory = interval, directory
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._active[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='metrics-sampler', daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id):
+        with self._lock: return self._active.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock: active = list(self._active.items())
+            if not active: continue
+            frames = sys._current_frames()
+            for tid, stacks in active:
+                f = frames.get(tid)
+                if f is None: continue
+                stack = []
+                while f is not None:
+                    stack.append(f'{f.f_code.co_name} ({os.path.basename(f.f_code.co_filename)}:{f.f_code.co_firstlineno})')
+                    f = f.f_back
+                stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, route, method, elapsed, stacks):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{int(elapsed * 1000)}ms-{method}{route.replace("/", "_").replace("<", "").replace(">", "")}.folded'
+        with open(os.path.join(self.directory, name), 'w') as f:
+            for stack, n in stacks.most_common(): f.write(f'{stack} {n}\n')
+
+sampler = Sampler() if PROFILE_SLOW_MS > 0 else None
+
+def _before():
+    _local.stats = RequestStats()
+    if sampler: sampler.start(threading.get_ident())
+
+def _after(response):
+    s = current()
+    if s is None: return response
+    if response.mimetype == 'text/event-stream': s.skip = True
+    elif response.is_streamed: response.response = _count_bytes(response.response, s)
+    else: s.bytes = response.calculate_content_length() or 0
+    s.status = response.status_code
+    return response
+
+def _count_bytes(chunks, s):
+    for chunk in chunks:
+        s.bytes += len(chunk)
+        yield chunk
+
+def _teardown(exc):
+    s = current()
+    if s is None: return
+    _local.stats = None
+    elapsed = time.perf_counter() - s.start
+    stacks = sampler.stop(threading.get_ident()) if sampler else None
+    if s.skip: return
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    registry.record(route, request.method, str(500 if exc is not None else s.status), s, elapsed)
+    if stacks and elapsed * 1000 >= PROFILE_SLOW_MS: sampler.dump(route, request.method, elapsed, stacks)
+
+def metrics_response(): return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+def install(app):
+    if not ENABLED: return
+    app.before_request(_before)
+    app.after_request(_after)
+    app.teardown_request(_teardown)
+    app.add_url_rule('/api/metrics', 'metrics', metrics_response)
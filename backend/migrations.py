@@ -0,0 +1,87 @@
+import sys
+from database import db_exec, transaction, ensure_column
+
+# Append-only schema migrations for server.py; the applied version lives in PRAGMA user_version.
+# Never edit a released step, add a new one instead.
+MIGRATIONS = [
+    (1, 'waste_bins.updated_at', [lambda: ensure_column('waste_bins', 'updated_at', 'TIMESTAMP')]),
+    (2, 'indexes for list filters, keyset ordering and lookups', [
+        # Keyset pages read (created_at DESC, id DESC), optionally under an equality filter.
+        'CREATE INDEX IF NOT EXISTS ix_collections_created ON collections (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_collections_status_created ON collections (status, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_collections_user_created ON collections (user_id, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_recycling_records_created ON recycling_records (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_recycling_records_user_created ON recycling_records (user_id, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_recycling_records_material_created ON recycling_records (material_type, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_waste_bins_type ON waste_bins (type)',
+        'CREATE INDEX IF NOT EXISTS ix_users_role_name ON users (role, name)',
+    ]),
+    (3, 'archive catalog and per-month archive totals', [
+        'CREATE TABLE IF NOT EXISTS archive_partitions (entity TEXT NOT NULL, month TEXT NOT NULL, table_name TEXT NOT NULL, rows INTEGER NOT NULL DEFAULT 0, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (entity, month)) WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS archive_totals (month TEXT NOT NULL, scope TEXT NOT NULL, key TEXT NOT NULL, count INTEGER NOT NULL DEFAULT 0, weight REAL NOT NULL DEFAULT 0, impact REAL NOT NULL DEFAULT 0, PRIMARY KEY (month, scope, key)) WITHOUT ROWID',
+    ]),
+]
+
+def version(): return db_exec('PRAGMA user_version', f=1)[0]
+
+def migrate():
+    # Applies pending steps in one transaction; returns the ids of the migrations that ran.
+    applied = []
+    with transaction():
+        current = version()
+        for v, _, steps in MIGRATIONS:
+            if v <= current: continue
+            for step in steps: step() if callable(step) else db_exec(step)
+            db_exec(f'PRAGMA user_version = {v}')
+            applied.append(v)
+    return applied
+
+def endpoint_queries():
+    # (name, sql, params) for every query a request path runs against a growing table.
+    from pagination import keyset_sql
+    from server import COLLECTION_SELECT, RECYCLING_SELECT, DRIVERS_SELECT, PENDING_STOPS
+    import archive, changes, spatial
+    cursor = ['2024-01-01 00:00:00', 1]
+    return [
+        ('collections.list', *keyset_sql(COLLECTION_SELECT, [], [], None, 100, 'c.')),
+        ('collections.list cursor', *keyset_sql(COLLECTION_SELECT, [], [], cursor, 100, 'c.')),
+        ('collections.list status', *keyset_sql(COLLECTION_SELECT, ['c.status = ?'], ['pending'], cursor, 100, 'c.')),
+        ('collections.list user_id', *keyset_sql(COLLECTION_SELECT, ['c.user_id = ?'], [1], cursor, 100, 'c.')),
+        ('collections.create bin', 'SELECT id FROM waste_bins WHERE type = ? LIMIT 1', ['general']),
+        ('collections.update', 'SELECT status, user_id, weight FROM collections WHERE id = ?', [1]),
+        ('recycling.list', *keyset_sql(RECYCLING_SELECT, [], [], cursor, 100)),
+        ('recycling.list user_id', *keyset_sql(RECYCLING_SELECT, ['user_id = ?'], [1], cursor, 100)),
+        ('recycling.list material', *keyset_sql(RECYCLING_SELECT, ['material_type = ?'], ['plastic'], cursor, 100)),
+        ('bins.bbox', spatial.BBOX_QUERY, [-1.3, -1.2, 36.8, 36.9] * 2),
+        ('auth.login', 'SELECT id, name, role, password_hash FROM users WHERE email = ?', ['demo@takatrack.com']),
+        ('drivers', DRIVERS_SELECT, []),
+        ('routes.plan', PENDING_STOPS, []),
+        ('archive.collections', archive.candidates_sql('collections'), ['2024-01-01 00:00:00', 1000]),
+        ('archive.recycling', archive.candidates_sql('recycling'), ['2024-01-01 00:00:00', 1000]),
+        ('changes.version', 'SELECT MAX(version) FROM change_log WHERE entity = ?', ['bins']),
+        ('changes.feed', 'SELECT version, entity, entity_id, op FROM change_log WHERE version > ? AND entity IN (?) ORDER BY version LIMIT ?', [0, 'bins', 1001]),
+    ]
+
+def plan_problems(queries=None):
+    # EXPLAIN QUERY PLAN each query; a bare SCAN of a table or a temp b-tree sort is linear in table size.
+    problems = []
+    for name, q, params in queries or endpoint_queries():
+        for row in db_exec('EXPLAIN QUERY PLAN ' + q, params, 2):
+            detail = row[3]
+            if detail.startswith('SCAN ') and ' USING ' not in detail and 'VIRTUAL TABLE' not in detail or detail.startswith('USE TEMP B-TREE'):
+                problems.append({'endpoint': name, 'plan': detail})
+    return problems
+
+if __name__ == '__main__':
+    cmd = sys.argv[1] if len(sys.argv) > 1 else 'migrate'
+    if cmd == 'migrate':
+        applied = migrate()
+        print(f'Applied migration(s) {", ".join(map(str, applied))}' if applied else f'Schema up to date (version {version()})')
+    elif cmd == 'status': print(f'Schema version {version()} of {MIGRATIONS[-1][0]}')
+    elif cmd == 'check':
+        migrate()
+        problems = plan_problems()
+        for p in problems: print(f"{p['endpoint']}: {p['plan']}")
+        print(f'{len(problems)} full scan(s)' if problems else 'All endpoint queries use indexes')
+        sys.exit(1 if problems else 0)
+    else: sys.exit('Usage: python migrations.py [migrate | status | check]')
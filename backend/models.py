@@ -1,9 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from functools import partial
+from sqlalchemy import func, union_all
+import spatial
 
 db = SQLAlchemy()
 
 class User(db.Model):
+    __table_args__ = (db.Index('ix_user_role_name', 'role', 'name'),)
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     name = db.Column(db.String(100), nullable=False)
@@ -16,6 +20,7 @@ class User(db.Model):
         return {'id': self.id, 'email': self.email, 'name': self.name, 'phone': self.phone, 'role': self.role}
 
 class WasteBin(db.Model):
+    __table_args__ = (db.Index('ix_waste_bin_lat_lng', 'latitude', 'longitude'), db.Index('ix_waste_bin_type', 'type'))
     id = db.Column(db.Integer, primary_key=True)
     latitude = db.Column(db.Float, nullable=False)
     longitude = db.Column(db.Float, nullable=False)
@@ -25,8 +30,31 @@ class WasteBin(db.Model):
     
     def to_dict(self):
         return {'id': self.id, 'latitude': self.latitude, 'longitude': self.longitude, 'status': self.status, 'type': self.type, 'lastUpdated': self.created_at.isoformat()}
+    
+    @classmethod
+    def in_bbox(cls, min_lat, min_lng, max_lat, max_lng, query=None):
+        return (cls.query if query is None else query).filter(cls.latitude.between(min_lat, max_lat), cls.longitude.between(min_lng, max_lng)).all()
+    
+    @classmethod
+    def within_radius(cls, lat, lng, radius_m, query=None):
+        return spatial.within_radius(partial(cls.in_bbox, query=query), lambda b: (b.latitude, b.longitude), lat, lng, radius_m)
+    
+    @classmethod
+    def nearest(cls, lat, lng, k, query=None):
+        return spatial.nearest(partial(cls.in_bbox, query=query), lambda b: (b.latitude, b.longitude), lat, lng, k)
+    
+    @classmethod
+    def spatial_query(cls, args, query=None):
+        # query lets callers select column tuples instead of ORM instances; rows only need latitude/longitude.
+        q = spatial.parse_query(args)
+        if q is None: return [(b, None) for b in (cls.query if query is None else query).all()]
+        kind, params = q
+        if kind == 'bbox': return [(b, None) for b in cls.in_bbox(*params, query=query)]
+        return cls.within_radius(*params, query=query) if kind == 'radius' else cls.nearest(*params, query=query)
 
 class Collection(db.Model):
+    # Keyset pages order by (created_at, id), optionally under a status or user_id filter.
+    __table_args__ = (db.Index('ix_collection_created', 'created_at', 'id'), db.Index('ix_collection_status_created', 'status', 'created_at', 'id'), db.Index('ix_collection_user_created', 'user_id', 'created_at', 'id'))
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     bin_id = db.Column(db.Integer, db.ForeignKey('waste_bin.id'), nullable=False)
@@ -45,6 +73,7 @@ class Collection(db.Model):
         return {'id': self.id, 'user_id': self.user_id, 'bin_id': self.bin_id, 'status': self.status, 'weight': self.weight, 'waste_type': self.waste_type, 'location': self.location, 'priority': self.priority, 'scheduled_date': self.scheduled_date.isoformat() if self.scheduled_date else None, 'completed_date': self.completed_date.isoformat() if self.completed_date else None, 'created_at': self.created_at.isoformat(), 'bin': self.bin.to_dict() if self.bin else None}
 
 class RecyclingRecord(db.Model):
+    __table_args__ = (db.Index('ix_recycling_record_created', 'created_at', 'id'), db.Index('ix_recycling_record_user_created', 'user_id', 'created_at', 'id'), db.Index('ix_recycling_record_material_created', 'material_type', 'created_at', 'id'))
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     material_type = db.Column(db.String(50), nullable=False)
@@ -54,4 +83,38 @@ class RecyclingRecord(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def to_dict(self):
-        return {'id': self.id, 'material': self.material_type, 'weight': self.weight, 'location': self.location, 'environmental_impact': self.environmental_impact, 'createdAt': self.created_at.isoformat()}
\ No newline at end of file
+        return {'id': self.id, 'material': self.material_type, 'weight': self.weight, 'location': self.location, 'environmental_impact': self.environmental_impact, 'createdAt': self.created_at.isoformat()}
+
+class ChangeLog(db.Model):
+    __table_args__ = (db.Index('ix_change_log_entity_version', 'entity', 'version'),)
+    version = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False, default='upsert')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @classmethod
+    def record(cls, entity, ids, op='upsert'):
+        db.session.add_all([cls(entity=entity, entity_id=i, op=op) for i in ids])
+    
+    @classmethod
+    def current_version(cls, entities):
+        per_entity = union_all(*[db.select(func.max(cls.version).label('v')).where(cls.entity == e) for e in entities]).subquery()
+        return db.session.query(func.max(per_entity.c.v)).scalar() or 0
+    
+    @classmethod
+    def oldest_version(cls):
+        return db.session.query(func.min(cls.version)).scalar() or 0
+    
+    @classmethod
+    def changes_since(cls, since, entities, limit):
+        rows = cls.query.filter(cls.version > since, cls.entity.in_(entities)).order_by(cls.version).limit(limit + 1).all()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return {(r.entity, r.entity_id): r.op for r in rows}, (rows[-1].version if rows else since), more
+
+
+def create_indexes():
+    # create_all() only indexes tables it creates; this adds indexes declared since to existing databases.
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes: index.create(db.engine, checkfirst=True)
@@ -0,0 +1,79 @@
+import base64
+from flask import Response, jsonify, request, stream_with_context
+from database import db_exec
+from responses import dumps
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+STREAM_BATCH = 500
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+class PageError(ValueError):
+    pass
+
+def encode_cursor(created_at, row_id):
+    return base64.urlsafe_b64encode(f'{created_at}|{row_id}'.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().rsplit('|', 1)
+        return created_at, int(row_id)
+    except Exception:
+        raise PageError('Invalid cursor')
+
+def page_args(streaming=False):
+    # (limit, cursor) from the query string; streams are unbounded unless a limit is given.
+    a = request.args
+    try: limit = int(a['limit']) if 'limit' in a else (None if streaming else DEFAULT_LIMIT)
+    except ValueError: raise PageError('limit must be an integer')
+    if limit is not None and not 1 <= limit <= MAX_LIMIT: raise PageError(f'limit must be between 1 and {MAX_LIMIT}')
+    return limit, decode_cursor(a['cursor']) if a.get('cursor') else None
+
+def wants_stream():
+    return request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson'
+
+def keyset_sql(base, filters, params, cursor, limit, alias=''):
+    # Appends filters, the (created_at, id) seek predicate and ORDER BY/LIMIT to a SELECT.
+    where = list(filters)
+    if cursor:
+        where.append(f'({alias}created_at, {alias}id) < (?, ?)')
+        params = [*params, *cursor]
+    q = base + (' WHERE ' + ' AND '.join(where) if where else '') + f' ORDER BY {alias}created_at DESC, {alias}id DESC'
+    if limit is not None:
+        q += ' LIMIT ?'
+        params = [*params, limit + 1]
+    return q, params
+
+def keyset_stream(base, filters, params, cursor, limit, key, alias='', batch=STREAM_BATCH):
+    # Yields up to limit rows (all when None) as a series of keyset pages of `batch` rows. Each page is
+    # its own short query, so no pooled connection or read snapshot is held while the client drains the
+    # response; key(row) -> (created_at, id) resumes the next page after the last row sent.
+    while limit is None or limit > 0:
+        n = batch if limit is None else min(batch, limit)
+        rows = db_exec(*keyset_sql(base, filters, params, cursor, n, alias), 2)
+        yield from rows[:n]
+        if len(rows) <= n: return
+        cursor = key(rows[n - 1])
+        if limit is not None: limit -= n
+
+def filter_args(columns, alias=''):
+    # columns maps query parameter -> column; "from"/"to" bound created_at as [from, to).
+    a, where, params = request.args, [], []
+    for arg, col in columns.items():
+        if a.get(arg): where.append(f'{alias}{col} = ?'); params.append(a[arg])
+    if a.get('from'): where.append(f'{alias}created_at >= ?'); params.append(a['from'])
+    if a.get('to'): where.append(f'{alias}created_at < ?'); params.append(a['to'])
+    return where, params
+
+def page_response(items, limit, key):
+    # items holds up to limit + 1 rows; the extra one only signals that another page exists.
+    more = limit is not None and len(items) > limit
+    items = items[:limit] if more else items
+    r = jsonify(items)
+    if more: r.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(items[-1]))
+    return r
+
+def ndjson_response(rows):
+    return Response(stream_with_context(dumps(r) + '\n' for r in rows), mimetype='application/x-ndjson')
+
+def page_error(e): return jsonify({'message': str(e)}), 400
@@ -0,0 +1,108 @@
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get('RESPONSE_COMPRESS_MIN_SIZE', 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+CACHE_BYTES = int(os.environ.get('RESPONSE_CACHE_BYTES', 64 * 1024 * 1024))
+COMPRESSIBLE = ('application/json', 'application/x-ndjson', 'text/plain', 'text/html', 'text/csv')
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+# dumps() is the text jsonify() sends, for bodies built outside it (NDJSON lines, SSE data), so a record
+# serializes the same in a page, a stream and an event.
+if orjson:
+    # Same output as Flask's provider: sorted keys, compact, and its `default` for dates, decimals and dataclasses.
+    ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    def dumps(obj): return orjson.dumps(obj, default=DefaultJSONProvider.default, option=ORJSON_OPTIONS).decode()
+else:
+    def dumps(obj): return json.dumps(obj, default=DefaultJSONProvider.default, sort_keys=True, separators=(',', ':'))
+
+class JSONProvider(DefaultJSONProvider):
+    # jsonify() through orjson when it is installed; the stdlib encoder otherwise and in debug (indented) mode.
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs: return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS).decode()
+
+    def response(self, *args, **kwargs):
+        if orjson is None or self._app.debug or self.compact is False: return super().response(*args, **kwargs)
+        body = orjson.dumps(self._prepare_response_obj(args, kwargs), default=self.default, option=ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+def negotiated_encoding():
+    best = request.accept_encodings.best_match(ENCODINGS)
+    return best if best in ENCODINGS else None
+
+def compress(response):
+    # after_request hook; streamed bodies (NDJSON, SSE) and small or already encoded ones pass through.
+    if response.mimetype not in COMPRESSIBLE: return response
+    response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers: return response
+    encoding = negotiated_encoding()
+    body = response.get_data()
+    if encoding is None or len(body) < COMPRESS_MIN_SIZE: return response
+    response.set_data(brotli.compress(body, quality=BROTLI_QUALITY) if encoding == 'br' else gzip.compress(body, GZIP_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+class BodyCache:
+    # LRU of finished (encoded and compressed) response bodies, bounded by total bytes. Callers key
+    # entries by data version, so a write makes old entries unreachable and LRU ages them out.
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = self.hits = self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None: self.misses += 1; return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, headers):
+        if len(body) > self.max_bytes // 8: return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old: self.size -= len(old[0])
+            self._entries[key] = (body, headers)
+            self.size += len(body)
+            while self.size > self.max_bytes: self.size -= len(self._entries.popitem(last=False)[1][0])
+
+    def clear(self):
+        with self._lock: self._entries.clear(); self.size = 0
+
+    def __len__(self): return len(self._entries)
+
+    def metrics(self): return {'entries': len(self._entries), 'bytes': self.size, 'hits': self.hits, 'misses': self.misses}
+
+body_cache = BodyCache()
+
+def cached(key, build, cache=body_cache):
+    # Serves a 200 response for key from bytes; otherwise builds, compresses and stores it.
+    entry = cache.get(key)
+    if entry is not None: return current_app.response_class(entry[0], headers=entry[1])
+    r = compress(build())
+    if r.status_code == 200 and not r.direct_passthrough and not r.is_streamed:
+        cache.put(key, r.get_data(), [(k, v) for k, v in r.headers if k != 'Content-Length'])
+    return r
+
+def install(app):
+    app.json = JSONProvider(app)
+    app.after_request(compress)
@@ -0,0 +1,100 @@
+import sys
+from collections import defaultdict
+from database import db_exec, db_executemany, transaction
+
+# scope/key pairs maintained by the write paths:
+#   recycling/*, recycling_user/<user_id>, recycling_material/<material>  -> count, weight, impact
+#   collection_status/<status>                                             -> count
+#   driver/<user_id>                                                       -> count (collections), weight (completed weight)
+#   bins/*                                                                 -> count
+SCHEMA = 'CREATE TABLE IF NOT EXISTS rollups (scope TEXT NOT NULL, key TEXT NOT NULL, count INTEGER NOT NULL DEFAULT 0, weight REAL NOT NULL DEFAULT 0, impact REAL NOT NULL DEFAULT 0, PRIMARY KEY (scope, key)) WITHOUT ROWID'
+
+UPSERT = 'INSERT INTO rollups (scope, key, count, weight, impact) VALUES (?, ?, ?, ?, ?) ON CONFLICT (scope, key) DO UPDATE SET count = count + excluded.count, weight = weight + excluded.weight, impact = impact + excluded.impact'
+
+REBUILD = [
+    'INSERT INTO rollups SELECT "recycling", "*", COUNT(*), COALESCE(SUM(weight), 0), COALESCE(SUM(environmental_impact), 0) FROM recycling_records',
+    'INSERT INTO rollups SELECT "recycling_user", CAST(user_id AS TEXT), COUNT(*), SUM(weight), SUM(environmental_impact) FROM recycling_records WHERE user_id IS NOT NULL GROUP BY user_id',
+    'INSERT INTO rollups SELECT "recycling_material", material_type, COUNT(*), SUM(weight), SUM(environmental_impact) FROM recycling_records GROUP BY material_type',
+    'INSERT INTO rollups SELECT "collection_status", status, COUNT(*), 0, 0 FROM collections WHERE status IS NOT NULL GROUP BY status',
+    'INSERT INTO rollups SELECT "driver", CAST(user_id AS TEXT), COUNT(*), COALESCE(SUM(CASE WHEN status = "completed" THEN weight ELSE 0 END), 0), 0 FROM collections WHERE user_id IS NOT NULL GROUP BY user_id',
+    'INSERT INTO rollups SELECT "bins", "*", COUNT(*), 0, 0 FROM waste_bins',
+    # Rows moved out of the hot tables by archive.py are counted from their pre-summarized totals.
+    'INSERT INTO rollups SELECT scope, key, SUM(count), SUM(weight), SUM(impact) FROM archive_totals GROUP BY scope, key',
+]
+
+def bump_many(deltas):
+    # deltas: {(scope, key): [count, weight, impact]}; must run inside the writer's transaction
+    if deltas: db_executemany(UPSERT, [(s, str(k), c, w, i) for (s, k), (c, w, i) in deltas.items()])
+
+def _deltas(): return defaultdict(lambda: [0, 0.0, 0.0])
+
+def recycling_added(rows):
+    # rows: (user_id, material, weight, impact)
+    d = _deltas()
+    for user_id, material, weight, impact in rows:
+        for k in [('recycling', '*'), ('recycling_user', user_id), ('recycling_material', material)]:
+            if k[1] is None: continue
+            v = d[k]; v[0] += 1; v[1] += weight; v[2] += impact
+    bump_many(d)
+
+def collections_added(rows):
+    # rows: (user_id, status, weight)
+    d = _deltas()
+    for user_id, status, weight in rows:
+        d[('collection_status', status)][0] += 1
+        if user_id is not None:
+            v = d[('driver', user_id)]; v[0] += 1
+            if status == 'completed': v[1] += weight or 0
+    bump_many(d)
+
+def collection_status_changed(user_id, old, new, weight):
+    if old == new: return
+    d = _deltas()
+    d[('collection_status', old)][0] -= 1
+    d[('collection_status', new)][0] += 1
+    if user_id is not None and 'completed' in (old, new): d[('driver', user_id)][1] += (weight or 0) * (1 if new == 'completed' else -1)
+    bump_many(d)
+
+def bins_added(n=1): bump_many({('bins', '*'): [n, 0, 0]})
+
+def replace(rows):
+    # rows: (scope, key, count, weight, impact) totals computed by a bulk loader that also emptied the
+    # archive; run inside the loader's transaction.
+    db_exec('DELETE FROM rollups')
+    db_executemany('INSERT INTO rollups (scope, key, count, weight, impact) VALUES (?, ?, ?, ?, ?)', rows)
+
+def get(scope, key='*'):
+    r = db_exec('SELECT count, weight, impact FROM rollups WHERE scope = ? AND key = ?', [scope, str(key)], 1)
+    return r or (0, 0.0, 0.0)
+
+def _recompute():
+    # REBUILD into a keyless scratch table; a (scope, key) can appear twice, once from the hot rows and once archived.
+    db_exec('CREATE TEMP TABLE IF NOT EXISTS rollups_check AS SELECT * FROM rollups WHERE 0')
+    db_exec('DELETE FROM rollups_check')
+    for q in REBUILD: db_exec(q.replace('INSERT INTO rollups', 'INSERT INTO rollups_check'))
+
+def rebuild():
+    with transaction():
+        _recompute()
+        db_exec('DELETE FROM rollups')
+        db_exec('INSERT INTO rollups SELECT scope, key, SUM(count), SUM(weight), SUM(impact) FROM rollups_check GROUP BY scope, key')
+        db_exec('DROP TABLE rollups_check')
+
+def verify(tolerance=1e-6):
+    # Recompute every rollup in a scratch table and report rows that drifted.
+    with transaction():
+        _recompute()
+        drift = db_exec('SELECT scope, key, a_count, a_weight, a_impact, b_count, b_weight, b_impact FROM (SELECT scope, key, SUM(a_c) a_count, SUM(a_w) a_weight, SUM(a_i) a_impact, SUM(b_c) b_count, SUM(b_w) b_weight, SUM(b_i) b_impact FROM (SELECT scope, key, count a_c, weight a_w, impact a_i, 0 b_c, 0 b_w, 0 b_i FROM rollups UNION ALL SELECT scope, key, 0, 0, 0, count, weight, impact FROM rollups_check) GROUP BY scope, key) WHERE a_count != b_count OR ABS(a_weight - b_weight) > ? OR ABS(a_impact - b_impact) > ?', [tolerance, tolerance], 2)
+        db_exec('DROP TABLE rollups_check')
+    return [{'scope': r[0], 'key': r[1], 'stored': {'count': r[2], 'weight': r[3], 'impact': r[4]}, 'actual': {'count': r[5], 'weight': r[6], 'impact': r[7]}} for r in drift]
+
+if __name__ == '__main__':
+    cmd = sys.argv[1] if len(sys.argv) > 1 else 'verify'
+    if cmd == 'rebuild': rebuild(); print('Rollups rebuilt')
+    elif cmd == 'verify':
+        drift = verify()
+        for d in drift: print(d)
+        print(f'{len(drift)} drifted rollup(s)' if drift else 'Rollups OK')
+        if drift and '--repair' in sys.argv: rebuild(); print('Rollups rebuilt')
+        sys.exit(1 if drift and '--repair' not in sys.argv else 0)
+    else: sys.exit('Usage: python rollups.py [verify [--repair] | rebuild]')
@@ -1,10 +1,44 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
+import functools
+from flask import Blueprint, request, jsonify, g
+from flask_jwt_extended import create_access_token, decode_token, verify_jwt_in_request, get_jwt
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import PyJWTError
 from models import User, db
+from security import jwt_cache, hash_password, check_password
 
 auth_bp = Blueprint('auth', __name__)
 
+def jwt_identity(token):
+    # Identity of an encoded access token, or None when it is malformed, forged, expired or not an access token.
+    claims = jwt_cache.get(token)
+    if claims is None:
+        try: claims = decode_token(token)
+        except (JWTExtendedException, PyJWTError): return None
+        if claims.get('type') != 'access': return None
+        jwt_cache.put(token, claims, claims.get('exp'))
+    return claims['sub']
+
+def jwt_required():
+    # jwt_required() that runs flask_jwt_extended's full check once per token and keeps the verified claims
+    # in jwt_cache until the cache TTL or the token's own exp, whichever is sooner. A cache hit skips the
+    # library entirely, so views read the identity through current_identity() rather than get_jwt_identity().
+    def wrapper(fn):
+        @functools.wraps(fn)
+        def decorated(*args, **kwargs):
+            header = request.headers.get('Authorization', '')
+            token = header[7:] if header.startswith('Bearer ') else None
+            claims = jwt_cache.get(token) if token else None
+            if claims is None:
+                verify_jwt_in_request()
+                claims = get_jwt()
+                if token: jwt_cache.put(token, claims, claims.get('exp'))
+            g.jwt_claims = claims
+            return fn(*args, **kwargs)
+        return decorated
+    return wrapper
+
+def current_identity(): return g.jwt_claims['sub']
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -14,7 +48,7 @@ def register():
     if User.query.filter_by(email=data['email']).first():
         return jsonify({'message': 'Email already registered'}), 400
     
-    user = User(email=data['email'], name=data['name'], phone=data.get('phone', ''), role=data.get('role', 'resident'), password_hash=generate_password_hash(data['password']))
+    user = User(email=data['email'], name=data['name'], phone=data.get('phone', ''), role=data.get('role', 'resident'), password_hash=hash_password(data['password']))
     db.session.add(user)
     db.session.commit()
     
@@ -27,16 +61,16 @@ def login():
         return jsonify({'message': 'Email and password are required'}), 400
     
     user = User.query.filter_by(email=data['email']).first()
-    if not user or not check_password_hash(user.password_hash, data['password']):
+    if not user or not check_password(user.password_hash, data['password']):
         return jsonify({'message': 'Invalid email or password'}), 401
     
-    access_token = create_access_token(identity=user.id)
+    access_token = create_access_token(identity=str(user.id))
     return jsonify({'token': access_token, 'user': user.to_dict()}), 200
 
 @auth_bp.route('/me', methods=['GET'])
 @jwt_required()
 def get_current_user():
-    user_id = get_jwt_identity()
+    user_id = current_identity()
     user = User.query.get(user_id)
     if not user:
         return jsonify({'message': 'User not found'}), 404
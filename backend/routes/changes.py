@@ -0,0 +1,22 @@
+from functools import partial
+from flask import Blueprint, request, jsonify
+from routes.auth import jwt_required
+from models import ChangeLog
+from changes import ENTITIES, feed, feed_args, conditional
+from serializers import fetch
+
+changes_bp = Blueprint('changes', __name__)
+
+FETCHERS = {entity: partial(fetch, f'changes.{entity}') for entity in ENTITIES}
+
+def versioned(*entities):
+    return conditional(lambda: ChangeLog.current_version(entities))
+
+@changes_bp.route('', methods=['GET'])
+@jwt_required()
+def get_changes():
+    try:
+        since, entities = feed_args()
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    return versioned(*entities)(lambda: jsonify(feed(since, entities, FETCHERS, log=ChangeLog)))()
@@ -1,19 +1,24 @@
-from flask import Blueprint, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import WasteBin, Collection, RecyclingRecord, db
-from sqlalchemy import func
+from flask import Blueprint, g, jsonify
+from routes.auth import jwt_required, current_identity
+from models import WasteBin, Collection, RecyclingRecord, ChangeLog, db
+from sqlalchemy import func, case, select
+from stats import StatsCache, render_dashboard_stats
+from changes import ENTITIES
+from routes.changes import versioned
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+def load_stats(version=0):
+    version = version or ChangeLog.current_version(ENTITIES)
+    count_status = lambda s: func.count(case((Collection.status == s, 1)))
+    r = db.session.query(select(func.count(WasteBin.id)).scalar_subquery(), count_status('completed'), count_status('pending'), count_status('in_progress'), select(func.coalesce(func.sum(RecyclingRecord.weight), 0)).scalar_subquery()).select_from(Collection).one()
+    return version, {'totalBins': r[0], 'completed': r[1], 'pending': r[2], 'inProgress': r[3], 'recycledWeight': r[4]}
+
+stats_cache = StatsCache(load_stats)
+
 @dashboard_bp.route('/stats', methods=['GET'])
 @jwt_required()
+@versioned(*ENTITIES)
 def get_stats():
-    user_id = get_jwt_identity()
-    stats = {
-        'totalBins': WasteBin.query.count(),
-        'completed': Collection.query.filter_by(status='completed').count(),
-        'pending': Collection.query.filter_by(status='pending').count(),
-        'inProgress': Collection.query.filter_by(status='in_progress').count(),
-        'recycledWeight': round(db.session.query(func.sum(RecyclingRecord.weight)).scalar() or 0, 1)
-    }
-    return jsonify({**stats, 'collectedToday': stats['completed'], 'pendingCollections': stats['pending'], 'activeDrivers': 3})
\ No newline at end of file
+    user_id = current_identity()
+    return jsonify(render_dashboard_stats(stats_cache.get(g.change_version)))
@@ -0,0 +1,23 @@
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from events import TOPICS, broker, stream
+
+def events_blueprint(verify_token, optional=False):
+    # verify_token(token) -> identity or None. EventSource cannot send an Authorization header, so the
+    # stream takes its bearer token as ?token=; optional lets token-less requests through, as server.py's
+    # auth_required does.
+    events_bp = Blueprint('events', __name__)
+
+    @events_bp.route('', methods=['GET'])
+    def subscribe():
+        token = request.args.get('token')
+        if token and verify_token(token) is None or not token and not optional:
+            return jsonify({'message': 'A valid token is required'}), 401
+        topics = [t for t in request.args.get('topics', ','.join(TOPICS)).split(',') if t]
+        if not topics or any(t not in TOPICS for t in topics):
+            return jsonify({'message': f'topics must be drawn from {", ".join(TOPICS)}'}), 400
+        sub = broker.subscribe(topics)
+        if sub is None:
+            return jsonify({'message': 'Too many event subscribers, fall back to polling'}), 503
+        return Response(stream_with_context(stream(sub)), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    return events_bp
@@ -1,17 +1,30 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import RecyclingRecord, db
+from routes.auth import jwt_required, current_identity
+from models import RecyclingRecord, ChangeLog, db
 from sqlalchemy import func
+from routes.changes import versioned
+import events
+from serializers import query as select_rows, serialize, keyset_query, keyset_stream
+from pagination import PageError, page_args, wants_stream, page_response, ndjson_response, page_error
 
 recycling_bp = Blueprint('recycling', __name__)
 
 @recycling_bp.route('/records', methods=['GET', 'POST'])
 @jwt_required()
+@versioned('recycling')
 def recycling_records():
-    user_id = get_jwt_identity()
+    user_id = current_identity()
     if request.method == 'GET':
-        records = RecyclingRecord.query.order_by(RecyclingRecord.created_at.desc()).all()
-        return jsonify([record.to_dict() for record in records])
+        try:
+            streaming = wants_stream()
+            limit, cursor = page_args(streaming)
+            filters = {'user_id': RecyclingRecord.user_id, 'material': RecyclingRecord.material_type}
+            if streaming:
+                return ndjson_response(keyset_stream('recycling.list', filters, cursor, limit))
+            query = keyset_query(select_rows('recycling.list'), RecyclingRecord, filters, cursor, limit)
+        except PageError as e:
+            return page_error(e)
+        return page_response(list(serialize('recycling.list', query)), limit, lambda r: (r['createdAt'], r['id']))
     
     data = request.get_json()
     if not data or not data.get('material') or not data.get('weight'):
@@ -24,12 +37,16 @@ def recycling_records():
     
     record = RecyclingRecord(user_id=user_id, material_type=material, weight=weight, location=data.get('location', 'Recycling Center'), environmental_impact=environmental_impact)
     db.session.add(record)
+    db.session.flush()
+    ChangeLog.record('recycling', [record.id])
     db.session.commit()
+    events.publish('recycling', 'recycling.created', record.to_dict())
     
     return jsonify({'message': 'Recycling record added successfully', 'record': record.to_dict()}), 201
 
 @recycling_bp.route('/stats', methods=['GET'])
 @jwt_required()
+@versioned('recycling')
 def recycling_stats():
     total_weight = db.session.query(func.sum(RecyclingRecord.weight)).scalar() or 0
     carbon_saved = db.session.query(func.sum(RecyclingRecord.environmental_impact)).scalar() or 0
@@ -1,24 +1,42 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import WasteBin, Collection, db
+from routes.auth import jwt_required, current_identity
+from models import WasteBin, Collection, ChangeLog, db
+from pagination import PageError, page_args, wants_stream, page_response, ndjson_response, page_error
 from datetime import datetime
-import random
+from spatial import QUERY_HELP
+from routes.changes import versioned
+from serializers import query as select_rows, serialize, keyset_query, keyset_stream
+import events
 
 waste_bp = Blueprint('waste', __name__)
 
 @waste_bp.route('/bins', methods=['GET'])
 @jwt_required()
+@versioned('bins')
 def get_bins():
-    bins = WasteBin.query.all()
-    return jsonify([{**bin.to_dict(), 'status': random.choice(['empty', 'half', 'full']) if random.random() < 0.1 else bin.status} for bin in bins])
+    try:
+        hits = WasteBin.spatial_query(request.args, select_rows('bins.list'))
+    except ValueError:
+        return jsonify({'message': QUERY_HELP}), 400
+    bins = serialize('bins.list', (b for b, _ in hits))
+    return jsonify([{**bin, **({'distance': round(dist, 1)} if dist is not None else {})} for bin, (_, dist) in zip(bins, hits)])
 
 @waste_bp.route('/collections', methods=['GET', 'POST'])
 @jwt_required()
+@versioned('collections', 'bins')
 def collections():
-    user_id = get_jwt_identity()
+    user_id = current_identity()
     if request.method == 'GET':
-        collections = Collection.query.order_by(Collection.created_at.desc()).all()
-        return jsonify([col.to_dict() for col in collections])
+        try:
+            streaming = wants_stream()
+            limit, cursor = page_args(streaming)
+            filters = {'status': Collection.status, 'user_id': Collection.user_id}
+            if streaming:
+                return ndjson_response(keyset_stream('collections.stream', filters, cursor, limit))
+            query = keyset_query(select_rows('collections.list'), Collection, filters, cursor, limit)
+        except PageError as e:
+            return page_error(e)
+        return page_response(list(serialize('collections.list', query)), limit, lambda c: (c['created_at'], c['id']))
     
     data = request.get_json()
     if not data or not data.get('location'):
@@ -26,14 +44,21 @@ def collections():
     
     waste_type = data.get('wasteType', 'general')
     bin_obj = WasteBin.query.filter_by(type=waste_type).first()
-    if not bin_obj:
+    new_bin = bin_obj is None
+    if new_bin:
         bin_obj = WasteBin(latitude=-1.2921, longitude=36.8219, status='pending', type=waste_type)
         db.session.add(bin_obj)
         db.session.flush()
+        ChangeLog.record('bins', [bin_obj.id])
     
     collection = Collection(user_id=user_id, bin_id=bin_obj.id, waste_type=waste_type, location=data.get('location'), priority=data.get('priority', 'medium'))
     db.session.add(collection)
+    db.session.flush()
+    ChangeLog.record('collections', [collection.id])
     db.session.commit()
+    if new_bin:
+        events.publish('bins', 'bin.created', bin_obj.to_dict())
+    events.publish('collections', 'collection.created', collection.to_dict())
     
     return jsonify({'message': 'Collection scheduled successfully', 'collection': collection.to_dict()}), 201
 
@@ -48,6 +73,8 @@ def update_collection(collection_id):
     if not collection:
         return jsonify({'message': 'Collection not found'}), 404
     
-    collection.status = data['status']
+    old_status, collection.status = collection.status, data['status']
+    ChangeLog.record('collections', [collection.id])
     db.session.commit()
+    events.publish('collections', 'collection.status', {'id': collection.id, 'status': collection.status, 'previous': old_status})
     return jsonify({'message': 'Collection updated successfully'})
\ No newline at end of file
@@ -0,0 +1,179 @@
+import math
+import os
+import threading
+import time
+import numpy as np
+from spatial import EARTH_RADIUS_M
+
+DEPOT = (-1.2921, 36.8219)
+TRUCK_CAPACITY_KG = float(os.environ.get('ROUTE_TRUCK_CAPACITY_KG', 2000))
+TIME_BUDGET_MS = float(os.environ.get('ROUTE_TIME_BUDGET_MS', 500))
+MAX_STOPS = int(os.environ.get('ROUTE_MAX_STOPS', 5000))
+# Bins kept in the distance cache, MATRIX_MAX_BINS^2 float32 cells at most (100 MB for 5000).
+MATRIX_MAX_BINS = max(int(os.environ.get('ROUTE_MATRIX_MAX_BINS', MAX_STOPS)), MAX_STOPS)
+# Expected pickup per stop by bin fill status, and how much closer a stop of each priority "looks".
+BIN_LOAD_KG = {'full': 100.0, 'half': 50.0, 'empty': 20.0}
+DEFAULT_LOAD_KG = 50.0
+PRIORITY_WEIGHT = {'high': 0.5, 'medium': 1.0, 'low': 1.5}
+OVERDUE_WEIGHT = 0.5
+# Stops turn overdue with the clock rather than with a write, so plans judge overdue at the start of a
+# window of this many seconds and are cached per window.
+OVERDUE_RESOLUTION = int(os.environ.get('ROUTE_OVERDUE_RESOLUTION', 60))
+
+class PlanError(ValueError):
+    pass
+
+def overdue_window(): return int(time.time() // OVERDUE_RESOLUTION)
+
+def window_start(window): return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(window * OVERDUE_RESOLUTION))
+
+def unit_vectors(lat, lng):
+    lat, lng = np.radians(lat), np.radians(lng)
+    return np.column_stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)])
+
+def haversine_matrix(a, b):
+    # a: (k, 3), b: (n, 3) unit vectors -> (k, n) metres. The haversine term sin^2(theta/2) equals
+    # (1 - a.b) / 2, so the whole block is one matrix product plus an elementwise arcsin.
+    h = ((1 - a @ b.T) / 2).astype(np.float32)
+    np.clip(h, 0, 1, out=h)
+    np.sqrt(h, out=h)
+    np.arcsin(h, out=h)
+    h *= np.float32(2 * EARTH_RADIUS_M)
+    return h
+
+class DistanceMatrix:
+    # Pairwise distances between recently planned bins, grown in place as bins appear: a new bin costs
+    # one row of haversines, not a rebuild. Storage doubles like a list up to max_bins. When a plan's
+    # new bins would not fit, or most cached slots belong to bins it does not use, the cache is rebuilt
+    # from that plan's bins alone.
+    def __init__(self, max_bins=MATRIX_MAX_BINS):
+        self.max_bins = max_bins
+        self._lock = threading.Lock()
+        self._reset(0)
+        self.computed = 0
+
+    def _reset(self, capacity):
+        self.index = {}
+        self.coords = np.empty((capacity, 3))
+        self.matrix = np.empty((capacity, capacity), np.float32)
+        self.size = 0
+
+    def lookup(self, bin_ids, lat, lng):
+        # Matrix indices for the bins plus the matrix they refer to; growth never moves existing cells,
+        # and compaction swaps in new arrays, so callers can keep using their snapshot without the lock.
+        with self._lock:
+            vec = unit_vectors(lat, lng)
+            # Moved bins are re-measured under a fresh index; their old slot simply goes stale.
+            known = np.fromiter((self.index.get(b, -1) for b in bin_ids), np.intp, len(bin_ids))
+            stale = known < 0
+            hit = ~stale
+            stale[hit] = np.abs(self.coords[known[hit]] - vec[hit]).max(axis=1) > 1e-12
+            fresh = list({bin_ids[i]: i for i in np.flatnonzero(stale)}.values())
+            live = len(set(bin_ids))
+            if self.size + len(fresh) > self.max_bins or (self.size > 1024 and self.size > 4 * live): self._compact(bin_ids, vec)
+            elif fresh: self._grow([bin_ids[i] for i in fresh], vec[fresh])
+            return np.fromiter((self.index[b] for b in bin_ids), np.intp, len(bin_ids)), self.matrix, self.coords
+
+    def _grow(self, ids, vec):
+        n, k = self.size, len(ids)
+        if n + k > len(self.coords):
+            capacity = max(min(max(64, 2 * (n + k)), self.max_bins), n + k)
+            coords, matrix = self.coords, self.matrix
+            self.coords = np.empty((capacity, 3))
+            self.matrix = np.empty((capacity, capacity), np.float32)
+            self.coords[:n], self.matrix[:n, :n] = coords[:n], matrix[:n, :n]
+        self.coords[n:n + k] = vec
+        cross = haversine_matrix(vec, self.coords[:n + k])
+        self.matrix[n:n + k, :n + k] = cross
+        self.matrix[:n + k, n:n + k] = cross.T
+        for i, b in enumerate(ids): self.index[b] = n + i
+        self.size += k
+        self.computed += k * (n + k)
+
+    def _compact(self, bin_ids, vec):
+        keep = list({b: i for i, b in enumerate(bin_ids)}.values())
+        self._reset(0)
+        self._grow([bin_ids[i] for i in keep], vec[keep])
+
+distance_matrix = DistanceMatrix()
+
+def plan(stops, drivers, depot=DEPOT, capacity=TRUCK_CAPACITY_KG, budget_ms=TIME_BUDGET_MS, matrix=distance_matrix):
+    # stops: dicts with collection_id, bin_id, latitude, longitude, priority, bin_status, overdue.
+    # drivers: dicts with id and name. Returns routes per driver plus the stops no truck had room for.
+    start = time.perf_counter()
+    if len(stops) > MAX_STOPS: raise PlanError(f'At most {MAX_STOPS} stops per plan')
+    if not drivers or not stops: return {'routes': [{'driver': d, 'stops': [], 'distanceM': 0, 'loadKg': 0} for d in drivers], 'unassigned': [s['collection_id'] for s in stops]}
+    n = len(stops)
+    idx, dist, coords = matrix.lookup([s['bin_id'] for s in stops], [s['latitude'] for s in stops], [s['longitude'] for s in stops])
+    depot_dist = haversine_matrix(unit_vectors([depot[0]], [depot[1]]), coords[idx])[0]
+    load = np.array([BIN_LOAD_KG.get(s['bin_status'], DEFAULT_LOAD_KG) for s in stops])
+    weight = np.array([PRIORITY_WEIGHT.get(s['priority'], 1.0) * (OVERDUE_WEIGHT if s['overdue'] else 1.0) for s in stops])
+
+    # Round-robin nearest neighbour: each truck in turn takes its cheapest reachable stop, where cost is
+    # distance scaled by priority, so urgent stops are picked up early and the fleet stays balanced.
+    routes = [[] for _ in drivers]
+    remaining = np.full(len(drivers), capacity)
+    position = [None] * len(drivers)
+    taken = np.zeros(n)  # +inf once a stop is on a route
+    heaviest = load.max()
+    active = list(range(len(drivers)))
+    while active:
+        for t in list(active):
+            cost = (depot_dist if position[t] is None else dist[idx[position[t]], idx]) * weight + taken
+            if remaining[t] < heaviest: cost[load > remaining[t]] = np.inf
+            s = int(np.argmin(cost))
+            if cost[s] == np.inf: active.remove(t); continue
+            routes[t].append(s)
+            taken[s] = np.inf
+            remaining[t] -= load[s]
+            position[t] = s
+
+    # Each route that 2-opt can improve gets an equal share of the budget left; time a route does not
+    # use carries over to the ones after it.
+    end = start + budget_ms / 1000
+    improvable = sum(len(r) >= 3 for r in routes)
+    out = []
+    for t, route in enumerate(routes):
+        if len(route) >= 3:
+            now = time.perf_counter()
+            route = two_opt(route, dist, idx, depot_dist, now + max(end - now, 0) / improvable)
+            improvable -= 1
+        length = float(depot_dist[route[0]] + dist[idx[route[:-1]], idx[route[1:]]].sum() + depot_dist[route[-1]]) if route else 0.0
+        out.append({'driver': drivers[t], 'stops': [{**_stop(stops[s]), 'load': float(load[s])} for s in route], 'distanceM': round(length, 1), 'loadKg': round(float(load[route].sum()), 1) if route else 0})
+    return {'routes': out, 'unassigned': [stops[s]['collection_id'] for s in np.flatnonzero(taken == 0)]}
+
+def two_opt(route, dist, idx, depot_dist, deadline):
+    # Closed tour depot -> stops -> depot. Each pass evaluates every segment reversal at once and
+    # applies the best one; stops at a local optimum or when the planning budget runs out.
+    m = len(route)
+    if m < 3: return route
+    r = np.array(route)
+    nodes = np.append(idx[r], -1)
+    # Sub-matrix with the depot as the last row/column.
+    d = np.empty((m + 1, m + 1))
+    d[:m, :m] = dist[np.ix_(nodes[:m], nodes[:m])]
+    d[m, :m] = d[:m, m] = depot_dist[r]
+    d[m, m] = 0
+    tour = np.concatenate([[m], np.arange(m), [m]])
+    i, j = np.triu_indices(len(tour) - 1, 2)
+    while time.perf_counter() < deadline:
+        a, b, c, e = tour[i], tour[i + 1], tour[j], tour[j + 1]
+        gain = d[a, b] + d[c, e] - d[a, c] - d[b, e]
+        best = int(np.argmax(gain))
+        if gain[best] <= 0.01: break
+        tour[i[best] + 1:j[best] + 1] = tour[i[best] + 1:j[best] + 1][::-1].copy()
+    return [route[k] for k in tour[1:-1]]
+
+def _stop(s):
+    return {'collectionId': s['collection_id'], 'binId': s['bin_id'], 'latitude': s['latitude'], 'longitude': s['longitude'], 'priority': s['priority']}
+
+def parse_args(args):
+    try:
+        depot = tuple(float(v) for v in args['depot'].split(',')) if args.get('depot') else DEPOT
+        capacity = float(args.get('capacity', TRUCK_CAPACITY_KG))
+        drivers = {int(v) for v in args['drivers'].split(',')} if args.get('drivers') else None
+    except ValueError:
+        raise PlanError('depot=lat,lng, capacity (kg) and drivers (comma separated ids) must be numeric')
+    if len(depot) != 2 or not (-90 <= depot[0] <= 90 and -180 <= depot[1] <= 180) or capacity <= 0 or math.isnan(capacity):
+        raise PlanError('depot must be a valid lat,lng and capacity positive')
+    return depot, capacity, drivers
@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from werkzeug.security import generate_password_hash, check_password_hash
+
+HASH_WORKERS = int(os.environ.get('AUTH_HASH_WORKERS', min(os.cpu_count() or 2, 4)))
+HASH_QUEUE = int(os.environ.get('AUTH_HASH_QUEUE', HASH_WORKERS * 8))
+HASH_TIMEOUT = float(os.environ.get('AUTH_HASH_TIMEOUT', 10))
+HASH_POOL = os.environ.get('AUTH_HASH_POOL', '1') != '0'
+TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TTL = float(os.environ.get('AUTH_TOKEN_CACHE_TTL', 300))
+TOKEN_MAX_AGE = 7 * 24 * 3600
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+class Overloaded(RuntimeError):
+    pass
+
+class HashPool:
+    # Runs the password KDF in worker processes so it neither holds the GIL nor blocks request
+    # threads. At most workers + queue hashes are outstanding; beyond that callers get Overloaded.
+    def __init__(self, workers=HASH_WORKERS, queue=HASH_QUEUE, timeout=HASH_TIMEOUT, enabled=HASH_POOL):
+        self.workers, self.timeout, self.enabled = workers, timeout, enabled
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._lock = threading.Lock()
+        self._executor = None
+        self.rejected = 0
+
+    def run(self, fn, *args):
+        if not self.enabled: return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise Overloaded('Too many password checks in flight')
+        try: future = self._pool().submit(fn, *args)
+        except BaseException: self._slots.release(); raise
+        # The slot is held until the worker finishes, even if this caller gives up waiting.
+        future.add_done_callback(lambda _: self._slots.release())
+        try: return future.result(self.timeout)
+        except TimeoutError: raise Overloaded('Password check timed out')
+        except BrokenProcessPool:
+            with self._lock: self._executor = None
+            raise Overloaded('Password worker pool restarted')
+
+    def map(self, fn, *iterables):
+        # Batch work such as seeding: everything is queued on the workers at once and waited for, outside
+        # the request slots.
+        if not self.enabled: return list(map(fn, *iterables))
+        try: return list(self._pool().map(fn, *iterables))
+        except BrokenProcessPool:
+            with self._lock: self._executor = None
+            raise
+
+    def _pool(self):
+        with self._lock:
+            # Never fork: the pool starts lazily inside a threaded server holding SQLite connections and
+            # locks, which a forked child would inherit mid-use.
+            if self._executor is None: self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(START_METHOD))
+            return self._executor
+
+hash_pool = HashPool()
+
+def hash_password(password): return hash_pool.run(generate_password_hash, password)
+
+def check_password(password_hash, password): return hash_pool.run(check_password_hash, password_hash, password)
+
+class TokenCache:
+    # LRU of token -> verified identity. Entries expire after ttl or when the token itself expires,
+    # whichever comes first, so a hit never outlives the token's validity.
+    def __init__(self, size=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL):
+        self.size, self.ttl = size, ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None: del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token, identity, expires_at=None):
+        deadline = time.time() + self.ttl
+        with self._lock:
+            self._entries[token] = (identity, min(deadline, expires_at) if expires_at else deadline)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.size: self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock: self._entries.clear()
+
+    def __len__(self): return len(self._entries)
+
+token_cache = TokenCache()  # server.py's TokenSigner: token -> identity
+jwt_cache = TokenCache()  # app.py's jwt_required: access token -> verified claims
+
+class TokenSigner:
+    # Signed, timestamped bearer tokens for server.py; verified identities are served from the cache.
+    def __init__(self, secret, max_age=TOKEN_MAX_AGE, cache=token_cache):
+        self._serializer = URLSafeTimedSerializer(secret, salt='takatrack-auth')
+        self.max_age, self.cache = max_age, cache
+
+    def issue(self, identity): return self._serializer.dumps(identity)
+
+    def verify(self, token):
+        identity = self.cache.get(token)
+        if identity is not None: return identity
+        try: identity, issued = self._serializer.loads(token, max_age=self.max_age, return_timestamp=True)
+        except (BadSignature, SignatureExpired): return None
+        self.cache.put(token, identity, issued.timestamp() + self.max_age)
+        return identity
@@ -0,0 +1,375 @@
+import argparse
+import atexit
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+from database import db_exec, db_executemany, inserted_ids, connection, transaction, after_commit
+import changes
+import rollups
+import spatial
+from ingest import IMPACT_FACTORS
+
+SAMPLE_DATA = os.environ.get('SAMPLE_DATA', 'eager')  # eager | deferred | off
+SAMPLE_DATA_INTERVAL = float(os.environ.get('SAMPLE_DATA_INTERVAL', 0.5))
+CHUNK = 100000
+# Bulk seeds skip the fsync per commit and sort index builds in a larger page cache (KiB).
+SEED_PRAGMAS = {'synchronous': 'OFF', 'cache_size': -262144}
+
+log = logging.getLogger(__name__)
+
+# Table names differ between the raw-SQLite server and the Flask-SQLAlchemy app; columns line up.
+# The keys double as change_log entities.
+TABLES = {
+    'server': {'users': 'users', 'bins': 'waste_bins', 'collections': 'collections', 'recycling': 'recycling_records'},
+    'app': {'users': 'user', 'bins': 'waste_bin', 'collections': 'collection', 'recycling': 'recycling_record'},
+}
+INSERTS = {
+    'users': 'INSERT INTO {t} (email, name, phone, role, password_hash, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+    'bins': 'INSERT INTO {t} (latitude, longitude, status, type, created_at) VALUES (?, ?, ?, ?, ?)',
+    'collections': 'INSERT INTO {t} (user_id, bin_id, status, weight, waste_type, location, scheduled_date, priority, completed_date, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+    'recycling': 'INSERT INTO {t} (user_id, material_type, weight, location, environmental_impact, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+}
+
+def load(data, tables=TABLES['server'], executemany=db_executemany):
+    # data: entity -> iterable of row chunks. Run inside one transaction: a single commit for the lot.
+    counts = {}
+    for entity, chunks in data.items():
+        q = INSERTS[entity].format(t=tables[entity])
+        counts[entity] = 0
+        for rows in chunks:
+            executemany(q, rows)
+            counts[entity] += len(rows)
+    return counts
+
+def _now(): return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+# Demo data set for a fresh server.py database; passwords are demo123, admin123, driver123 and resident123.
+DEMO_USERS = [
+    ('demo@takatrack.com', 'Demo User', '1234567890', 'driver', 'demo123'),
+    ('admin@takatrack.com', 'Admin', '+254756789012', 'admin', 'admin123'),
+    ('james.mwangi@takatrack.com', 'James Mwangi', '+254701234567', 'driver', 'driver123'),
+    ('mary.wanjiku@takatrack.com', 'Mary Wanjiku', '+254712345678', 'driver', 'driver123'),
+    ('peter.kiprotich@takatrack.com', 'Peter Kiprotich', '+254723456789', 'driver', 'driver123'),
+    ('grace.akinyi@takatrack.com', 'Grace Akinyi', '+254734567890', 'driver', 'driver123'),
+    ('samuel.mutua@takatrack.com', 'Samuel Mutua', '+254745678901', 'driver', 'driver123'),
+    ('sarah.njeri@takatrack.com', 'Sarah Njeri', '+254756789012', 'resident', 'resident123'),
+    ('john.kamau@takatrack.com', 'John Kamau', '+254767890123', 'resident', 'resident123'),
+]
+DEMO_BINS = [(-1.2921, 36.8219, 'full', 'general'), (-1.2865, 36.8235, 'empty', 'recycling'), (-1.2955, 36.8195, 'half', 'organic')]
+DEMO_COLLECTIONS = [
+    (1, 1, 'completed', 15.5, 'general', 'Westlands Shopping Mall', '2024-01-15 09:00:00', 'high'),
+    (1, 2, 'completed', 8.2, 'recycling', 'Sarit Centre', '2024-01-15 10:30:00', 'medium'),
+    (2, 3, 'completed', 12.8, 'general', 'Karen Shopping Centre', '2024-01-15 11:45:00', 'medium'),
+    (1, 1, 'completed', 22.3, 'organic', 'CBD Area', '2024-01-15 14:20:00', 'high'),
+    (2, 2, 'completed', 18.7, 'recycling', 'Kilimani', '2024-01-15 16:15:00', 'medium'),
+    (1, 3, 'completed', 9.4, 'general', 'Yaya Centre', '2024-01-15 17:30:00', 'low'),
+    (2, 1, 'completed', 14.6, 'recycling', 'Junction Mall', '2024-01-15 18:45:00', 'medium'),
+    (1, 2, 'completed', 25.1, 'general', 'Village Market', '2024-01-15 19:20:00', 'high'),
+    (2, 3, 'in_progress', 0, 'recycling', 'Two Rivers Mall', '2024-01-16 08:00:00', 'medium'),
+    (1, 1, 'in_progress', 0, 'general', 'Galleria Mall', '2024-01-16 09:30:00', 'high'),
+    (2, 2, 'pending', 0, 'organic', 'Westgate Mall', '2024-01-16 11:00:00', 'medium'),
+    (1, 3, 'pending', 0, 'recycling', 'The Hub Karen', '2024-01-16 13:30:00', 'low'),
+    (2, 1, 'pending', 0, 'general', 'Prestige Plaza', '2024-01-16 15:00:00', 'medium'),
+]
+DEMO_RECYCLING = [
+    (1, 'plastic', 5.2, 'Recycling Center', 10.4),
+    (1, 'paper', 8.5, 'Recycling Center', 12.75),
+    (2, 'glass', 3.8, 'Recycling Center', 1.9),
+    (1, 'metal', 2.1, 'Recycling Center', 6.3),
+    (2, 'plastic', 7.3, 'Recycling Center', 14.6),
+    (1, 'electronic', 1.5, 'E-Waste Center', 6.0),
+]
+
+def hash_passwords(passwords):
+    # Each distinct password is hashed once, all of them in parallel on the auth hash pool's processes.
+    from security import hash_pool, generate_password_hash
+    distinct = sorted(set(passwords))
+    return dict(zip(distinct, hash_pool.map(generate_password_hash, distinct)))
+
+def clear():
+    # Empties server.py's tables and archive and restarts their ids; call inside a transaction. The
+    # change log is pruned too, so every feed client gets a reset.
+    for (table,) in db_exec('SELECT table_name FROM archive_partitions', f=2): db_exec(f'DROP TABLE IF EXISTS {table}')
+    db_exec('DELETE FROM waste_bins_rtree')
+    for t in [*TABLES['server'].values(), 'archive_partitions', 'archive_totals']: db_exec(f'DELETE FROM {t}')
+    db_exec('DELETE FROM sqlite_sequence WHERE name IN (?, ?, ?, ?)', list(TABLES['server'].values()))
+    changes.prune(0)
+
+def demo():
+    # Replaces the contents of server.py's tables with the demo set; call inside init_db()'s transaction.
+    clear()
+    hashes = hash_passwords(p for *_, p in DEMO_USERS)
+    now = _now()
+    load({
+        'users': [[(*u[:4], hashes[u[4]], now) for u in DEMO_USERS]],
+        'bins': [[(*b, now) for b in DEMO_BINS]],
+        'collections': [[(*c, None, now) for c in DEMO_COLLECTIONS]],
+        'recycling': [[(*r, now) for r in DEMO_RECYCLING]],
+    })
+    # One entry per row moves every ETag past the previous data set's
+    for entity, table in TABLES['server'].items(): changes.record(entity, [r[0] for r in db_exec(f'SELECT id FROM {table}', f=2)])
+
+def sample_rows(user_id, name):
+    collections = [
+        (user_id, 1, 'completed', 15.5, 'general', f'{name}s Home - Westlands', '2024-01-15 08:30:00', 'medium'),
+        (user_id, 2, 'completed', 8.2, 'recycling', f'{name}s Office - CBD', '2024-01-14 16:45:00', 'medium'),
+        (user_id, 3, 'in_progress', 0, 'organic', f'{name}s Apartment - Kilimani', '2024-01-16 09:00:00', 'low'),
+        (user_id, 1, 'pending', 0, 'general', f'{name}s Home - Westlands', '2024-01-17 08:00:00', 'high'),
+    ]
+    recycling = [
+        (user_id, 'plastic', 5.2, 'Recycling Center - Westlands', 10.4),
+        (user_id, 'paper', 8.5, 'Recycling Center - CBD', 12.75),
+        (user_id, 'glass', 3.8, 'Recycling Center - Kilimani', 1.9),
+        (user_id, 'electronic', 4.9, 'E-Waste Center', 19.6),
+    ]
+    return collections, recycling
+
+def create_sample_data(users):
+    # users: (user_id, name) pairs. Two executemany calls for any number of users; call inside a transaction.
+    now = _now()
+    collections, recycling = [], []
+    for user_id, name in users:
+        c, r = sample_rows(user_id, name)
+        collections += c
+        recycling += r
+    db_executemany(INSERTS['collections'].format(t='collections'), [(*c, None, now) for c in collections])
+    changes.record('collections', inserted_ids(len(collections)))
+    rollups.collections_added([(c[0], c[2], c[3]) for c in collections])
+    db_executemany(INSERTS['recycling'].format(t='recycling_records'), [(*r, now) for r in recycling])
+    changes.record('recycling', inserted_ids(len(recycling)))
+    rollups.recycling_added([(r[0], r[1], r[2], r[4]) for r in recycling])
+
+class SampleDataQueue:
+    # SAMPLE_DATA=deferred: signups only enqueue; one background thread writes the sample rows of
+    # every user queued since its last tick in a single transaction, off the registration request.
+    def __init__(self, interval=SAMPLE_DATA_INTERVAL):
+        self.interval = interval
+        self._pending = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self.written = self.failures = 0
+
+    def enqueue(self, user_id, name):
+        with self._lock: self._pending.append((user_id, name))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='sample-data-writer', daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def flush(self):
+        with self._lock: batch, self._pending = self._pending, []
+        if not batch: return 0
+        try:
+            with transaction(): create_sample_data(batch)
+        except Exception:
+            self.failures += 1
+            with self._lock: self._pending[:0] = batch
+            raise
+        self.written += len(batch)
+        return len(batch)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try: self.flush()
+            except Exception: log.exception('Sample data write failed; users re-queued for the next tick')
+
+sample_data_queue = SampleDataQueue()
+
+def sample_data(user_id, name, mode=SAMPLE_DATA):
+    # Registration hook, inside the signup transaction.
+    if mode == 'eager': create_sample_data([(user_id, name)])
+    elif mode == 'deferred': after_commit(lambda: sample_data_queue.enqueue(user_id, name))
+
+# Synthetic data: bins cluster around Nairobi neighbourhoods inside the city's bounding box.
+NAIROBI_BBOX = (-1.444, -1.163, 36.650, 37.103)  # min_lat, max_lat, min_lng, max_lng
+AREAS = [('CBD', -1.2864, 36.8172), ('Westlands', -1.2676, 36.8108), ('Kilimani', -1.2921, 36.7868), ('Karen', -1.3197, 36.7073), ('Eastleigh', -1.2741, 36.8516), ('Embakasi', -1.3237, 36.8947), ('Kasarani', -1.2210, 36.8974), ('Langata', -1.3621, 36.7519), ('Kibera', -1.3133, 36.7868), ('Ruaraka', -1.2455, 36.8722)]
+CLUSTERED = 0.8  # share of bins near an area centre; the rest are spread uniformly
+AREA_SPREAD = 0.012  # degrees, about 1.3 km
+BIN_STATUS_P = {'empty': 0.4, 'half': 0.35, 'full': 0.25}
+WASTE_TYPE_P = {'general': 0.55, 'recycling': 0.25, 'organic': 0.2}
+PRIORITY_P = {'low': 0.2, 'medium': 0.6, 'high': 0.2}
+MATERIAL_P = {'plastic': 0.35, 'paper': 0.25, 'glass': 0.15, 'metal': 0.1, 'electronic': 0.05, 'organic': 0.1}
+DRIVER_EVERY = 50
+BIN_EVERY = 10
+COLLECTIONS_PER_USER = 2
+RECYCLING_PER_USER = 2
+OPEN_DAYS = 3  # collections newer than this may still be pending or in progress
+COLLECTION_STATUSES = np.array(['completed', 'pending', 'in_progress'], dtype=object)
+MATERIALS = np.array(list(MATERIAL_P), dtype=object)
+MATERIAL_FACTORS = np.array([IMPACT_FACTORS.get(m, 1.0) for m in MATERIALS])
+TOTAL = np.array(['*'], dtype=object)
+
+def _draw(rng, p, n): return rng.choice(len(p), n, p=list(p.values()))
+
+def _choice(rng, p, n): return np.array(list(p), dtype=object)[_draw(rng, p, n)]
+
+@functools.cache
+def _clock(): return np.array([f' {h:02d}:{m:02d}:{s:02d}' for h in range(24) for m in range(60) for s in range(60)], dtype=object)
+
+def _timestamps(t):
+    # 'YYYY-MM-DD HH:MM:SS' strings: each distinct day is formatted once and joined to a cached time of day.
+    day, second = np.divmod(t.astype('datetime64[s]').astype(np.int64), 86400)
+    days, inverse = np.unique(day, return_inverse=True)
+    return (np.array([str(d) for d in days.astype('datetime64[D]').tolist()], dtype=object)[inverse] + _clock()[second]).tolist()
+
+def _spread(rng, i, n, start, span):
+    # Row i of n gets a time in its own slice of [start, start + span), so ids grow with created_at.
+    return start + ((i + rng.random(len(i))) * (span / n)).astype('timedelta64[s]')
+
+class Tally:
+    # Rollups of generated rows, summed per chunk with np.bincount while they are drawn, so a seed can
+    # write them directly instead of re-scanning every table in rollups.rebuild(). Scopes follow rollups.REBUILD.
+    def __init__(self): self.scopes = {}
+
+    def add(self, scope, keys, codes, weight=None, impact=None):
+        # Row i counts towards keys[codes[i]]; weight and impact are per-row arrays.
+        n = len(keys)
+        sums = np.array([np.bincount(codes, minlength=n), *(np.zeros(n) if w is None else np.bincount(codes, w, n) for w in (weight, impact))], dtype=float)
+        if scope in self.scopes: self.scopes[scope][1] += sums
+        else: self.scopes[scope] = [keys, sums]
+
+    def rows(self):
+        # (scope, key, count, weight, impact) for each key with rows; '*' totals are kept even when empty.
+        for scope, (keys, (count, weight, impact)) in self.scopes.items():
+            hit = (count > 0) | (keys == '*')
+            yield from zip([scope] * int(hit.sum()), keys[hit].tolist(), count[hit].astype(int).tolist(), weight[hit].tolist(), impact[hit].tolist())
+
+def synthetic(users, bins=None, collections=None, recycling=None, days=365, end=None, seed=42, password_hash=None, chunk=CHUNK, tally=None):
+    # entity -> generator of row chunks, for load(). User 1 is demo@takatrack.com (password demo123),
+    # every DRIVER_EVERY-th user is a driver. Each chunk is generated with vectorized NumPy draws.
+    # By default there is a bin per BIN_EVERY users and COLLECTIONS_PER_USER / RECYCLING_PER_USER rows per user.
+    # A Tally, if given, collects the rollups of the rows as they are generated.
+    bins = max(users // BIN_EVERY, 1) if bins is None else bins
+    collections = users * COLLECTIONS_PER_USER if collections is None else collections
+    recycling = users * RECYCLING_PER_USER if recycling is None else recycling
+    if password_hash is None: password_hash = hash_passwords(['demo123'])['demo123']
+    rng = np.random.default_rng(seed)
+    end = np.datetime64(end or _now(), 's')
+    span = int(days * 86400)
+    start = end - np.timedelta64(span, 's')
+    user_keys = np.arange(users + 1).astype(str).astype(object) if tally is not None else None
+
+    def count(*args):
+        if tally is not None: tally.add(*args)
+    count('recycling', TOTAL, np.zeros(0, int))
+    count('bins', TOTAL, np.zeros(0, int))
+
+    def chunks(n, make):
+        for lo in range(0, n, chunk): yield make(np.arange(lo, min(lo + chunk, n)))
+
+    def user_rows(i):
+        created = _timestamps(_spread(rng, i, users, start, span))
+        k = i.astype(str).astype(object)
+        email, name = 'user' + k + '@takatrack.com', 'User ' + k
+        if i[0] == 0: email[0], name[0] = 'demo@takatrack.com', 'Demo User'
+        role = np.where(i % DRIVER_EVERY == 0, 'driver', 'resident').astype(object)
+        return list(zip(email, name, '+2547' + np.char.zfill(i.astype(str), 8).astype(object), role, [password_hash] * len(i), created))
+
+    def bin_rows(i):
+        n = len(i)
+        area = rng.integers(len(AREAS), size=n)
+        centre = np.array([a[1:] for a in AREAS])[area]
+        lat, lng = (centre + rng.normal(0, AREA_SPREAD, (n, 2))).T
+        uniform = rng.random(n) >= CLUSTERED
+        lat[uniform] = rng.uniform(NAIROBI_BBOX[0], NAIROBI_BBOX[1], uniform.sum())
+        lng[uniform] = rng.uniform(NAIROBI_BBOX[2], NAIROBI_BBOX[3], uniform.sum())
+        lat, lng = np.clip(lat, *NAIROBI_BBOX[:2]).round(6), np.clip(lng, *NAIROBI_BBOX[2:]).round(6)
+        count('bins', TOTAL, np.zeros(n, int))
+        return list(zip(lat.tolist(), lng.tolist(), _choice(rng, BIN_STATUS_P, n), _choice(rng, WASTE_TYPE_P, n), _timestamps(_spread(rng, i, bins, start, span))))
+
+    def collection_rows(i):
+        n = len(i)
+        created = _spread(rng, i, collections, start, span)
+        scheduled = created + rng.integers(2 * 3600, 3 * 86400, n).astype('timedelta64[s]')
+        # Old requests are nearly all done; recent ones are still moving through the queue.
+        is_open = (end - created) < np.timedelta64(OPEN_DAYS * 86400, 's')
+        code = np.where(rng.random(n) < np.where(is_open, 0.3, 0.97), 0, np.where(rng.random(n) < 0.7, 1, 2))
+        status, done = COLLECTION_STATUSES[code], code == 0
+        weight = np.where(done, rng.lognormal(np.log(12), 0.5, n).round(1), 0.0)
+        completed = np.where(done, _timestamps(scheduled + rng.integers(600, 8 * 3600, n).astype('timedelta64[s]')), None)
+        area = np.array([a[0] for a in AREAS], dtype=object)[rng.integers(len(AREAS), size=n)]
+        location = [f'{a} Site {k % 997}' for a, k in zip(area, i.tolist())]
+        user_id = rng.integers(1, users + 1, n)
+        count('collection_status', COLLECTION_STATUSES, code)
+        count('driver', user_keys, user_id, weight)
+        return list(zip(user_id.tolist(), rng.integers(1, bins + 1, n).tolist(), status, weight.tolist(), _choice(rng, WASTE_TYPE_P, n), location, _timestamps(scheduled), _choice(rng, PRIORITY_P, n), completed, _timestamps(created)))
+
+    def recycling_rows(i):
+        n = len(i)
+        code = _draw(rng, MATERIAL_P, n)
+        material = MATERIALS[code]
+        weight = rng.lognormal(np.log(4), 0.7, n).round(2)
+        impact = (weight * MATERIAL_FACTORS[code]).round(3)
+        location = np.where(material == 'electronic', 'E-Waste Center', 'Recycling Center - ' + np.array([a[0] for a in AREAS], dtype=object)[rng.integers(len(AREAS), size=n)])
+        user_id = rng.integers(1, users + 1, n)
+        count('recycling', TOTAL, np.zeros(n, int), weight, impact)
+        count('recycling_user', user_keys, user_id, weight, impact)
+        count('recycling_material', MATERIALS, code, weight, impact)
+        return list(zip(user_id.tolist(), material, weight.tolist(), location, impact.tolist(), _timestamps(_spread(rng, i, recycling, start, span))))
+
+    return {'users': chunks(users, user_rows), 'bins': chunks(bins, bin_rows), 'collections': chunks(collections, collection_rows), 'recycling': chunks(recycling, recycling_rows)}
+
+@contextmanager
+def deferred_indexes(tables=TABLES['server'].values()):
+    # Secondary indexes and the bins R*Tree trigger are dropped for the load and rebuilt once at the end:
+    # one sort per index instead of a b-tree insert per row. Use inside the loading transaction.
+    indexes = db_exec(f'SELECT name, sql FROM sqlite_master WHERE type = "index" AND sql IS NOT NULL AND tbl_name IN ({",".join("?" * len(tables))})', list(tables), 2)
+    for name, _ in indexes: db_exec(f'DROP INDEX {name}')
+    db_exec('DROP TRIGGER IF EXISTS waste_bins_rtree_insert')
+    yield
+    for _, sql in indexes: db_exec(sql)
+    for q in spatial.SCHEMA: db_exec(q)
+    spatial.sync_index()
+
+@contextmanager
+def bulk_pragmas(pragmas=SEED_PRAGMAS):
+    # Holds one pooled connection with SEED_PRAGMAS applied and restores its settings afterwards. With
+    # synchronous=OFF a power loss mid-seed can lose the seed, which is simply run again.
+    with connection() as c:
+        saved = {p: c.execute(f'PRAGMA {p}').fetchone()[0] for p in pragmas}
+        for p, v in pragmas.items(): c.execute(f'PRAGMA {p} = {v}')
+        try: yield
+        finally:
+            for p, v in saved.items(): c.execute(f'PRAGMA {p} = {v}')
+
+def seed_synthetic(users, **kwargs):
+    # Replaces server.py's data and rollups with a synthetic set in one transaction.
+    tally = Tally()
+    with bulk_pragmas():
+        with transaction():
+            # Ids restart at 1 so generated foreign keys line up; change_log versions keep growing.
+            clear()
+            with deferred_indexes(): counts = load(synthetic(users, tally=tally, **kwargs))
+            rollups.replace(tally.rows())
+            # One entry per entity moves every ETag past the previous data set's.
+            for entity in TABLES['server']: changes.record(entity, [0], 'delete')
+    return counts
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Seed the server.py database.')
+    p.add_argument('mode', choices=['demo', 'synthetic'])
+    p.add_argument('--users', type=int, default=10000)
+    p.add_argument('--bins', type=int)
+    p.add_argument('--collections', type=int)
+    p.add_argument('--recycling', type=int)
+    p.add_argument('--days', type=float, default=365)
+    p.add_argument('--end', help='newest created_at, "YYYY-MM-DD HH:MM:SS" (default now)')
+    p.add_argument('--seed', type=int, default=42)
+    a = p.parse_args()
+    import server
+    server.init_schema()
+    start = time.perf_counter()
+    if a.mode == 'demo':
+        with transaction(): demo()
+        rollups.rebuild()
+        counts = {'users': len(DEMO_USERS), 'bins': len(DEMO_BINS), 'collections': len(DEMO_COLLECTIONS), 'recycling': len(DEMO_RECYCLING)}
+    else: counts = seed_synthetic(a.users, bins=a.bins, collections=a.collections, recycling=a.recycling, days=a.days, end=a.end, seed=a.seed)
+    print(', '.join(f'{n} {entity}' for entity, n in counts.items()) + f' in {time.perf_counter() - start:.1f}s')
@@ -0,0 +1,154 @@
+from datetime import datetime
+from itertools import islice
+from flask import request
+from sqlalchemy import tuple_
+from models import db, User, WasteBin, Collection, RecyclingRecord
+from metrics import add_rows
+from pagination import PageError
+
+# Read-side serialization for the blueprint models: rows are selected as plain column tuples
+# into __slots__ objects, so list endpoints never hydrate ORM instances or lazy-load relations.
+BATCH = 500
+
+def _iso(value): return value.isoformat() if value is not None else None
+
+class Row:
+    __slots__ = ()
+    model = None
+    fields = ()
+    relation = None  # (attribute, related Row class, foreign key field)
+
+    def __init__(self, values):
+        for name, value in zip(self.fields, values): setattr(self, name, value)
+
+    @classmethod
+    def columns(cls): return [getattr(cls.model, f) for f in cls.fields]
+
+class UserRow(Row):
+    fields = __slots__ = ('id', 'email', 'name', 'phone', 'role')
+    model = User
+
+    def to_dict(self):
+        return {'id': self.id, 'email': self.email, 'name': self.name, 'phone': self.phone, 'role': self.role}
+
+class BinRow(Row):
+    fields = __slots__ = ('id', 'latitude', 'longitude', 'status', 'type', 'created_at')
+    model = WasteBin
+
+    def to_dict(self):
+        return {'id': self.id, 'latitude': self.latitude, 'longitude': self.longitude, 'status': self.status, 'type': self.type, 'lastUpdated': _iso(self.created_at)}
+
+class RecyclingRow(Row):
+    fields = __slots__ = ('id', 'user_id', 'material_type', 'weight', 'location', 'environmental_impact', 'created_at')
+    model = RecyclingRecord
+
+    def to_dict(self):
+        return {'id': self.id, 'material': self.material_type, 'weight': self.weight, 'location': self.location, 'environmental_impact': self.environmental_impact, 'createdAt': _iso(self.created_at)}
+
+class CollectionRow(Row):
+    fields = ('id', 'user_id', 'bin_id', 'status', 'weight', 'waste_type', 'location', 'priority', 'scheduled_date', 'completed_date', 'created_at')
+    __slots__ = fields + ('bin',)
+    model = Collection
+    relation = ('bin', BinRow, 'bin_id')
+
+    def to_dict(self):
+        return {'id': self.id, 'user_id': self.user_id, 'bin_id': self.bin_id, 'status': self.status, 'weight': self.weight, 'waste_type': self.waste_type, 'location': self.location, 'priority': self.priority, 'scheduled_date': _iso(self.scheduled_date), 'completed_date': _iso(self.completed_date), 'created_at': _iso(self.created_at), 'bin': self.bin}
+
+# Load strategy per endpoint. A page (<= MAX_LIMIT rows) is one LEFT JOIN; streams and the change
+# feed load each batch's distinct bins with one IN query instead of repeating bin columns per row.
+ENDPOINTS = {
+    'drivers': (UserRow, None),
+    'bins.list': (BinRow, None),
+    'collections.list': (CollectionRow, 'joined'),
+    'collections.stream': (CollectionRow, 'selectin'),
+    'recycling.list': (RecyclingRow, None),
+    'changes.bins': (BinRow, None),
+    'changes.collections': (CollectionRow, 'selectin'),
+    'changes.recycling': (RecyclingRow, None),
+}
+
+def query(endpoint):
+    row, strategy = ENDPOINTS[endpoint]
+    if strategy != 'joined': return db.session.query(*row.columns())
+    _, related, fk = row.relation
+    return db.session.query(*row.columns(), *related.columns()).select_from(row.model).outerjoin(related.model, getattr(row.model, fk) == related.model.id)
+
+def serialize(endpoint, rows):
+    # Lazily yields dicts, so streamed responses keep working in fixed-size batches.
+    row, strategy = ENDPOINTS[endpoint]
+    load = _plain if strategy is None else _joined if strategy == 'joined' else _selectin
+    return (d for batch in _batches(rows) for d in load(row, batch))
+
+def fetch(endpoint, ids):
+    row, _ = ENDPOINTS[endpoint]
+    return list(serialize(endpoint, query(endpoint).filter(row.model.id.in_(ids))))
+
+def _batches(rows, size=BATCH):
+    it = iter(rows)
+    while batch := list(islice(it, size)):
+        add_rows(len(batch))
+        yield batch
+
+def _plain(row, batch): return (row(values).to_dict() for values in batch)
+
+def _joined(row, batch):
+    # Related dicts are built once per distinct id and shared between the rows that reference them.
+    attr, related, _ = row.relation
+    n, cache = len(row.fields), {}
+    for values in batch:
+        obj, rid = row(values), values[n]
+        if rid not in cache: cache[rid] = related(values[n:]).to_dict() if rid is not None else None
+        setattr(obj, attr, cache[rid])
+        yield obj.to_dict()
+
+def _selectin(row, batch):
+    attr, related, fk = row.relation
+    objs = [row(values) for values in batch]
+    ids = {getattr(o, fk) for o in objs}
+    ids.discard(None)
+    loaded = {r[0]: related(r).to_dict() for r in db.session.query(*related.columns()).filter(related.model.id.in_(ids))} if ids else {}
+    add_rows(len(loaded))
+    for o in objs:
+        setattr(o, attr, loaded.get(getattr(o, fk)))
+        yield o.to_dict()
+
+def _timestamp(value):
+    try: return datetime.fromisoformat(value)
+    except ValueError: raise PageError(f'Invalid timestamp: {value}')
+
+def keyset_filters(model, filters):
+    # SQLAlchemy counterpart of pagination.filter_args; "from"/"to" bound created_at as [from, to).
+    a = request.args
+    where = [col == a[arg] for arg, col in filters.items() if a.get(arg)]
+    if a.get('from'): where.append(model.created_at >= _timestamp(a['from']))
+    if a.get('to'): where.append(model.created_at < _timestamp(a['to']))
+    return where
+
+def _seek(query, model, where, cursor, limit):
+    if cursor: where = [*where, tuple_(model.created_at, model.id) < cursor]
+    query = query.filter(*where).order_by(model.created_at.desc(), model.id.desc())
+    return query.limit(limit + 1) if limit is not None else query
+
+def keyset_query(query, model, filters, cursor, limit):
+    # One keyset page: up to limit + 1 rows after the (created_at, id) cursor.
+    return _seek(query, model, keyset_filters(model, filters), cursor and (_timestamp(cursor[0]), cursor[1]), limit)
+
+def keyset_stream(endpoint, filters, cursor, limit, batch=BATCH):
+    # Serialized rows for a stream of up to limit rows (all when None), read as keyset pages of `batch`
+    # rows like pagination.keyset_stream. The session is closed after each page, so no connection or
+    # read transaction is held while the client drains the response. Filters are checked here, before
+    # the response starts.
+    row, _ = ENDPOINTS[endpoint]
+    where, cursor = keyset_filters(row.model, filters), cursor and (_timestamp(cursor[0]), cursor[1])
+    created = row.fields.index('created_at')
+    def pages(cursor, limit):
+        while limit is None or limit > 0:
+            n = batch if limit is None else min(batch, limit)
+            rows = _seek(query(endpoint), row.model, where, cursor, n).all()
+            out = list(serialize(endpoint, rows[:n]))
+            db.session.close()
+            yield from out
+            if len(rows) <= n: return
+            cursor = (rows[n - 1][created], rows[n - 1][0])
+            if limit is not None: limit -= n
+    return pages(cursor, limit)
@@ -1,82 +1,75 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
-import sqlite3
-import random
+from itertools import islice
 import functools
+from database import db_exec, db_insert, db_executemany, inserted_ids, transaction, after_commit, set_observer, PoolExhausted
+from pagination import PageError, page_args, wants_stream, keyset_sql, keyset_stream, filter_args, page_response, ndjson_response, page_error, NEXT_CURSOR_HEADER
+from stats import dashboard_stats_cache, render_dashboard_stats
+import rollups
+import archive
+import analytics
+import spatial
+import changes
+import events
+import ingest
+import migrations
+import seed
+import routing
+import responses
+import metrics
+from security import TokenSigner, Overloaded, hash_password, check_password, token_cache
+from write_behind import bin_status_queue
+from routes.events import events_blueprint
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'takatrack-secret-key'
-CORS(app)
+CORS(app, expose_headers=[NEXT_CURSOR_HEADER, changes.VERSION_HEADER])
+tokens = TokenSigner(app.config['SECRET_KEY'])
+app.register_blueprint(events_blueprint(tokens.verify, optional=True), url_prefix='/api/events')
+metrics.install(app)
+set_observer(metrics.observe_query)
+metrics.registry.gauge('write_behind_depth', 'Bin status updates waiting to be written.', bin_status_queue.depth)
+metrics.registry.gauge('archived_rows', 'Rows moved to month partitions by the archiver.', lambda: {e: n for e, n in db_exec('SELECT entity, SUM(rows) FROM archive_partitions GROUP BY entity', f=2)})
+metrics.registry.gauge('cache_entries', 'Entries held by in-process caches.', lambda: {'responses': len(responses.body_cache), 'tokens': len(token_cache)})
+responses.install(app)
 
-def db_exec(q, p=None, f=None):
-    c = sqlite3.connect('takatrack.db')
-    r = c.execute(q, p or [])
-    result = r.fetchone() if f == 1 else r.fetchall() if f == 2 else None
-    c.commit(); c.close()
-    return result
+@app.errorhandler(Overloaded)
+def overloaded(e): return jsonify({'message': 'Authentication is busy, retry shortly'}), 503, {'Retry-After': '1'}
 
-def init_db():
+@app.errorhandler(PoolExhausted)
+def pool_exhausted(e): return jsonify({'message': 'Database is busy, retry shortly'}), 503, {'Retry-After': '1'}
+
+def init_schema():
+    # Tables, migrations and the spatial index only; no data and no background threads.
     tables = [
         'CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY AUTOINCREMENT, email TEXT UNIQUE NOT NULL, name TEXT NOT NULL, phone TEXT, role TEXT DEFAULT "resident", password_hash TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
-        'CREATE TABLE IF NOT EXISTS waste_bins (id INTEGER PRIMARY KEY AUTOINCREMENT, latitude REAL NOT NULL, longitude REAL NOT NULL, status TEXT DEFAULT "empty", type TEXT DEFAULT "general", created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+        'CREATE TABLE IF NOT EXISTS waste_bins (id INTEGER PRIMARY KEY AUTOINCREMENT, latitude REAL NOT NULL, longitude REAL NOT NULL, status TEXT DEFAULT "empty", type TEXT DEFAULT "general", created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP)',
         'CREATE TABLE IF NOT EXISTS collections (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, bin_id INTEGER, status TEXT DEFAULT "pending", weight REAL DEFAULT 0, waste_type TEXT DEFAULT "general", location TEXT, scheduled_date TIMESTAMP, priority TEXT DEFAULT "medium", completed_date TIMESTAMP, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
-        'CREATE TABLE IF NOT EXISTS recycling_records (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, material_type TEXT NOT NULL, weight REAL NOT NULL, location TEXT, environmental_impact REAL DEFAULT 0, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)'
+        'CREATE TABLE IF NOT EXISTS recycling_records (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, material_type TEXT NOT NULL, weight REAL NOT NULL, location TEXT, environmental_impact REAL DEFAULT 0, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+        rollups.SCHEMA,
+        *spatial.SCHEMA,
+        *changes.SCHEMA
     ]
     
-    for t in tables: db_exec(t)
-    
-    user_count = db_exec('SELECT COUNT(*) FROM users', f=1)[0]
-    if user_count < 9:
-        # Clear existing data to avoid duplicates
-        db_exec('DELETE FROM users')
-        db_exec('DELETE FROM waste_bins')
-        db_exec('DELETE FROM collections')
-        db_exec('DELETE FROM recycling_records')
-        
-        users = [
-            ('demo@takatrack.com', 'Demo User', '1234567890', 'driver', generate_password_hash('demo123')),
-            ('admin@takatrack.com', 'Admin', '+254756789012', 'admin', generate_password_hash('admin123')),
-            ('james.mwangi@takatrack.com', 'James Mwangi', '+254701234567', 'driver', generate_password_hash('driver123')),
-            ('mary.wanjiku@takatrack.com', 'Mary Wanjiku', '+254712345678', 'driver', generate_password_hash('driver123')),
-            ('peter.kiprotich@takatrack.com', 'Peter Kiprotich', '+254723456789', 'driver', generate_password_hash('driver123')),
-            ('grace.akinyi@takatrack.com', 'Grace Akinyi', '+254734567890', 'driver', generate_password_hash('driver123')),
-            ('samuel.mutua@takatrack.com', 'Samuel Mutua', '+254745678901', 'driver', generate_password_hash('driver123')),
-            ('sarah.njeri@takatrack.com', 'Sarah Njeri', '+254756789012', 'resident', generate_password_hash('resident123')),
-            ('john.kamau@takatrack.com', 'John Kamau', '+254767890123', 'resident', generate_password_hash('resident123'))
-        ]
-        for u in users: db_exec('INSERT INTO users (email, name, phone, role, password_hash) VALUES (?, ?, ?, ?, ?)', u)
-        
-        bins = [(-1.2921, 36.8219, 'full', 'general'), (-1.2865, 36.8235, 'empty', 'recycling'), (-1.2955, 36.8195, 'half', 'organic')]
-        for b in bins: db_exec('INSERT INTO waste_bins (latitude, longitude, status, type) VALUES (?, ?, ?, ?)', b)
-        
-        cols = [
-            (1, 1, 'completed', 15.5, 'general', 'Westlands Shopping Mall', '2024-01-15 09:00:00', 'high'),
-            (1, 2, 'completed', 8.2, 'recycling', 'Sarit Centre', '2024-01-15 10:30:00', 'medium'),
-            (2, 3, 'completed', 12.8, 'general', 'Karen Shopping Centre', '2024-01-15 11:45:00', 'medium'),
-            (1, 1, 'completed', 22.3, 'organic', 'CBD Area', '2024-01-15 14:20:00', 'high'),
-            (2, 2, 'completed', 18.7, 'recycling', 'Kilimani', '2024-01-15 16:15:00', 'medium'),
-            (1, 3, 'completed', 9.4, 'general', 'Yaya Centre', '2024-01-15 17:30:00', 'low'),
-            (2, 1, 'completed', 14.6, 'recycling', 'Junction Mall', '2024-01-15 18:45:00', 'medium'),
-            (1, 2, 'completed', 25.1, 'general', 'Village Market', '2024-01-15 19:20:00', 'high'),
-            (2, 3, 'in_progress', 0, 'recycling', 'Two Rivers Mall', '2024-01-16 08:00:00', 'medium'),
-            (1, 1, 'in_progress', 0, 'general', 'Galleria Mall', '2024-01-16 09:30:00', 'high'),
-            (2, 2, 'pending', 0, 'organic', 'Westgate Mall', '2024-01-16 11:00:00', 'medium'),
-            (1, 3, 'pending', 0, 'recycling', 'The Hub Karen', '2024-01-16 13:30:00', 'low'),
-            (2, 1, 'pending', 0, 'general', 'Prestige Plaza', '2024-01-16 15:00:00', 'medium')
-        ]
-        for c in cols: db_exec('INSERT INTO collections (user_id, bin_id, status, weight, waste_type, location, scheduled_date, priority) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', c)
-        
-        recycling_data = [
-            (1, 'plastic', 5.2, 'Recycling Center', 10.4),
-            (1, 'paper', 8.5, 'Recycling Center', 12.75),
-            (2, 'glass', 3.8, 'Recycling Center', 1.9),
-            (1, 'metal', 2.1, 'Recycling Center', 6.3),
-            (2, 'plastic', 7.3, 'Recycling Center', 14.6),
-            (1, 'electronic', 1.5, 'E-Waste Center', 6.0)
-        ]
-        for r in recycling_data: db_exec('INSERT INTO recycling_records (user_id, material_type, weight, location, environmental_impact) VALUES (?, ?, ?, ?, ?)', r)
+    with transaction():
+        for t in tables: db_exec(t)
+        migrations.migrate()
+        spatial.sync_index()
+
+def init_db():
+    with transaction():
+        init_schema()
+        if seed_db() or not db_exec('SELECT 1 FROM rollups LIMIT 1', f=1): rollups.rebuild()
+    dashboard_stats_cache.invalidate()
+    archive.archiver.start()
+    analytics.exporter.start()
+
+def seed_db():
+    if db_exec('SELECT COUNT(*) FROM users', f=1)[0] < len(seed.DEMO_USERS):
+        seed.demo()
+        return True
+    return False
 
 @app.route('/api/health')
 def health(): return jsonify({'status': 'healthy', 'timestamp': datetime.utcnow().isoformat()})
@@ -87,32 +80,12 @@ def register():
     if not d or not all(k in d for k in ['email', 'password', 'name']): return jsonify({'message': 'Email, password, and name are required'}), 400
     if db_exec('SELECT id FROM users WHERE email = ?', [d['email']], 1): return jsonify({'message': 'Email already registered'}), 400
     
-    # Insert new user
-    db_exec('INSERT INTO users (email, name, phone, role, password_hash) VALUES (?, ?, ?, ?, ?)', [d['email'], d['name'], d.get('phone', ''), d.get('role', 'resident'), generate_password_hash(d['password'])])
-    
-    # Get the new user ID
-    user_id = db_exec('SELECT last_insert_rowid()', f=1)[0]
-    
-    # Create sample collections for the new user
-    sample_collections = [
-        (user_id, 1, 'completed', 15.5, 'general', f'{d["name"]}s Home - Westlands', '2024-01-15 08:30:00', 'medium'),
-        (user_id, 2, 'completed', 8.2, 'recycling', f'{d["name"]}s Office - CBD', '2024-01-14 16:45:00', 'medium'),
-        (user_id, 3, 'in_progress', 0, 'organic', f'{d["name"]}s Apartment - Kilimani', '2024-01-16 09:00:00', 'low'),
-        (user_id, 1, 'pending', 0, 'general', f'{d["name"]}s Home - Westlands', '2024-01-17 08:00:00', 'high')
-    ]
-    for c in sample_collections:
-        db_exec('INSERT INTO collections (user_id, bin_id, status, weight, waste_type, location, scheduled_date, priority) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', c)
-    
-    # Create sample recycling records for the new user
-    sample_recycling = [
-        (user_id, 'plastic', 5.2, 'Recycling Center - Westlands', 10.4),
-        (user_id, 'paper', 8.5, 'Recycling Center - CBD', 12.75),
-        (user_id, 'glass', 3.8, 'Recycling Center - Kilimani', 1.9),
-        (user_id, 'electronic', 4.9, 'E-Waste Center', 19.6)
-    ]
-    for r in sample_recycling:
-        db_exec('INSERT INTO recycling_records (user_id, material_type, weight, location, environmental_impact) VALUES (?, ?, ?, ?, ?)', r)
-    
+    password_hash = hash_password(d['password'])
+    with transaction():
+        if db_exec('SELECT id FROM users WHERE email = ?', [d['email']], 1): return jsonify({'message': 'Email already registered'}), 400
+        user_id = db_insert('INSERT INTO users (email, name, phone, role, password_hash) VALUES (?, ?, ?, ?, ?)', [d['email'], d['name'], d.get('phone', ''), d.get('role', 'resident'), password_hash])
+        changes.record('users', [user_id])
+        seed.sample_data(user_id, d['name'])
     return jsonify({'message': 'User registered successfully with sample data'}), 201
 
 @app.route('/api/auth/login', methods=['POST'])
@@ -120,15 +93,17 @@ def login():
     d = request.get_json()
     if not d or not all(k in d for k in ['email', 'password']): return jsonify({'message': 'Email and password are required'}), 400
     u = db_exec('SELECT id, name, role, password_hash FROM users WHERE email = ?', [d['email']], 1)
-    if not u or not check_password_hash(u[3], d['password']): return jsonify({'message': 'Invalid email or password'}), 401
-    return jsonify({'token': f"token_{u[0]}_{int(datetime.utcnow().timestamp())}", 'user': {'id': u[0], 'email': d['email'], 'name': u[1], 'role': u[2]}})
+    if not u or not check_password(u[3], d['password']): return jsonify({'message': 'Invalid email or password'}), 401
+    return jsonify({'token': tokens.issue({'id': u[0], 'role': u[2]}), 'user': {'id': u[0], 'email': d['email'], 'name': u[1], 'role': u[2]}})
 
 def auth_required(f):
     @functools.wraps(f)
     def decorated_function(*args, **kwargs):
         auth_header = request.headers.get('Authorization')
         if auth_header and auth_header.startswith('Bearer '):
-            # Token exists, proceed (simple validation)
+            # Signature checked once per token, then served from the token cache
+            g.user = tokens.verify(auth_header[7:])
+            if g.user is None: return jsonify({'message': 'Invalid token'}), 401
             return f(*args, **kwargs)
         elif not auth_header:
             # No auth header, proceed anyway for demo
@@ -139,67 +114,218 @@ def auth_required(f):
 
 @app.route('/api/dashboard/stats')
 @auth_required
-def dashboard_stats():
-    s = {'totalBins': db_exec('SELECT COUNT(*) FROM waste_bins', f=1)[0], 'completed': db_exec('SELECT COUNT(*) FROM collections WHERE status = "completed"', f=1)[0], 'pending': db_exec('SELECT COUNT(*) FROM collections WHERE status = "pending"', f=1)[0], 'inProgress': db_exec('SELECT COUNT(*) FROM collections WHERE status = "in_progress"', f=1)[0], 'recycledWeight': round(db_exec('SELECT COALESCE(SUM(weight), 0) FROM recycling_records', f=1)[0], 1)}
-    return jsonify({**s, 'collectedToday': s['completed'], 'pendingCollections': s['pending'], 'activeDrivers': 3})
+@changes.versioned(*changes.ENTITIES)
+def dashboard_stats(): return jsonify(render_dashboard_stats(dashboard_stats_cache.get(g.change_version)))
 
 @app.route('/api/notifications')
 @auth_required
 def notifications(): return jsonify([{'id': 1, 'title': 'Collection Completed', 'message': 'Your waste collection completed.', 'type': 'success', 'time': '10:30'}, {'id': 2, 'title': 'Bin Full Alert', 'message': 'Bin #123 is full.', 'type': 'warning', 'time': '09:15'}])
 
 @app.route('/api/waste/bins')
+@changes.versioned('bins', generation=bin_status_queue.generation)
 def waste_bins():
-    bins = db_exec('SELECT id, latitude, longitude, status, type FROM waste_bins', f=2)
-    return jsonify([{'id': b[0], 'latitude': b[1], 'longitude': b[2], 'status': random.choice(['empty', 'half', 'full']) if random.random() < 0.1 else b[3], 'type': b[4], 'lastUpdated': datetime.utcnow().isoformat()} for b in bins])
+    try: hits = spatial.query_bins(request.args)
+    except ValueError: return jsonify({'message': spatial.QUERY_HELP}), 400
+    return jsonify([bin_row(b, dist) for b, dist in hits])
+
+def bin_row(b, distance=None):
+    r = {'id': b[0], 'latitude': b[1], 'longitude': b[2], 'status': bin_status_queue.status(b[0], b[3]), 'type': b[4], 'lastUpdated': b[5]}
+    if distance is not None: r['distance'] = round(distance, 1)
+    return r
+
+COLLECTION_SELECT = 'SELECT c.id, c.user_id, c.bin_id, c.status, c.weight, c.waste_type, c.location, c.scheduled_date, c.priority, c.completed_date, c.created_at, b.latitude, b.longitude, b.type FROM collections c LEFT JOIN waste_bins b ON c.bin_id = b.id'
+
+def collection_key(c): return c[10], c[0]
+
+def collection_row(c): return {'id': c[0], 'user_id': c[1], 'bin_id': c[2], 'status': c[3], 'weight': c[4], 'waste_type': c[5] or 'general', 'location': c[6] or 'Unknown', 'scheduled_date': c[7], 'priority': c[8] or 'medium', 'completed_date': c[9], 'created_at': c[10], 'bin': {'id': c[2], 'latitude': c[11] or -1.2921, 'longitude': c[12] or 36.8219, 'type': c[13] or c[5] or 'general'} if c[11] else None}
+
+RECYCLING_SELECT = 'SELECT id, material_type, weight, location, environmental_impact, created_at FROM recycling_records'
+
+def recycling_key(r): return r[5], r[0]
+
+def recycling_row(r): return {'id': r[0], 'material': r[1], 'weight': r[2], 'location': r[3] or 'Recycling Center', 'environmental_impact': r[4], 'createdAt': r[5]}
 
 @app.route('/api/waste/collections', methods=['GET', 'POST'])
+@changes.versioned('collections', 'bins')
 def collections():
     if request.method == 'GET':
-        cols = db_exec('SELECT c.id, c.user_id, c.bin_id, c.status, c.weight, c.waste_type, c.location, c.scheduled_date, c.priority, c.completed_date, c.created_at, b.latitude, b.longitude, b.type FROM collections c LEFT JOIN waste_bins b ON c.bin_id = b.id ORDER BY c.created_at DESC', f=2)
-        return jsonify([{'id': c[0], 'user_id': c[1], 'bin_id': c[2], 'status': c[3], 'weight': c[4], 'waste_type': c[5] or 'general', 'location': c[6] or 'Unknown', 'scheduled_date': c[7], 'priority': c[8] or 'medium', 'completed_date': c[9], 'created_at': c[10], 'bin': {'id': c[2], 'latitude': c[11] or -1.2921, 'longitude': c[12] or 36.8219, 'type': c[13] or c[5] or 'general'} if c[11] else None} for c in cols])
+        try:
+            streaming = wants_stream(); limit, cursor = page_args(streaming)
+        except PageError as e: return page_error(e)
+        where, params = filter_args({'status': 'status', 'user_id': 'user_id'}, 'c.')
+        if archive.requested(): rows = archive.history('collections', COLLECTION_SELECT, where, params, cursor, limit, collection_key, 'c.')
+        elif streaming: rows = keyset_stream(COLLECTION_SELECT, where, params, cursor, limit, collection_key, 'c.')
+        else: rows = db_exec(*keyset_sql(COLLECTION_SELECT, where, params, cursor, limit, 'c.'), 2)
+        if streaming: return ndjson_response(collection_row(c) for c in islice(rows, limit))
+        return page_response([collection_row(c) for c in rows], limit, lambda c: (c['created_at'], c['id']))
     else:
         d = request.get_json()
         if not d or not d.get('location'): return jsonify({'message': 'Location is required'}), 400
         wt = d.get('wasteType', 'general')
-        br = db_exec('SELECT id FROM waste_bins WHERE type = ? LIMIT 1', [wt], 1)
-        if not br: db_exec('INSERT INTO waste_bins (latitude, longitude, status, type) VALUES (?, ?, ?, ?)', (-1.2921, 36.8219, 'pending', wt)); bid = db_exec('SELECT last_insert_rowid()', f=1)[0]
-        else: bid = br[0]
-        db_exec('INSERT INTO collections (user_id, bin_id, status, weight, waste_type, location, scheduled_date, priority) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (1, bid, 'pending', 0, wt, d.get('location'), d.get('scheduledDate'), d.get('priority', 'medium')))
-        cid = db_exec('SELECT last_insert_rowid()', f=1)[0]
-        return jsonify({'message': 'Collection scheduled successfully', 'collection': {'id': cid, 'user_id': 1, 'bin_id': bid, 'status': 'pending', 'weight': 0, 'waste_type': wt, 'location': d.get('location'), 'scheduled_date': d.get('scheduledDate'), 'priority': d.get('priority', 'medium'), 'created_at': datetime.utcnow().isoformat()}}), 201
+        with transaction():
+            br = db_exec('SELECT id FROM waste_bins WHERE type = ? LIMIT 1', [wt], 1)
+            bid = br[0] if br else db_insert('INSERT INTO waste_bins (latitude, longitude, status, type) VALUES (?, ?, ?, ?)', (-1.2921, 36.8219, 'pending', wt))
+            cid = db_insert('INSERT INTO collections (user_id, bin_id, status, weight, waste_type, location, scheduled_date, priority) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (1, bid, 'pending', 0, wt, d.get('location'), d.get('scheduledDate'), d.get('priority', 'medium')))
+            rollups.collections_added([(1, 'pending', 0)])
+            changes.record('collections', [cid])
+            if not br: rollups.bins_added(); changes.record('bins', [bid])
+            col = {'id': cid, 'user_id': 1, 'bin_id': bid, 'status': 'pending', 'weight': 0, 'waste_type': wt, 'location': d.get('location'), 'scheduled_date': d.get('scheduledDate'), 'priority': d.get('priority', 'medium'), 'created_at': datetime.utcnow().isoformat()}
+            after_commit(lambda: events.publish('collections', 'collection.created', col))
+            if not br: after_commit(lambda: events.publish('bins', 'bin.created', {'id': bid, 'latitude': -1.2921, 'longitude': 36.8219, 'status': 'pending', 'type': wt}))
+        return jsonify({'message': 'Collection scheduled successfully', 'collection': col}), 201
 
 @app.route('/api/waste/collections/<int:cid>', methods=['PUT'])
 def update_collection(cid):
     d = request.get_json()
     if not d or 'status' not in d: return jsonify({'message': 'Status is required'}), 400
-    if not db_exec('UPDATE collections SET status = ? WHERE id = ?', [d['status'], cid]): return jsonify({'message': 'Collection not found'}), 404
+    with transaction():
+        row = db_exec('SELECT status, user_id, weight FROM collections WHERE id = ?', [cid], 1)
+        if not row: return jsonify({'message': 'Collection not found'}), 404
+        db_exec('UPDATE collections SET status = ? WHERE id = ?', [d['status'], cid])
+        rollups.collection_status_changed(row[1], row[0], d['status'], row[2])
+        changes.record('collections', [cid])
+        after_commit(lambda: events.publish('collections', 'collection.status', {'id': cid, 'status': d['status'], 'previous': row[0]}))
     return jsonify({'message': 'Collection updated successfully'})
 
 @app.route('/api/recycling/records', methods=['GET', 'POST'])
+@changes.versioned('recycling')
 def recycling_records():
     if request.method == 'GET':
-        recs = db_exec('SELECT id, material_type, weight, location, environmental_impact, created_at FROM recycling_records ORDER BY created_at DESC', f=2)
-        return jsonify([{'id': r[0], 'material': r[1], 'weight': r[2], 'location': r[3] or 'Recycling Center', 'environmental_impact': r[4], 'createdAt': r[5]} for r in recs])
+        try:
+            streaming = wants_stream(); limit, cursor = page_args(streaming)
+        except PageError as e: return page_error(e)
+        where, params = filter_args({'user_id': 'user_id', 'material': 'material_type'})
+        if archive.requested(): rows = archive.history('recycling', RECYCLING_SELECT, where, params, cursor, limit, recycling_key)
+        elif streaming: rows = keyset_stream(RECYCLING_SELECT, where, params, cursor, limit, recycling_key)
+        else: rows = db_exec(*keyset_sql(RECYCLING_SELECT, where, params, cursor, limit), 2)
+        if streaming: return ndjson_response(recycling_row(r) for r in islice(rows, limit))
+        return page_response([recycling_row(r) for r in rows], limit, lambda r: (r['createdAt'], r['id']))
     else:
         d = request.get_json()
         if not d or not d.get('material') or not d.get('weight'): return jsonify({'message': 'Material and weight are required'}), 400
-        m, w = d['material'].lower(), float(d['weight'])
-        ei = w * {'plastic': 2.0, 'paper': 1.5, 'glass': 0.5, 'metal': 3.0, 'electronic': 4.0}.get(m, 1.0)
-        loc = d.get('location', 'Recycling Center')
-        db_exec('INSERT INTO recycling_records (user_id, material_type, weight, location, environmental_impact) VALUES (?, ?, ?, ?, ?)', (1, m, w, loc, ei))
-        rid = db_exec('SELECT last_insert_rowid()', f=1)[0]
-        return jsonify({'message': 'Recycling record added successfully', 'record': {'id': rid, 'material': m, 'weight': w, 'location': loc, 'environmental_impact': ei, 'createdAt': datetime.utcnow().isoformat()}}), 201
+        try: _, m, w, loc = ingest.recycling_row(d, 1)
+        except ValueError as e: return jsonify({'message': str(e)}), 400
+        ei = w * ingest.IMPACT_FACTORS.get(m, 1.0)
+        created_at = datetime.utcnow().isoformat()
+        with transaction():
+            rid = db_insert('INSERT INTO recycling_records (user_id, material_type, weight, location, environmental_impact) VALUES (?, ?, ?, ?, ?)', (1, m, w, loc, ei))
+            rollups.recycling_added([(1, m, w, ei)])
+            changes.record('recycling', [rid])
+            after_commit(lambda: events.publish('recycling', 'recycling.created', recycling_row((rid, m, w, loc, ei, created_at))))
+        return jsonify({'message': 'Recycling record added successfully', 'record': recycling_row((rid, m, w, loc, ei, created_at))}), 201
+
+@app.route('/api/recycling/records/bulk', methods=['POST'])
+def recycling_records_bulk():
+    try: rows, errors = ingest.validate(ingest.recycling_row, 1)
+    except ingest.IngestError as e: return jsonify({'message': str(e)}), 400
+    results = list(errors)
+    if rows:
+        user_ids, materials, weights, locations = zip(*(r for _, r in rows))
+        impacts = ingest.environmental_impacts(materials, weights)
+        batch = list(zip(user_ids, materials, weights, locations, impacts))
+        with transaction():
+            db_executemany('INSERT INTO recycling_records (user_id, material_type, weight, location, environmental_impact) VALUES (?, ?, ?, ?, ?)', batch)
+            ids = inserted_ids(len(batch))
+            rollups.recycling_added([(u, m, w, ei) for u, m, w, _, ei in batch])
+            changes.record('recycling', ids)
+            after_commit(lambda: events.publish('recycling', 'recycling.bulk', {'count': len(ids), 'firstId': ids[0], 'lastId': ids[-1]}))
+        results += [{'index': i, 'id': rid, 'environmental_impact': ei} for (i, _), rid, ei in zip(rows, ids, impacts)]
+    results.sort(key=lambda r: r['index'])
+    return jsonify({'inserted': len(rows), 'failed': len(errors), 'results': results}), 201 if rows else 400
+
+@app.route('/api/waste/bins/telemetry', methods=['POST'])
+def bin_telemetry():
+    try: readings, errors = ingest.validate(ingest.bin_reading)
+    except ingest.IngestError as e: return jsonify({'message': str(e)}), 400
+    results = list(errors)
+    ids = list({bin_id for _, (bin_id, _) in readings})
+    known = set()
+    for chunk in ingest.chunks(ids): known.update(r[0] for r in db_exec(f'SELECT id FROM waste_bins WHERE id IN ({",".join("?" * len(chunk))})', chunk, 2))
+    accepted = [(i, r) for i, r in readings if r[0] in known]
+    bin_status_queue.enqueue(r for _, r in accepted)
+    results += [{'index': i, 'bin_id': bin_id, 'status': status} if bin_id in known else {'index': i, 'bin_id': bin_id, 'error': 'Bin not found'} for i, (bin_id, status) in readings]
+    results.sort(key=lambda r: r['index'])
+    return jsonify({'accepted': len(accepted), 'failed': len(results) - len(accepted), 'queueDepth': bin_status_queue.depth(), 'results': results}), 202 if readings else 400
+
+@app.route('/api/waste/bins/telemetry/queue')
+def bin_telemetry_queue(): return jsonify(bin_status_queue.metrics())
 
 @app.route('/api/recycling/stats')
+@changes.versioned('recycling')
 def recycling_stats():
-    r = db_exec('SELECT SUM(weight), SUM(environmental_impact) FROM recycling_records', f=1)
-    tw, cs = r[0] or 0, r[1] or 0
+    _, tw, cs = rollups.get('recycling')
     return jsonify({'totalWeight': round(tw, 2), 'carbonSaved': round(cs, 2), 'treesEquivalent': int(cs * 0.02)})
 
+@app.route('/api/archive')
+@auth_required
+@changes.versioned('collections', 'recycling')
+def archive_status():
+    # History outside the hot tables: partitions per month, their pre-summarized totals and the archiver's counters.
+    scopes = {'collections': 'collection_status', 'recycling': 'recycling'}
+    months = {(e, m): {'entity': e, 'month': m, 'table': t, 'rows': n} for e, m, t, n in archive.partitions()}
+    for e, scope in scopes.items():
+        for m, count, weight, impact in db_exec('SELECT month, SUM(count), SUM(weight), SUM(impact) FROM archive_totals WHERE scope = ? GROUP BY month', [scope], 2):
+            if (e, m) in months: months[(e, m)]['totals'] = {'count': count, 'weight': round(weight, 2), 'impact': round(impact, 2)}
+    return jsonify({'partitions': list(months.values()), 'archiver': archive.archiver.metrics()})
+
+@app.route('/api/analytics/<dataset>')
+@auth_required
+@changes.conditional(lambda: analytics.store.version(request.view_args['dataset']))
+def analytics_report(dataset):
+    # Reads the latest columnar export only; the database is not queried.
+    if dataset not in analytics.DATASETS: return jsonify({'message': f'dataset must be one of {", ".join(analytics.DATASETS)}'}), 404
+    frame = analytics.store.get(dataset)
+    if frame is None: return jsonify({'message': 'No export yet, POST /api/analytics/export'}), 409
+    try: return jsonify({'snapshot': frame.meta, 'groups': analytics.aggregate(frame, *analytics.query_args(dataset, request.args))})
+    except analytics.QueryError as e: return jsonify({'message': str(e)}), 400
+
+@app.route('/api/analytics/export', methods=['POST'])
+@auth_required
+def analytics_export(): return jsonify(analytics.exporter.run())
+
+DRIVERS_SELECT = 'SELECT u.id, u.name, u.phone, u.email, COALESCE(r.count, 0), COALESCE(r.weight, 0) FROM users u LEFT JOIN rollups r ON r.scope = "driver" AND r.key = CAST(u.id AS TEXT) WHERE u.role="driver" ORDER BY u.name'
+
 @app.route('/api/drivers')
 @auth_required
+@changes.versioned('collections', 'users')
 def get_drivers():
-    drivers = db_exec('SELECT u.id, u.name, u.phone, u.email, COUNT(c.id), COALESCE(SUM(CASE WHEN c.status="completed" THEN c.weight ELSE 0 END), 0) FROM users u LEFT JOIN collections c ON u.id = c.user_id WHERE u.role="driver" GROUP BY u.id ORDER BY u.name', f=2)
+    drivers = db_exec(DRIVERS_SELECT, f=2)
     return jsonify([{'id': d[0], 'name': d[1], 'phone': d[2], 'email': d[3], 'activeCollections': d[4], 'totalCollected': round(d[5], 2), 'status': 'active' if d[4] > 0 else 'available'} for d in drivers])
 
+PENDING_STOPS = 'SELECT c.id, c.bin_id, c.priority, c.scheduled_date, b.latitude, b.longitude, b.status FROM collections c JOIN waste_bins b ON b.id = c.bin_id WHERE c.status = "pending"'
+
+def plan_generation():
+    # Pending telemetry plus the overdue window, which the view reads back from g so the plan it builds
+    # matches the ETag it is cached under.
+    g.overdue_window = routing.overdue_window()
+    pending = bin_status_queue.generation()
+    return str(g.overdue_window) if pending is None else f'{g.overdue_window}.{pending}'
+
+@app.route('/api/routes/plan')
+@auth_required
+@changes.versioned('collections', 'bins', 'users', generation=plan_generation)
+def route_plan():
+    try: depot, capacity, only = routing.parse_args(request.args)
+    except routing.PlanError as e: return jsonify({'message': str(e)}), 400
+    now = routing.window_start(g.overdue_window)
+    stops = [{'collection_id': r[0], 'bin_id': r[1], 'priority': r[2] or 'medium', 'overdue': bool(r[3]) and r[3] < now, 'latitude': r[4], 'longitude': r[5], 'bin_status': bin_status_queue.status(r[1], r[6])} for r in db_exec(PENDING_STOPS, f=2)]
+    drivers = [{'id': d[0], 'name': d[1]} for d in db_exec(DRIVERS_SELECT, f=2) if only is None or d[0] in only]
+    try: return jsonify({'depot': {'latitude': depot[0], 'longitude': depot[1]}, 'capacityKg': capacity, **routing.plan(stops, drivers, depot, capacity)})
+    except routing.PlanError as e: return jsonify({'message': str(e)}), 400
+
+def _in(ids): return ','.join('?' * len(ids))
+
+FEED_FETCHERS = {
+    'bins': lambda ids: [bin_row(b) for b in db_exec(f'SELECT {spatial.BIN_COLUMNS} FROM waste_bins b WHERE b.id IN ({_in(ids)})', ids, 2)],
+    'collections': lambda ids: [collection_row(c) for c in db_exec(f'{COLLECTION_SELECT} WHERE c.id IN ({_in(ids)})', ids, 2)],
+    'recycling': lambda ids: [recycling_row(r) for r in db_exec(f'{RECYCLING_SELECT} WHERE id IN ({_in(ids)})', ids, 2)],
+}
+
+@app.route('/api/changes')
+def change_feed():
+    try: since, entities = changes.feed_args()
+    except ValueError as e: return jsonify({'message': str(e)}), 400
+    overlay = bin_status_queue.generation if 'bins' in entities else None
+    return changes.versioned(*entities, generation=overlay)(lambda: jsonify(changes.feed(since, entities, FEED_FETCHERS)))()
+
 if __name__ == '__main__': init_db(); app.run(debug=True, host='0.0.0.0', port=5003)
\ No newline at end of file
@@ -0,0 +1,83 @@
+import math
+from database import db_exec
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = 111320.0
+KNN_START_RADIUS_M = 500
+KNN_MAX_RADIUS_M = 100000
+
+# R*Tree over bin coordinates, kept in sync with waste_bins by triggers so every write path is covered.
+SCHEMA = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS waste_bins_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng)',
+    'CREATE TRIGGER IF NOT EXISTS waste_bins_rtree_insert AFTER INSERT ON waste_bins BEGIN INSERT INTO waste_bins_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude); END',
+    'CREATE TRIGGER IF NOT EXISTS waste_bins_rtree_update AFTER UPDATE OF latitude, longitude ON waste_bins BEGIN UPDATE waste_bins_rtree SET min_lat = new.latitude, max_lat = new.latitude, min_lng = new.longitude, max_lng = new.longitude WHERE id = new.id; END',
+    'CREATE TRIGGER IF NOT EXISTS waste_bins_rtree_delete AFTER DELETE ON waste_bins BEGIN DELETE FROM waste_bins_rtree WHERE id = old.id; END',
+]
+
+BIN_COLUMNS = 'b.id, b.latitude, b.longitude, b.status, b.type, COALESCE(b.updated_at, b.created_at)'
+
+def sync_index():
+    # Backfills bins written before the index (or its triggers) existed.
+    db_exec('INSERT OR REPLACE INTO waste_bins_rtree SELECT id, latitude, latitude, longitude, longitude FROM waste_bins WHERE id NOT IN (SELECT id FROM waste_bins_rtree)')
+
+def haversine(lat1, lng1, lat2, lng2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+def radius_bbox(lat, lng, radius_m):
+    dlat = radius_m / METERS_PER_DEGREE
+    dlng = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    return lat - dlat, lng - dlng, lat + dlat, lng + dlng
+
+def parse_query(args):
+    # ('bbox', (min_lat, min_lng, max_lat, max_lng)) | ('radius', (lat, lng, meters)) | ('nearest', (lat, lng, k)) | None
+    if args.get('bbox'):
+        min_lng, min_lat, max_lng, max_lat = map(float, args['bbox'].split(','))
+        return 'bbox', (min_lat, min_lng, max_lat, max_lng)
+    if args.get('lat') and args.get('lng'):
+        lat, lng = float(args['lat']), float(args['lng'])
+        if args.get('k'):
+            k = int(args['k'])
+            if k < 1: raise ValueError('k must be positive')
+            return 'nearest', (lat, lng, k)
+        if args.get('radius'):
+            radius = float(args['radius'])
+            if radius <= 0: raise ValueError('radius must be positive')
+            return 'radius', (lat, lng, radius)
+    return None
+
+QUERY_HELP = 'Use bbox=minLng,minLat,maxLng,maxLat or lat, lng with radius (m) or k'
+
+def within_radius(in_bbox, coords, lat, lng, radius_m):
+    # (row, distance) pairs sorted by distance; in_bbox narrows candidates, haversine makes it exact.
+    hits = ((b, haversine(lat, lng, *coords(b))) for b in in_bbox(*radius_bbox(lat, lng, radius_m)))
+    return sorted((h for h in hits if h[1] <= radius_m), key=lambda h: h[1])
+
+def nearest(in_bbox, coords, lat, lng, k):
+    # Widen the search circle until it holds k bins; everything inside a circle is nearer than anything outside it.
+    radius = KNN_START_RADIUS_M
+    while True:
+        hits = within_radius(in_bbox, coords, lat, lng, radius)
+        if len(hits) >= k or radius >= KNN_MAX_RADIUS_M: return hits[:k]
+        radius *= 4
+
+BBOX_QUERY = f'SELECT {BIN_COLUMNS} FROM waste_bins_rtree r JOIN waste_bins b ON b.id = r.id WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lng >= ? AND r.min_lng <= ? AND b.latitude BETWEEN ? AND ? AND b.longitude BETWEEN ? AND ?'
+
+def bins_in_bbox(min_lat, min_lng, max_lat, max_lng):
+    # The R*Tree stores 32-bit floats rounded outwards, so re-check the exact coordinates.
+    return db_exec(BBOX_QUERY, [min_lat, max_lat, min_lng, max_lng, min_lat, max_lat, min_lng, max_lng], 2)
+
+def _row_coords(b): return b[1], b[2]
+
+def bins_within_radius(lat, lng, radius_m): return within_radius(bins_in_bbox, _row_coords, lat, lng, radius_m)
+
+def nearest_bins(lat, lng, k): return nearest(bins_in_bbox, _row_coords, lat, lng, k)
+
+def query_bins(args):
+    # (row, distance or None) pairs for the spatial query in args, or every bin when there is none.
+    q = parse_query(args)
+    if q is None: return [(b, None) for b in db_exec(f'SELECT {BIN_COLUMNS} FROM waste_bins b', f=2)]
+    kind, params = q
+    if kind == 'bbox': return [(b, None) for b in bins_in_bbox(*params)]
+    return bins_within_radius(*params) if kind == 'radius' else nearest_bins(*params)
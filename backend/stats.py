@@ -0,0 +1,39 @@
+import os
+import threading
+import time
+from database import db_exec
+import changes
+
+STATS_TTL = float(os.environ.get('STATS_CACHE_TTL', 30))
+
+class StatsCache:
+    # Holds one dict of counters tagged with the change_log version it was read at. A reader that has
+    # seen a newer version reloads it, so a write shows up on the first read after its commit.
+    def __init__(self, loader, ttl=STATS_TTL):
+        # loader(version) -> (version, counters). The version is read before the counters so they are never
+        # older than it; a caller that already read it (the ETag decorator) passes it in, 0 means read it.
+        self.loader, self.ttl = loader, ttl
+        self._version, self._value, self._expires = 0, None, 0
+        self._lock = threading.Lock()
+
+    def get(self, version=0):
+        with self._lock:
+            if self._value is None or version > self._version or time.monotonic() >= self._expires:
+                self._version, self._value = self.loader(version)
+                self._expires = time.monotonic() + self.ttl
+            return dict(self._value)
+
+    def invalidate(self):
+        with self._lock: self._value = None
+
+def load_dashboard_stats(version=0):
+    # Every counter is a primary-key lookup into the rollups table maintained by rollups.py.
+    version = version or changes.current_version()
+    r = db_exec('SELECT (SELECT count FROM rollups WHERE scope = "bins" AND key = "*"), (SELECT count FROM rollups WHERE scope = "collection_status" AND key = "completed"), (SELECT count FROM rollups WHERE scope = "collection_status" AND key = "pending"), (SELECT count FROM rollups WHERE scope = "collection_status" AND key = "in_progress"), (SELECT weight FROM rollups WHERE scope = "recycling" AND key = "*")', f=1)
+    return version, {'totalBins': r[0] or 0, 'completed': r[1] or 0, 'pending': r[2] or 0, 'inProgress': r[3] or 0, 'recycledWeight': r[4] or 0}
+
+def render_dashboard_stats(s):
+    s = {**s, 'recycledWeight': round(s['recycledWeight'], 1)}
+    return {**s, 'collectedToday': s['completed'], 'pendingCollections': s['pending'], 'activeDrivers': 3}
+
+dashboard_stats_cache = StatsCache(load_dashboard_stats)
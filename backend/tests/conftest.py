@@ -0,0 +1,59 @@
+import os
+import tempfile
+
+# Background threads stay off so every test decides when archiving, exports and flushes happen.
+os.environ.update(ARCHIVE_INTERVAL='0', ANALYTICS_EXPORT_INTERVAL='0', WRITE_BEHIND_INTERVAL='3600', AUTH_HASH_POOL='0', METRICS='0')
+# app.py binds its engine at import, so the blueprint app gets one scratch file recreated per test.
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'app.db')
+os.environ['ANALYTICS_DIR'] = tempfile.mkdtemp()
+
+import functools
+import pytest
+import database
+import seed
+
+# Each test seeds a fresh database; the demo passwords only need hashing once per session.
+_hashed = functools.cache(seed.hash_passwords)
+seed.hash_passwords = lambda passwords: _hashed(frozenset(passwords))
+
+@pytest.fixture
+def pool(tmp_path):
+    p = database.configure(str(tmp_path / 'test.db'), size=2, timeout=0.2)
+    yield p
+    p.close_all()
+
+@pytest.fixture
+def server(pool):
+    # A freshly seeded server.py database with empty in-process caches.
+    import server, responses, stats, security
+    responses.body_cache.clear()
+    security.token_cache.clear()
+    stats.dashboard_stats_cache.invalidate()
+    server.init_db()
+    yield server
+    server.bin_status_queue.flush()
+    responses.body_cache.clear()
+
+@pytest.fixture
+def client(server): return server.app.test_client()
+
+@pytest.fixture
+def jwt_app(monkeypatch):
+    # app.py (the SQLAlchemy blueprints behind JWT auth) on freshly created tables. Its demo users get a
+    # single-iteration hash, which keeps seeding and the fixture's login fast.
+    import app, models, responses, security
+    monkeypatch.setattr(app, 'generate_password_hash', functools.partial(app.generate_password_hash, method='pbkdf2:sha256:1'))
+    responses.body_cache.clear()
+    security.jwt_cache.clear()
+    with app.app.app_context(): models.db.drop_all()
+    app.init_db()
+    yield app.app
+    responses.body_cache.clear()
+
+@pytest.fixture
+def jwt_client(jwt_app):
+    # Signed in as the demo user.
+    c = jwt_app.test_client()
+    token = c.post('/api/auth/login', json={'email': 'demo@takatrack.com', 'password': 'demo123'}).get_json()['token']
+    c.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    return c
@@ -0,0 +1,60 @@
+import pytest
+import analytics
+import archive
+import seed
+from analytics import QueryError, aggregate, query_args
+from database import db_exec
+
+@pytest.fixture
+def history(server, tmp_path):
+    # Synthetic history with the older months moved into archive partitions, exported to tmp_path.
+    seed.seed_synthetic(200, bins=20, collections=800, recycling=800, days=400, end='2024-06-30 00:00:00')
+    archive.archiver.run()
+    assert archive.partitions()
+    for dataset in analytics.DATASETS: analytics.export(dataset, directory=str(tmp_path))
+    store = analytics.Store(str(tmp_path))
+    return {dataset: store.get(dataset) for dataset in analytics.DATASETS}
+
+def rollup(scope):
+    return {key: (count, round(weight, 3), round(impact, 3)) for key, count, weight, impact in db_exec('SELECT key, count, weight, impact FROM rollups WHERE scope = ?', [scope], 2)}
+
+def test_recycling_groups_match_the_rollups(history):
+    by_material = {r['material']: (r['count'], r['weight'], r['impact']) for r in aggregate(history['recycling'], ['material'])}
+    assert by_material == pytest.approx(rollup('recycling_material'))
+    by_user = {str(r['user_id']): (r['count'], r['weight'], r['impact']) for r in aggregate(history['recycling'], ['user_id'])}
+    assert by_user == pytest.approx(rollup('recycling_user'))
+    [total] = aggregate(history['recycling'], [])
+    assert (total['count'], total['weight'], total['impact']) == pytest.approx(rollup('recycling')['*'])
+
+def test_collection_groups_match_the_rollups(history):
+    by_status = {r['status']: r['count'] for r in aggregate(history['collections'], ['status'])}
+    assert by_status == {k: v[0] for k, v in rollup('collection_status').items()}
+
+def test_filters_and_time_buckets_match_sql(history):
+    tables = ' UNION ALL '.join(f'SELECT material_type, weight, created_at FROM {t}' for t in ['recycling_records', *(p[2] for p in archive.partitions('recycling'))])
+    expected = {m: (n, round(w, 3)) for m, n, w in db_exec(f'SELECT strftime("%Y-%m", created_at), COUNT(*), SUM(weight) FROM ({tables}) WHERE material_type = "glass" AND created_at >= "2024-01-01" AND created_at < "2024-04-01" GROUP BY 1', f=2)}
+    rows = aggregate(history['recycling'], ['month'], {'material': 'glass'}, '2024-01-01', '2024-04-01')
+    assert {r['month']: (r['count'], r['weight']) for r in rows} == pytest.approx(expected)
+    assert len(expected) == 3
+
+@pytest.mark.parametrize('args', [{'group_by': 'nope'}, {'group_by': 'material,material'}, {'group_by': 'id'}, {'user_id': 'x'}, {'from': 'yesterday'}])
+def test_bad_queries_are_rejected(args):
+    with pytest.raises(QueryError): query_args('recycling', args)
+
+def test_report_endpoint(client):
+    assert client.get('/api/analytics/recycling').status_code in (200, 409)
+    client.post('/api/analytics/export')
+    r = client.get('/api/analytics/recycling?group_by=material')
+    assert r.status_code == 200 and r.get_json()['snapshot']['dataset'] == 'recycling'
+    assert client.get('/api/analytics/recycling?group_by=nope').status_code == 400
+    assert client.get('/api/analytics/trucks').status_code == 404
+
+def test_npz_fallback_without_pyarrow(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics, 'pa', None)
+    monkeypatch.setattr(analytics, 'pq', None)
+    with pytest.raises(QueryError): analytics.export('recycling', directory=str(tmp_path), fmt='parquet')
+    meta = analytics.export('recycling', directory=str(tmp_path), fmt='npz')
+    store = analytics.Store(str(tmp_path))
+    frame = store.get('recycling')
+    assert frame.meta['format'] == 'npz' and len(frame) == meta['rows'] > 0
+    assert {r['material']: r['count'] for r in aggregate(frame, ['material'])} == {k: v[0] for k, v in rollup('recycling_material').items()}
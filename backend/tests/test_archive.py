@@ -0,0 +1,43 @@
+import json
+import pytest
+import archive
+import rollups
+import seed
+from database import db_exec
+
+@pytest.fixture
+def history(server):
+    seed.seed_synthetic(300, bins=30, collections=1500, recycling=1500, days=400, end='2024-06-30 00:00:00')
+
+def pages(client, url, limit=97):
+    rows, cursor = [], ''
+    while True:
+        r = client.get(f'{url}&limit={limit}{"&cursor=" + cursor if cursor else ""}')
+        rows += r.get_json()
+        cursor = r.headers.get('X-Next-Cursor')
+        if not cursor: return rows
+
+def stream(client, url): return [json.loads(line) for line in client.get(f'{url}&format=ndjson').data.splitlines()]
+
+@pytest.mark.parametrize('url', ['/api/waste/collections?include_archived=1', '/api/waste/collections?include_archived=1&status=completed', '/api/recycling/records?include_archived=1', '/api/recycling/records?include_archived=1&material=glass'])
+def test_history_is_unchanged_by_archiving(client, history, url):
+    before = pages(client, url)
+    moved = archive.archiver.run()
+    assert sum(moved.values()) > 0 and archive.partitions()
+    assert pages(client, url) == before
+    assert stream(client, url) == before
+
+def test_archived_rows_leave_the_default_listing(client, history):
+    hot = db_exec('SELECT COUNT(*) FROM recycling_records', f=1)[0]
+    moved = archive.archive('recycling')
+    assert moved and db_exec('SELECT COUNT(*) FROM recycling_records', f=1)[0] == hot - moved
+    assert len(pages(client, '/api/recycling/records?x=1', limit=1000)) == hot - moved
+    assert sum(r[3] for r in archive.partitions('recycling')) == moved
+
+def test_rollups_cover_archived_rows(client, history):
+    stats = client.get('/api/recycling/stats').get_json()
+    archive.archiver.run()
+    assert rollups.verify() == []
+    rollups.rebuild()
+    assert rollups.verify() == []
+    assert client.get('/api/recycling/stats').get_json() == stats
@@ -0,0 +1,41 @@
+import changes
+from database import db_exec
+
+def bins_etag(client, **headers):
+    r = client.get('/api/waste/bins', headers=headers)
+    return r.status_code, r.headers.get('ETag'), int(r.headers[changes.VERSION_HEADER])
+
+def test_etag_revalidates_until_a_write(client):
+    status, tag, version = bins_etag(client)
+    assert status == 200
+    assert bins_etag(client, **{'If-None-Match': tag})[0] == 304
+    client.post('/api/waste/collections', json={'location': 'CBD', 'wasteType': 'hazardous'})
+    status, new_tag, new_version = bins_etag(client, **{'If-None-Match': tag})
+    assert status == 200 and new_tag != tag and new_version > version
+
+def test_feed_returns_changes_since_a_version(client):
+    version = client.get('/api/changes').get_json()['version']
+    rid = client.post('/api/recycling/records', json={'material': 'glass', 'weight': 1}).get_json()['record']['id']
+    feed = client.get(f'/api/changes?since={version}').get_json()
+    assert [r['id'] for r in feed['changes']['recycling']] == [rid]
+    assert feed['changes']['bins'] == [] and feed['version'] > version
+
+def test_prune_keeps_versions_monotonic_and_resets_old_cursors(client):
+    before = changes.current_version(('bins',))
+    for i in range(5): client.post('/api/recycling/records', json={'material': 'paper', 'weight': i + 1})
+    latest = changes.current_version()
+    assert changes.prune(2) > 0
+    assert db_exec('SELECT COUNT(*) FROM change_log', f=1)[0] == 2
+    # bins lost every entry; its version moves up to the horizon rather than back to 0.
+    assert before < changes.current_version(('bins',)) == latest - 2
+    assert changes.oldest_version() == latest - 1
+    assert client.get(f'/api/changes?since={latest - 2}').get_json().get('reset') is None
+    assert client.get(f'/api/changes?since={latest - 3}').get_json()['reset'] is True
+    assert changes.prune(2) == 0
+    changes.prune(0)
+    assert changes.current_version() == latest and changes.oldest_version() == latest + 1
+
+def test_archiver_run_prunes(server, monkeypatch):
+    monkeypatch.setattr(changes, 'KEEP', 1)
+    server.archive.archiver.run()
+    assert db_exec('SELECT COUNT(*) FROM change_log', f=1)[0] == 1
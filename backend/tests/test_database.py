@@ -0,0 +1,44 @@
+import threading
+import pytest
+from database import db_exec, db_insert, db_executemany, inserted_ids, transaction, after_commit, connection
+
+@pytest.fixture
+def table(pool):
+    db_exec('CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)')
+
+def test_connection_is_reentrant_per_thread(table):
+    with connection() as a, connection() as b: assert a is b
+
+def test_transaction_commits_and_runs_callbacks(table):
+    ran = []
+    with transaction():
+        db_insert('INSERT INTO t (v) VALUES (?)', ['a'])
+        after_commit(lambda: ran.append(db_exec('SELECT COUNT(*) FROM t', f=1)[0]))
+        assert ran == []
+    assert ran == [1]
+
+def test_nested_transaction_rolls_back_as_one(table):
+    ran = []
+    with pytest.raises(RuntimeError):
+        with transaction():
+            db_insert('INSERT INTO t (v) VALUES (?)', ['a'])
+            with transaction():
+                db_insert('INSERT INTO t (v) VALUES (?)', ['b'])
+                after_commit(lambda: ran.append(1))
+            raise RuntimeError
+    assert db_exec('SELECT COUNT(*) FROM t', f=1)[0] == 0
+    assert ran == []
+
+def test_pool_reuses_connections(table, pool):
+    def work(): db_exec('SELECT 1')
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert pool._created <= pool.size
+
+def test_inserted_ids_after_executemany(table):
+    with transaction():
+        db_insert('INSERT INTO t (v) VALUES (?)', ['first'])
+        db_executemany('INSERT INTO t (v) VALUES (?)', [('a',), ('b',), ('c',)])
+        ids = inserted_ids(3)
+    assert [r[0] for r in db_exec('SELECT id FROM t WHERE v != "first" ORDER BY id', f=2)] == list(ids)
@@ -0,0 +1,65 @@
+import json
+import pytest
+import events
+from events import Broker, Subscriber
+
+def test_broker_caps_subscribers():
+    broker = Broker(max_clients=2)
+    a, b = broker.subscribe(['bins']), broker.subscribe(['bins', 'recycling'])
+    assert broker.subscribe(['bins']) is None
+    broker.unsubscribe(a)
+    broker.unsubscribe(a)
+    assert broker.clients == 1 and broker.subscribe(['collections']) is not None
+
+def test_a_full_buffer_drops_the_oldest_events():
+    sub = Subscriber(['bins'], buffer=3)
+    for i in range(5): sub.push((i, 'bins', 'bin.status', {'id': i}))
+    queued, dropped = sub.drain(0)
+    assert [e[0] for e in queued] == [2, 3, 4] and dropped == 2
+    assert sub.drain(0) == ([], 0)
+
+def test_overflow_sends_resync_then_the_kept_events(monkeypatch):
+    monkeypatch.setattr(events, 'broker', Broker())
+    sub = Subscriber(['bins'], buffer=2)
+    events.broker._topics['bins'].add(sub)
+    events.broker.clients += 1
+    out = events.stream(sub, heartbeat=0)
+    next(out)
+    for i in range(3): events.publish('bins', 'bin.status', {'id': i})
+    chunk = next(out)
+    assert chunk.startswith('id: 0\nevent: resync\ndata: {"dropped":1}')
+    assert [json.loads(line[6:])['id'] for line in ''.join([next(out), next(out)]).splitlines() if line.startswith('data: ')] == [1, 2]
+    assert next(out) == ': keepalive\n\n'
+    out.close()
+    assert events.broker.clients == 0
+
+def read_events(r, n):
+    # The data payloads of the next n events on an open SSE response.
+    got = []
+    while len(got) < n: got += [json.loads(line[6:]) for line in next(r.response).decode().splitlines() if line.startswith('data: ')]
+    return got
+
+def test_jwt_stream_requires_a_token(jwt_client):
+    assert jwt_client.get('/api/events?topics=recycling').status_code == 401
+    assert jwt_client.get('/api/events?topics=recycling&token=forged').status_code == 401
+    token = jwt_client.environ_base['HTTP_AUTHORIZATION'][7:]
+    r = jwt_client.get(f'/api/events?topics=recycling&token={token}', buffered=False)
+    assert r.status_code == 200 and r.mimetype == 'text/event-stream'
+    next(r.response)
+    jwt_client.post('/api/recycling/records', json={'material': 'metal', 'weight': 3})
+    assert read_events(r, 1)[0]['material'] == 'metal'
+    r.close()
+
+def test_server_stream_rejects_an_invalid_token(client):
+    assert client.get('/api/events?token=forged').status_code == 401
+    r = client.get('/api/events?topics=bins', buffered=False)
+    assert r.status_code == 200
+    r.close()
+
+def test_full_broker_returns_503(client, monkeypatch):
+    monkeypatch.setattr(events.broker, 'max_clients', events.broker.clients)
+    assert client.get('/api/events').status_code == 503
+
+@pytest.mark.parametrize('topics', ['', 'bins,trucks'])
+def test_unknown_topics_are_rejected(client, topics):
+    assert client.get(f'/api/events?topics={topics}').status_code == 400
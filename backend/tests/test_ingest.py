@@ -0,0 +1,65 @@
+import json
+import pytest
+import ingest
+
+def post(client, url, rows):
+    # Encoded with the stdlib so Infinity and integers past 64 bits reach the server as sent.
+    return client.post(url, data=json.dumps(rows), content_type='application/json')
+
+def bulk(client, rows): return post(client, '/api/recycling/records/bulk', rows)
+
+def test_environmental_impacts_per_material():
+    assert ingest.environmental_impacts(['plastic', 'glass', 'plastic', 'wood'], [1.0, 2.0, 3.0, 4.0]) == [2.0, 1.0, 6.0, 4.0]
+
+@pytest.mark.parametrize('row, error', [
+    ({'material': 'plastic', 'weight': 'nan'}, 'Weight must be a finite number'),
+    ({'material': 'plastic', 'weight': 'inf'}, 'Weight must be a finite number'),
+    ({'material': 'plastic', 'weight': -1}, 'Weight must be positive'),
+    ({'material': 'plastic'}, 'Weight must be a number'),
+    ({'material': 'plastic', 'weight': 1, 'location': {'a': 1}}, 'location must be a string'),
+    ({'material': 'plastic', 'weight': 1, 'user_id': 1e400}, 'user_id must be an integer'),
+    ({'material': 'plastic', 'weight': 1, 'user_id': 2 ** 64}, 'user_id must be a positive integer'),
+    ({'material': 'plastic', 'weight': 1, 'user_id': 1.5}, 'user_id must be an integer'),
+    ({'material': 'plastic', 'weight': 1, 'user_id': True}, 'user_id must be an integer'),
+    ({'material': 'plastic', 'weight': True}, 'Weight must be a number'),
+    ({'weight': 1}, 'Material is required'),
+])
+def test_bad_rows_are_reported_not_inserted(client, row, error):
+    r = bulk(client, [{'material': 'paper', 'weight': 2}, row])
+    body = r.get_json()
+    assert r.status_code == 201 and body['inserted'] == 1
+    assert body['results'][1] == {'index': 1, 'error': error}
+
+def test_ndjson_non_finite_literals(client):
+    lines = ['{"material": "glass", "weight": NaN}', '{"material": "glass", "weight": Infinity}', '{"material": "glass", "weight": 3, "location": null}']
+    r = client.post('/api/recycling/records/bulk', data='\n'.join(lines), content_type='application/x-ndjson')
+    body = r.get_json()
+    assert body['inserted'] == 1 and body['failed'] == 2
+    assert body['results'][2]['environmental_impact'] == 1.5
+    record = client.get('/api/recycling/records?limit=1').get_json()[0]
+    assert record['weight'] == 3 and record['location'] == 'Recycling Center'
+
+def test_all_rows_invalid_is_400(client):
+    r = bulk(client, [{'material': 'paper', 'weight': float('nan')}])
+    assert r.status_code == 400 and r.get_json()['inserted'] == 0
+
+def test_single_record_rejects_non_finite_weight(client):
+    r = client.post('/api/recycling/records', json={'material': 'paper', 'weight': 'nan'})
+    assert r.status_code == 400
+
+@pytest.mark.parametrize('reading, error', [
+    ({'bin_id': 1, 'fill_level': 'nan'}, 'fill_level must be a finite number'),
+    ({'bin_id': 1e400, 'status': 'full'}, 'bin_id must be an integer'),
+    ({'status': 'full'}, 'bin_id is required'),
+    ({'bin_id': 1.5, 'status': 'full'}, 'bin_id must be an integer'),
+    ({'bin_id': True, 'status': 'full'}, 'bin_id must be an integer'),
+    ({'bin_id': 1, 'fill_level': False}, 'fill_level must be a number'),
+    ({'bin_id': 1, 'status': 'overflowing'}, 'status must be one of empty, half, full'),
+])
+def test_bad_telemetry_readings(client, reading, error):
+    body = post(client, '/api/waste/bins/telemetry', [{'bin_id': 1, 'fill_level': 90}, reading]).get_json()
+    assert body['accepted'] == 1 and body['results'][1] == {'index': 1, 'error': error}
+
+def test_integral_floats_and_numeric_strings_are_accepted(client):
+    body = bulk(client, [{'material': 'paper', 'weight': '2.5', 'user_id': 1.0}, {'material': 'paper', 'weight': 1, 'user_id': '1'}]).get_json()
+    assert body['inserted'] == 2
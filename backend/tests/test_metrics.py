@@ -0,0 +1,10 @@
+import metrics
+import responses
+from security import token_cache
+
+def test_cache_entries_gauge(client):
+    token = client.post('/api/auth/login', json={'email': 'demo@takatrack.com', 'password': 'demo123'}).get_json()['token']
+    client.get('/api/recycling/stats', headers={'Authorization': f'Bearer {token}'})
+    client.get('/api/drivers', headers={'Authorization': f'Bearer {token}'})
+    assert len(responses.body_cache) == 2 and len(token_cache) == 1
+    assert metrics.registry.gauges['cache_entries'][1]() == {'responses': 2, 'tokens': 1}
@@ -0,0 +1,43 @@
+import pytest
+import migrations
+from database import db_exec
+
+LEGACY = [
+    # server.py's tables before migration 1: no waste_bins.updated_at, no indexes, user_version 0.
+    'CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, email TEXT UNIQUE NOT NULL, name TEXT NOT NULL, phone TEXT, role TEXT DEFAULT "resident", password_hash TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+    'CREATE TABLE waste_bins (id INTEGER PRIMARY KEY AUTOINCREMENT, latitude REAL NOT NULL, longitude REAL NOT NULL, status TEXT DEFAULT "empty", type TEXT DEFAULT "general", created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+    'CREATE TABLE collections (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, bin_id INTEGER, status TEXT DEFAULT "pending", weight REAL DEFAULT 0, waste_type TEXT DEFAULT "general", location TEXT, scheduled_date TIMESTAMP, priority TEXT DEFAULT "medium", completed_date TIMESTAMP, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+    'CREATE TABLE recycling_records (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, material_type TEXT NOT NULL, weight REAL NOT NULL, location TEXT, environmental_impact REAL DEFAULT 0, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+]
+
+@pytest.fixture
+def legacy(pool):
+    for q in LEGACY: db_exec(q)
+    db_exec('INSERT INTO waste_bins (latitude, longitude) VALUES (-1.29, 36.82)')
+
+def indexes(): return {r[0] for r in db_exec('SELECT name FROM sqlite_master WHERE type = "index" AND name LIKE "ix_%"', f=2)}
+
+def test_migrates_a_legacy_database_once(legacy):
+    assert migrations.migrate() == [1, 2, 3]
+    assert migrations.version() == migrations.MIGRATIONS[-1][0]
+    assert db_exec('SELECT updated_at FROM waste_bins', f=1) == (None,)
+    assert 'ix_recycling_records_material_created' in indexes()
+    assert migrations.migrate() == []
+
+def test_resumes_from_an_intermediate_version(legacy):
+    db_exec('ALTER TABLE waste_bins ADD COLUMN updated_at TIMESTAMP')
+    db_exec('PRAGMA user_version = 1')
+    assert migrations.migrate() == [2, 3]
+    assert db_exec('SELECT COUNT(*) FROM sqlite_master WHERE name = "archive_totals"', f=1)[0] == 1
+
+def test_a_failing_step_rolls_back(legacy, monkeypatch):
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [*migrations.MIGRATIONS[:2], (3, 'broken', ['CREATE TABLE archive_totals (month TEXT)', 'CREATE TABLE nope (']) ])
+    with pytest.raises(Exception): migrations.migrate()
+    assert migrations.version() == 0 and indexes() == set()
+
+def test_every_endpoint_query_uses_an_index(server):
+    assert migrations.plan_problems() == []
+
+def test_a_missing_index_is_reported(server):
+    db_exec('DROP INDEX ix_users_role_name')
+    assert {p['endpoint'] for p in migrations.plan_problems()} == {'drivers'}
@@ -0,0 +1,68 @@
+import gzip
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+import brotli
+import pytest
+from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+import responses
+from responses import BodyCache
+
+PAYLOAD = {'b': [1, 2.5, None, True], 'a': {'when': datetime(2024, 5, 1, 12, 30), 'day': date(2024, 5, 1), 'amount': Decimal('1.10'), 'id': uuid.UUID(int=1)}, 'text': 'plain'}
+
+def stdlib_body(obj):
+    # What Flask's own provider sends for obj.
+    app = Flask('stdlib')
+    with app.app_context(): return jsonify(obj).get_data()
+
+def test_provider_matches_flask(server):
+    with server.app.app_context():
+        assert jsonify(PAYLOAD).get_data() == stdlib_body(PAYLOAD)
+        assert server.app.json.dumps(PAYLOAD) == stdlib_body(PAYLOAD).decode().rstrip('\n')
+
+def test_stream_lines_match_pages():
+    # NDJSON lines and SSE data go through dumps(), which renders datetimes the way jsonify() does.
+    assert responses.dumps(PAYLOAD) == stdlib_body(PAYLOAD).decode().rstrip('\n')
+    assert json.loads(responses.dumps({'t': datetime(2024, 5, 1)}))['t'] == 'Wed, 01 May 2024 00:00:00 GMT'
+
+@pytest.fixture
+def big(client):
+    # Enough recycling records for the listing to pass the compression threshold.
+    client.post('/api/recycling/records/bulk', json=[{'material': 'paper', 'weight': i + 1} for i in range(40)])
+    return '/api/recycling/records?limit=40'
+
+@pytest.mark.parametrize('accept, encoding', [('gzip', 'gzip'), ('br, gzip', 'br'), ('gzip;q=1, br;q=0.5', 'gzip'), ('identity', None), ('', None)])
+def test_encoding_negotiation(client, big, accept, encoding):
+    plain = client.get(big).get_data()
+    r = client.get(big, headers={'Accept-Encoding': accept})
+    assert r.headers.get('Content-Encoding') == encoding and 'Accept-Encoding' in r.headers['Vary']
+    body = r.get_data()
+    assert (gzip.decompress(body) if encoding == 'gzip' else brotli.decompress(body) if encoding == 'br' else body) == plain
+
+def test_small_and_streamed_bodies_are_not_compressed(client, big):
+    assert 'Content-Encoding' not in client.get('/api/recycling/stats', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in client.get(big + '&format=ndjson', headers={'Accept-Encoding': 'gzip'}).headers
+
+def test_repeats_are_served_from_cached_bytes(client, big):
+    responses.body_cache.clear()
+    first = client.get(big, headers={'Accept-Encoding': 'gzip'})
+    hits = responses.body_cache.hits
+    again = client.get(big, headers={'Accept-Encoding': 'gzip'})
+    assert responses.body_cache.hits == hits + 1 and again.get_data() == first.get_data() and again.headers['ETag'] == first.headers['ETag']
+    client.post('/api/recycling/records', json={'material': 'metal', 'weight': 1})
+    assert client.get(big, headers={'Accept-Encoding': 'gzip'}).headers['ETag'] != first.headers['ETag']
+    assert responses.body_cache.hits == hits + 1
+
+def test_body_cache_evicts_by_bytes():
+    cache = BodyCache(max_bytes=80)
+    for k in 'abcdefgh': cache.put(k, b'x' * 10, [])
+    cache.get('a')
+    cache.put('i', b'y' * 10, [])
+    assert cache.get('b') is None and cache.get('a') is not None and cache.size == 80 and len(cache) == 8
+    cache.put('big', b'z' * 11, [])
+    assert cache.get('big') is None
+    cache.put('a', b'w' * 5, [])
+    assert cache.size == 75 and cache.get('a')[0] == b'w' * 5
+    assert cache.metrics()['entries'] == 8
@@ -0,0 +1,17 @@
+import rollups
+from database import db_exec
+
+def test_verify_reports_and_rebuild_repairs_drift(server):
+    assert rollups.verify() == []
+    stored = rollups.get('recycling_material', 'plastic')
+    db_exec('UPDATE rollups SET impact = impact + 5 WHERE scope = "recycling_material" AND key = "plastic"')
+    db_exec('UPDATE rollups SET count = count + 2 WHERE scope = "collection_status" AND key = "pending"')
+    db_exec('DELETE FROM rollups WHERE scope = "bins"')
+    drift = {(d['scope'], d['key']): d for d in rollups.verify()}
+    assert set(drift) == {('recycling_material', 'plastic'), ('collection_status', 'pending'), ('bins', '*')}
+    plastic = drift[('recycling_material', 'plastic')]
+    assert plastic['stored'] == {'count': stored[0], 'weight': stored[1], 'impact': stored[2] + 5}
+    assert plastic['actual'] == {'count': stored[0], 'weight': stored[1], 'impact': stored[2]}
+    assert drift[('bins', '*')]['stored']['count'] == 0
+    rollups.rebuild()
+    assert rollups.verify() == [] and rollups.get('recycling_material', 'plastic') == stored
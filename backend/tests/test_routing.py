@@ -0,0 +1,73 @@
+import time
+import numpy as np
+import pytest
+import routing
+from database import db_exec, db_insert
+
+def stops(n, seed=0, first_bin=1, status='half'):
+    rng = np.random.default_rng(seed)
+    lat, lng = rng.uniform(-1.35, -1.22, n), rng.uniform(36.70, 36.92, n)
+    return [{'collection_id': i + 1, 'bin_id': first_bin + i, 'latitude': float(lat[i]), 'longitude': float(lng[i]), 'priority': 'medium', 'bin_status': status, 'overdue': False} for i in range(n)]
+
+DRIVERS = [{'id': i, 'name': f'Driver {i}'} for i in range(1, 4)]
+
+def test_matrix_matches_haversine():
+    s = stops(20)
+    m = routing.DistanceMatrix()
+    idx, dist, _ = m.lookup([x['bin_id'] for x in s], [x['latitude'] for x in s], [x['longitude'] for x in s])
+    a, b = s[3], s[11]
+    p1, p2, dp, dl = map(np.radians, (a['latitude'], b['latitude'], b['latitude'] - a['latitude'], b['longitude'] - a['longitude']))
+    expected = 2 * routing.EARTH_RADIUS_M * np.arcsin(np.sqrt(np.sin(dp / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dl / 2) ** 2))
+    assert dist[idx[3], idx[11]] == pytest.approx(expected, rel=1e-4)
+
+def test_every_stop_is_routed_within_capacity():
+    s = stops(60)
+    plan = routing.plan(s, DRIVERS, capacity=800, matrix=routing.DistanceMatrix())
+    routed = [x['collectionId'] for r in plan['routes'] for x in r['stops']]
+    assert sorted(routed + plan['unassigned']) == list(range(1, 61))
+    assert all(r['loadKg'] <= 800 for r in plan['routes'])
+    assert len(plan['unassigned']) == 60 - 3 * 16
+
+def test_matrix_cache_stays_bounded():
+    m = routing.DistanceMatrix(max_bins=300)
+    for k in range(5):
+        s = stops(200, seed=k, first_bin=1 + 200 * k)
+        routing.plan(s, DRIVERS, matrix=m)
+        assert m.size <= 300 and m.matrix.shape[0] <= 300
+        assert set(m.index) >= {x['bin_id'] for x in s}
+
+def test_moved_bin_is_remeasured():
+    m = routing.DistanceMatrix()
+    s = stops(5)
+    ids, lat, lng = [x['bin_id'] for x in s], [x['latitude'] for x in s], [x['longitude'] for x in s]
+    before = m.lookup(ids, lat, lng)[1][0, 1]
+    lat[1] += 0.01
+    idx, dist, _ = m.lookup(ids, lat, lng)
+    assert dist[idx[0], idx[1]] != before
+
+def test_each_route_gets_a_share_of_the_budget(monkeypatch):
+    shares = []
+    def slow_two_opt(route, dist, idx, depot_dist, deadline):
+        shares.append(deadline - time.perf_counter())
+        while time.perf_counter() < deadline: pass
+        return route
+    monkeypatch.setattr(routing, 'two_opt', slow_two_opt)
+    routing.plan(stops(60), DRIVERS, budget_ms=90, matrix=routing.DistanceMatrix())
+    assert len(shares) == 3 and all(s > 0.01 for s in shares)
+
+def test_plan_is_rejudged_each_overdue_window(client, monkeypatch):
+    window = routing.overdue_window()
+    db_insert('INSERT INTO collections (user_id, bin_id, status, scheduled_date) VALUES (1, 1, "pending", ?)', [routing.window_start(window + 1)])
+    seen = []
+    real = routing.plan
+    monkeypatch.setattr(routing, 'plan', lambda stops, *a, **k: seen.append({s['collection_id']: s['overdue'] for s in stops}) or real(stops, *a, **k))
+    def plan(w, tag=None):
+        monkeypatch.setattr(routing, 'overdue_window', lambda: w)
+        return client.get('/api/routes/plan', headers={'If-None-Match': tag} if tag else {})
+    first = plan(window)
+    assert plan(window, first.headers['ETag']).status_code == 304
+    later = plan(window + 1, first.headers['ETag'])
+    assert later.status_code == 200 and later.headers['ETag'] != first.headers['ETag']
+    plan(window + 2)
+    cid = db_exec('SELECT MAX(id) FROM collections', f=1)[0]
+    assert [s[cid] for s in seen] == [False, False, True]
@@ -0,0 +1,81 @@
+import threading
+import time
+from datetime import timedelta
+import pytest
+import security
+from security import HashPool, Overloaded, TokenCache
+
+def test_token_cache_expires_on_ttl_and_token_exp():
+    cache = TokenCache(size=10, ttl=0.05)
+    cache.put('a', 'alice')
+    cache.put('b', 'bob', expires_at=time.time() - 1)
+    assert cache.get('a') == 'alice' and cache.get('b') is None
+    time.sleep(0.06)
+    assert cache.get('a') is None and len(cache) == 0
+
+def test_token_cache_evicts_least_recently_used():
+    cache = TokenCache(size=2)
+    cache.put('a', 1); cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('b') is None and cache.get('a') == 1 and cache.get('c') == 3
+
+def test_hash_pool_runs_in_worker_processes():
+    pool = HashPool(workers=1, queue=0, enabled=True)
+    h = pool.run(security.generate_password_hash, 'pw')
+    assert pool.run(security.check_password_hash, h, 'pw') is True
+    assert pool._executor._mp_context.get_start_method() == security.START_METHOD != 'fork'
+    pool._executor.shutdown()
+
+def test_hash_pool_rejects_beyond_its_queue():
+    pool = HashPool(workers=1, queue=1, enabled=True)
+    started = [threading.Thread(target=pool.run, args=(time.sleep, 0.5)) for _ in range(2)]
+    for t in started: t.start()
+    time.sleep(0.05)
+    with pytest.raises(Overloaded, match='in flight'): pool.run(time.sleep, 0)
+    for t in started: t.join()
+    assert pool.rejected == 1 and pool.run(abs, -1) == 1
+    pool._executor.shutdown()
+
+def test_hash_pool_map_queues_past_the_request_slots():
+    pool = HashPool(workers=1, queue=0, enabled=True)
+    assert pool.map(abs, [-1, -2, -3]) == [1, 2, 3] and pool.rejected == 0
+    pool._executor.shutdown()
+
+def test_hash_pool_times_out():
+    pool = HashPool(workers=1, queue=0, timeout=0.1, enabled=True)
+    with pytest.raises(Overloaded, match='timed out'): pool.run(time.sleep, 0.5)
+    pool._executor.shutdown()
+
+@pytest.mark.parametrize('app', ['server', 'jwt_app'])
+def test_overloaded_login_is_503(request, monkeypatch, app):
+    app = request.getfixturevalue(app)
+    # A pool with every slot taken, as under a burst of logins.
+    busy = HashPool(workers=1, queue=0, enabled=True)
+    busy._slots.acquire()
+    monkeypatch.setattr(security, 'hash_pool', busy)
+    r = getattr(app, 'app', app).test_client().post('/api/auth/login', json={'email': 'demo@takatrack.com', 'password': 'demo123'})
+    assert r.status_code == 503 and r.headers['Retry-After'] == '1'
+
+def test_jwt_claims_are_cached_per_token(jwt_client):
+    security.jwt_cache.clear()
+    first = jwt_client.get('/api/auth/me').get_json()
+    hits = security.jwt_cache.hits
+    assert jwt_client.get('/api/auth/me').get_json() == first and security.jwt_cache.hits == hits + 1
+    assert first['user']['email'] == 'demo@takatrack.com' and len(security.jwt_cache) == 1
+    assert len(security.token_cache) == 0
+
+def test_expired_and_forged_jwts_are_rejected(jwt_app, jwt_client):
+    from flask_jwt_extended import create_access_token
+    with jwt_app.app_context(): expired = create_access_token(identity='1', expires_delta=timedelta(seconds=-1))
+    for token in (expired, jwt_client.environ_base['HTTP_AUTHORIZATION'][7:] + 'x'):
+        assert jwt_client.get('/api/auth/me', headers={'Authorization': f'Bearer {token}'}).status_code in (401, 422)
+    assert jwt_client.get('/api/auth/me', headers={'Authorization': ''}).status_code == 401
+
+def test_server_tokens_are_cached_until_they_expire(server):
+    signer = security.TokenSigner('secret', max_age=1, cache=TokenCache())
+    token = signer.issue({'id': 1})
+    assert signer.verify(token) == {'id': 1} and signer.cache.get(token) == {'id': 1}
+    assert signer.verify(token + 'x') is None
+    time.sleep(1.1)
+    assert signer.cache.get(token) is None
@@ -0,0 +1,34 @@
+import functools
+import archive
+import changes
+import rollups
+import seed
+from database import db_exec, transaction
+
+def test_registering_a_driver_moves_the_drivers_etag(client, monkeypatch):
+    monkeypatch.setattr(seed, 'sample_data', functools.partial(seed.sample_data, mode='off'))
+    first = client.get('/api/drivers')
+    r = client.post('/api/auth/register', json={'email': 'new.driver@takatrack.com', 'password': 'pw', 'name': 'New Driver', 'role': 'driver'})
+    assert r.status_code == 201
+    second = client.get('/api/drivers', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200 and len(second.get_json()) == len(first.get_json()) + 1
+
+def test_demo_reseed_drops_the_archive(server):
+    seed.seed_synthetic(100, days=400, end='2024-06-30 00:00:00')
+    assert archive.archiver.run()['collections'] > 0
+    with transaction(): seed.demo()
+    rollups.rebuild()
+    assert archive.partitions() == [] and db_exec('SELECT COUNT(*) FROM archive_totals', f=1)[0] == 0
+    assert sum(rollups.get('collection_status', s)[0] for s in ('completed', 'in_progress', 'pending')) == len(seed.DEMO_COLLECTIONS)
+    assert db_exec('SELECT MIN(id) FROM users', f=1)[0] == 1
+
+def test_synthetic_seed(client):
+    old = changes.current_version()
+    counts = seed.seed_synthetic(500, days=30, end='2024-06-30 00:00:00')
+    assert counts == {'users': 500, 'bins': 50, 'collections': 1000, 'recycling': 1000}
+    assert db_exec('SELECT MIN(id), MAX(id) FROM collections', f=1) == (1, 1000)
+    assert db_exec('SELECT COUNT(*) FROM waste_bins_rtree', f=1)[0] == 50
+    assert rollups.verify() == []
+    assert changes.current_version(('users',)) > old
+    assert client.get(f'/api/changes?since={old - 1}').get_json()['reset'] is True
+    assert db_exec('PRAGMA synchronous', f=1)[0] == 1
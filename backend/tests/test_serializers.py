@@ -0,0 +1,47 @@
+import pytest
+from sqlalchemy import event
+import serializers
+from models import db, User, WasteBin, Collection, RecyclingRecord
+
+MODELS = {'drivers': User, 'bins.list': WasteBin, 'collections.list': Collection, 'collections.stream': Collection, 'recycling.list': RecyclingRecord}
+# Statements per endpoint for one batch: plain and joined rows are one SELECT, selectin adds one IN query for the bins.
+QUERIES = {'drivers': 1, 'bins.list': 1, 'collections.list': 1, 'collections.stream': 2, 'recycling.list': 1, 'changes.bins': 1, 'changes.collections': 2, 'changes.recycling': 1}
+
+@pytest.fixture
+def session(jwt_app):
+    # A few more collections spread over every bin, so a per-row bin load would show up as extra queries.
+    with jwt_app.app_context():
+        db.session.add_all([Collection(user_id=1, bin_id=i % 3 + 1, location=f'Stop {i}') for i in range(12)])
+        db.session.commit()
+        statements = []
+        listener = lambda *a: statements.append(a[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        yield statements
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+def test_every_endpoint_has_an_expected_query_count():
+    assert set(QUERIES) == set(serializers.ENDPOINTS)
+
+@pytest.mark.parametrize('endpoint', MODELS)
+def test_rows_match_the_model_dicts(session, endpoint):
+    model = MODELS[endpoint]
+    expected = [m.to_dict() for m in model.query.order_by(model.id)]
+    db.session.expunge_all()
+    session.clear()
+    rows = list(serializers.serialize(endpoint, serializers.query(endpoint).order_by(model.id)))
+    assert len(session) == QUERIES[endpoint]
+    assert rows == expected
+
+@pytest.mark.parametrize('entity', ['bins', 'collections', 'recycling'])
+def test_change_feed_fetch(session, entity):
+    endpoint = f'changes.{entity}'
+    model = serializers.ENDPOINTS[endpoint][0].model
+    expected = {m.id: m.to_dict() for m in model.query}
+    session.clear()
+    rows = serializers.fetch(endpoint, list(expected))
+    assert len(session) == QUERIES[endpoint]
+    assert {r['id']: r for r in rows} == expected
+
+def test_rows_have_no_instance_dict():
+    for row, _ in serializers.ENDPOINTS.values():
+        assert not hasattr(row(()), '__dict__')
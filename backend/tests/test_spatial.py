@@ -0,0 +1,61 @@
+import pytest
+import spatial
+from database import db_exec, db_insert
+
+FAR = (10.0, 10.0)  # a query point with no demo bins anywhere near it
+
+def add_bin(lat, lng): return db_insert('INSERT INTO waste_bins (latitude, longitude) VALUES (?, ?)', [lat, lng])
+
+def north(meters): return FAR[0] + meters / spatial.METERS_PER_DEGREE
+
+def rtree(bin_id): return db_exec('SELECT min_lat, max_lat, min_lng, max_lng FROM waste_bins_rtree WHERE id = ?', [bin_id], 1)
+
+def test_triggers_keep_the_index_in_sync(server):
+    bin_id = add_bin(-1.25, 36.8)
+    assert rtree(bin_id) == pytest.approx((-1.25, -1.25, 36.8, 36.8))
+    db_exec('UPDATE waste_bins SET latitude = ?, longitude = ? WHERE id = ?', [-1.3, 36.9, bin_id])
+    assert rtree(bin_id) == pytest.approx((-1.3, -1.3, 36.9, 36.9))
+    db_exec('DELETE FROM waste_bins WHERE id = ?', [bin_id])
+    assert rtree(bin_id) is None
+    assert db_exec('SELECT COUNT(*) FROM waste_bins', f=1) == db_exec('SELECT COUNT(*) FROM waste_bins_rtree', f=1)
+
+def test_sync_index_backfills_missing_rows(server):
+    db_exec('DELETE FROM waste_bins_rtree')
+    spatial.sync_index()
+    assert db_exec('SELECT COUNT(*) FROM waste_bins_rtree', f=1) == db_exec('SELECT COUNT(*) FROM waste_bins', f=1)
+
+def test_bbox(client):
+    inside, outside = add_bin(10.5, 10.5), add_bin(10.5, 11.5)
+    ids = [b['id'] for b in client.get('/api/waste/bins?bbox=10,10,11,11').get_json()]
+    assert inside in ids and outside not in ids
+
+def test_radius_is_exact_and_sorted(client):
+    near, edge, out = add_bin(north(100), FAR[1]), add_bin(north(900), FAR[1]), add_bin(north(1100), FAR[1])
+    hits = client.get(f'/api/waste/bins?lat={FAR[0]}&lng={FAR[1]}&radius=1000').get_json()
+    assert [b['id'] for b in hits] == [near, edge]
+    assert hits[0]['distance'] == pytest.approx(100, rel=0.01) and hits[1]['distance'] == pytest.approx(900, rel=0.01)
+
+def test_nearest_widens_until_it_has_k(server):
+    radii = []
+    def in_bbox(*box):
+        radii.append(round((box[2] - box[0]) / 2 * spatial.METERS_PER_DEGREE))
+        return spatial.bins_in_bbox(*box)
+    ids = [add_bin(north(m), FAR[1]) for m in (3000, 6000, 20000)]
+    hits = spatial.nearest(in_bbox, spatial._row_coords, *FAR, 2)
+    assert [b[0] for b, _ in hits] == ids[:2]
+    assert radii == [500, 2000, 8000]
+
+def test_nearest_stops_at_the_cap(server):
+    add_bin(north(spatial.KNN_MAX_RADIUS_M * 2), FAR[1])
+    assert spatial.nearest_bins(*FAR, 1) == []
+    within = add_bin(north(spatial.KNN_MAX_RADIUS_M * 0.9), FAR[1])
+    assert [b[0] for b, _ in spatial.nearest_bins(*FAR, 5)] == [within]
+
+@pytest.mark.parametrize('query', ['bbox=1,2,3', 'lat=1&lng=2&k=0', 'lat=1&lng=2&radius=-5', 'lat=x&lng=2&k=1'])
+def test_bad_queries_are_rejected(client, query):
+    assert client.get(f'/api/waste/bins?{query}').status_code == 400
+
+def test_blueprint_bins_use_the_same_queries(jwt_client):
+    hits = jwt_client.get('/api/waste/bins?lat=-1.2865&lng=36.8235&k=2').get_json()
+    assert [b['id'] for b in hits] == [2, 1] and hits[0]['distance'] == 0
+    assert [b['id'] for b in jwt_client.get('/api/waste/bins?bbox=36.82,-1.29,36.83,-1.28').get_json()] == [2]
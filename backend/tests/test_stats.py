@@ -0,0 +1,42 @@
+import changes
+import rollups
+from stats import StatsCache, load_dashboard_stats
+
+def test_reloads_only_for_a_newer_version():
+    state = {'version': 3, 'loads': 0}
+    def loader(version):
+        state['loads'] += 1
+        return state['version'], {'n': state['loads']}
+    cache = StatsCache(loader, ttl=3600)
+    assert cache.get(3) == {'n': 1}
+    assert cache.get(2) == {'n': 1}
+    state['version'] = 4
+    assert cache.get(4) == {'n': 2}
+    assert cache.get(4) == {'n': 2}
+
+def test_dashboard_reflects_each_write(client):
+    before = client.get('/api/dashboard/stats').get_json()
+    client.post('/api/recycling/records', json={'material': 'plastic', 'weight': 2.5})
+    client.post('/api/waste/collections', json={'location': 'CBD'})
+    after = client.get('/api/dashboard/stats').get_json()
+    assert after['recycledWeight'] == round(before['recycledWeight'] + 2.5, 1)
+    assert after['pending'] == before['pending'] + 1
+
+def test_write_committed_after_a_load_is_read_once(client):
+    # No delta is applied on top of the cached counters; the reload for the new version reads the rollups.
+    cache = StatsCache(load_dashboard_stats, ttl=3600)
+    cache.get()
+    client.post('/api/recycling/records', json={'material': 'paper', 'weight': 4})
+    version = changes.current_version()
+    assert cache.get(version)['recycledWeight'] == rollups.get('recycling')[1]
+    assert cache.get(version) == cache.get()
+
+def test_dashboard_reads_the_version_once(client, monkeypatch):
+    calls = []
+    read = changes.current_version
+    monkeypatch.setattr(changes, 'current_version', lambda *a: calls.append(a) or read(*a))
+    client.get('/api/dashboard/stats')
+    client.post('/api/recycling/records', json={'material': 'glass', 'weight': 1})
+    calls.clear()
+    r = client.get('/api/dashboard/stats')
+    assert len(calls) == 1 and r.headers['X-Change-Version'] == str(read())
@@ -0,0 +1,80 @@
+import json
+import threading
+import pytest
+import database
+from database import PoolExhausted, db_exec
+
+def records(client, n):
+    r = client.post('/api/recycling/records/bulk', json=[{'material': 'plastic', 'weight': i + 1} for i in range(n)])
+    assert r.status_code == 201
+
+def test_exhausted_pool_times_out(pool):
+    held = [pool._acquire() for _ in range(pool.size)]
+    with pytest.raises(PoolExhausted): db_exec('SELECT 1')
+    for c in held: pool._release(c)
+    assert db_exec('SELECT 1', f=1) == (1,)
+
+def test_busy_pool_returns_503(client, pool):
+    held = [pool._acquire() for _ in range(pool.size)]
+    r = client.get('/api/recycling/stats')
+    for c in held: pool._release(c)
+    assert r.status_code == 503 and r.headers['Retry-After'] == '1'
+
+def test_stalled_streams_hold_no_connection(client, pool, monkeypatch):
+    monkeypatch.setattr('pagination.STREAM_BATCH', 2)
+    records(client, 5)
+    # More half-read streams than the pool has connections, each on its own thread like a real server.
+    started, release, first = threading.Barrier(pool.size + 3), threading.Event(), []
+    def stalled():
+        r = client.get('/api/recycling/records?format=ndjson', buffered=False)
+        first.append(json.loads(next(r.response)))
+        started.wait()
+        release.wait()
+        r.close()
+    threads = [threading.Thread(target=stalled) for _ in range(pool.size + 2)]
+    for t in threads: t.start()
+    started.wait()
+    try:
+        assert client.get('/api/recycling/stats').status_code == 200
+        assert pool._idle.qsize() == pool._created
+    finally:
+        release.set()
+        for t in threads: t.join()
+    assert len(first) == pool.size + 2
+
+@pytest.mark.parametrize('limit', [None, 1, 3, 7])
+def test_stream_matches_pages(client, monkeypatch, limit):
+    monkeypatch.setattr('pagination.STREAM_BATCH', 3)
+    records(client, 8)
+    q = f'&limit={limit}' if limit else ''
+    streamed = [json.loads(line) for line in client.get(f'/api/recycling/records?format=ndjson{q}').data.splitlines()]
+    paged = client.get(f'/api/recycling/records?limit={limit or 1000}').get_json()
+    assert streamed == paged
+
+def jwt_records(client, n):
+    for i in range(n): assert client.post('/api/recycling/records', json={'material': 'glass', 'weight': i + 1}).status_code == 201
+
+@pytest.mark.parametrize('url', ['/api/recycling/records?x=1', '/api/waste/collections?x=1', '/api/waste/collections?status=pending'])
+@pytest.mark.parametrize('limit', [None, 2, 5])
+def test_blueprint_stream_matches_pages(jwt_client, monkeypatch, url, limit):
+    monkeypatch.setattr('serializers.BATCH', 2)
+    jwt_records(jwt_client, 5)
+    for i in range(3): jwt_client.post('/api/waste/collections', json={'location': f'Stop {i}'})
+    q = f'&limit={limit}' if limit else ''
+    streamed = [json.loads(line) for line in jwt_client.get(f'{url}&format=ndjson{q}').data.splitlines()]
+    assert streamed == jwt_client.get(f'{url}&limit={limit or 1000}').get_json()
+
+def test_blueprint_stream_holds_no_connection(jwt_client, jwt_app, monkeypatch):
+    from models import db
+    monkeypatch.setattr('serializers.BATCH', 2)
+    jwt_records(jwt_client, 5)
+    r = jwt_client.get('/api/recycling/records?format=ndjson', buffered=False)
+    first = json.loads(next(r.response))
+    with jwt_app.app_context(): assert db.engine.pool.checkedout() == 0
+    rest = [json.loads(line) for chunk in r.response for line in chunk.splitlines()]
+    r.close()
+    assert [first['weight'], *(x['weight'] for x in rest)] == [5, 4, 3, 2, 1, 5.2]
+
+def test_blueprint_stream_rejects_a_bad_filter_upfront(jwt_client):
+    r = jwt_client.get('/api/recycling/records?format=ndjson&from=yesterday')
+    assert r.status_code == 400 and 'Invalid timestamp' in r.get_json()['message']
@@ -0,0 +1,36 @@
+from database import db_exec
+
+def get(client, url, tag=None):
+    return client.get(url, headers={'If-None-Match': tag} if tag else {})
+
+def status_of(response, bin_id): return next(b['status'] for b in response.get_json() if b['id'] == bin_id)
+
+def test_pending_telemetry_changes_the_etag(client, server):
+    first = get(client, '/api/waste/bins')
+    assert status_of(first, 2) == 'empty'
+    assert client.post('/api/waste/bins/telemetry', json=[{'bin_id': 2, 'status': 'full'}]).status_code == 202
+    pending = get(client, '/api/waste/bins', first.headers['ETag'])
+    assert pending.status_code == 200 and status_of(pending, 2) == 'full'
+    assert pending.headers['X-Change-Version'] == first.headers['X-Change-Version']
+    assert get(client, '/api/waste/bins', pending.headers['ETag']).status_code == 304
+    client.post('/api/waste/bins/telemetry', json=[{'bin_id': 2, 'status': 'half'}])
+    assert status_of(get(client, '/api/waste/bins', pending.headers['ETag']), 2) == 'half'
+
+def test_flush_writes_and_bumps_the_version(client, server):
+    before = get(client, '/api/waste/bins')
+    client.post('/api/waste/bins/telemetry', json=[{'bin_id': 1, 'fill_level': 10}, {'bin_id': 1, 'fill_level': 50}])
+    assert server.bin_status_queue.flush() == 1
+    assert db_exec('SELECT status FROM waste_bins WHERE id = 1', f=1)[0] == 'half'
+    after = get(client, '/api/waste/bins', before.headers['ETag'])
+    assert after.status_code == 200 and status_of(after, 1) == 'half'
+    assert int(after.headers['X-Change-Version']) > int(before.headers['X-Change-Version'])
+    assert server.bin_status_queue.generation() is None
+
+def test_route_plan_sees_pending_bin_status(client):
+    plan = lambda tag=None: get(client, '/api/routes/plan', tag)
+    first = plan()
+    client.post('/api/waste/bins/telemetry', json=[{'bin_id': 3, 'status': 'empty'}])
+    second = plan(first.headers['ETag'])
+    assert second.status_code == 200
+    loads = {s['binId']: s['load'] for r in second.get_json()['routes'] for s in r['stops']}
+    assert loads[3] == 20.0
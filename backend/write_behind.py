@@ -0,0 +1,113 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from database import db_exec, db_executemany, transaction, after_commit
+import changes
+import events
+
+FLUSH_INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL', 1.0))
+FLUSH_BATCH = int(os.environ.get('WRITE_BEHIND_BATCH', 500))
+ENABLED = os.environ.get('WRITE_BEHIND', '1') != '0'
+CHUNK = 900
+
+log = logging.getLogger(__name__)
+
+class BinStatusQueue:
+    # Coalesces bin status updates in memory and writes them from one background thread,
+    # so request threads never wait on SQLite's writer lock for telemetry.
+    def __init__(self, interval=FLUSH_INTERVAL, batch_size=FLUSH_BATCH, enabled=ENABLED):
+        self.interval, self.batch_size, self.enabled = interval, batch_size, enabled
+        self._pending, self._inflight = {}, {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopped = False
+        self._generation = 0
+        self.enqueued = self.coalesced = self.flushed = self.flushes = self.failures = 0
+        self.last_flush_ms = 0.0
+
+    def enqueue(self, updates):
+        # updates: iterable of (bin_id, status); later values for the same bin replace earlier ones.
+        with self._lock:
+            for bin_id, status in updates:
+                self.enqueued += 1
+                if bin_id in self._pending: self.coalesced += 1
+                self._pending[bin_id] = status
+            self._generation += 1
+            depth = len(self._pending)
+        if not self.enabled: return self.flush()
+        self._ensure_started()
+        if depth >= self.batch_size: self._wake.set()
+
+    def status(self, bin_id, stored):
+        # Read-through overlay: a pending (or mid-flush) value wins over what the database holds.
+        return self._pending.get(bin_id, self._inflight.get(bin_id, stored))
+
+    def generation(self):
+        # Changes with every enqueue, for ETags of responses that read the overlay. None while nothing is
+        # pending or in flight, when those responses match the database and its change_log version.
+        return self._generation if self._pending or self._inflight else None
+
+    def depth(self): return len(self._pending)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock: batch = self._inflight = self._pending; self._pending = {}
+            if not batch: return 0
+            start = time.perf_counter()
+            try: written = self._write(batch)
+            except Exception:
+                self.failures += 1
+                with self._lock:
+                    for bin_id, status in batch.items(): self._pending.setdefault(bin_id, status)
+                raise
+            finally: self._inflight = {}
+            self.flushes += 1
+            self.flushed += len(batch)
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+            return written
+
+    def _write(self, batch):
+        ids = list(batch)
+        with transaction():
+            current = {}
+            for i in range(0, len(ids), CHUNK):
+                chunk = ids[i:i + CHUNK]
+                current.update((r[0], r) for r in db_exec(f'SELECT id, latitude, longitude, status, type FROM waste_bins WHERE id IN ({",".join("?" * len(chunk))})', chunk, 2))
+            transitions = [(bin_id, status) for bin_id, status in batch.items() if bin_id in current and current[bin_id][3] != status]
+            db_executemany('UPDATE waste_bins SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?', [(status, bin_id) for bin_id, status in transitions])
+            changes.record('bins', [bin_id for bin_id, _ in transitions])
+            for bin_id, status in transitions:
+                b = current[bin_id]
+                after_commit(lambda b=b, status=status: events.publish('bins', 'bin.status', {'id': b[0], 'latitude': b[1], 'longitude': b[2], 'status': status, 'previous': b[3], 'type': b[4]}))
+        return len(transitions)
+
+    def _ensure_started(self):
+        if self._thread is not None: return
+        with self._lock:
+            if self._thread is not None: return
+            self._thread = threading.Thread(target=self._run, name='bin-status-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try: self.flush()
+            except Exception: log.exception('Bin status flush failed; batch re-queued for the next tick')
+
+    def stop(self):
+        # Durable shutdown: stop the writer thread, then flush whatever is still pending.
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None: self._thread.join(timeout=max(self.interval * 5, 5))
+        self.flush()
+
+    def metrics(self):
+        return {'depth': self.depth(), 'enqueued': self.enqueued, 'coalesced': self.coalesced, 'flushed': self.flushed, 'flushes': self.flushes, 'failures': self.failures, 'lastFlushMs': round(self.last_flush_ms, 2), 'intervalSeconds': self.interval, 'batchSize': self.batch_size}
+
+bin_status_queue = BinStatusQueue()
@@ -1,8 +1,13 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { MapPin, Navigation, Filter, Truck, RefreshCw } from 'lucide-react';
 import api from '../utils/api';
 import LiveMapStatus from '../components/LiveMapStatus';
 
+// Area covered by the map panel (minLng,minLat,maxLng,maxLat); only bins inside it are fetched.
+const MAP_VIEWPORT = '36.70,-1.40,36.95,-1.20';
+const [MIN_LNG, MIN_LAT, MAX_LNG, MAX_LAT] = MAP_VIEWPORT.split(',').map(Number);
+const inViewport = (bin) => bin.latitude >= MIN_LAT && bin.latitude <= MAX_LAT && bin.longitude >= MIN_LNG && bin.longitude <= MAX_LNG;
+
 const MapView = () => {
   const [bins, setBins] = useState([]);
   const [trucks, setTrucks] = useState([]);
@@ -11,23 +16,52 @@ const MapView = () => {
   const [loading, setLoading] = useState(true);
   const [isConnected, setIsConnected] = useState(true);
   const [lastUpdate, setLastUpdate] = useState(null);
+  const versionRef = useRef(null);
+  const streamingRef = useRef(false);
 
   useEffect(() => {
     fetchMapData();
     getCurrentLocation();
     
     
+    // Bin updates are pushed over server-sent events; the change-feed poll only runs while the stream is down.
+    // EventSource cannot set an Authorization header, so the token goes in the query string.
+    const params = new URLSearchParams({ topics: 'bins', token: localStorage.getItem('token') || '' });
+    const source = new EventSource(`${api.defaults.baseURL}/api/events?${params}`);
+    const applyBin = (event) => {
+      const { topic, ...bin } = JSON.parse(event.data);
+      if (!inViewport(bin)) return;
+      setBins((current) => [...current.filter((b) => b.id !== bin.id), { ...(current.find((b) => b.id === bin.id) || {}), ...bin }]);
+      setLastUpdate(new Date());
+    };
+    source.addEventListener('bin.created', applyBin);
+    source.addEventListener('bin.status', applyBin);
+    source.addEventListener('resync', () => fetchChanges());
+    source.onopen = () => {
+      streamingRef.current = true;
+      setIsConnected(true);
+      // Catch up on anything published while the stream was down.
+      if (versionRef.current !== null) fetchChanges();
+    };
+    source.onerror = () => {
+      streamingRef.current = false;
+    };
+    
     const interval = setInterval(() => {
-      fetchMapData();
+      if (!streamingRef.current) fetchChanges();
     }, 30000);
     
-    return () => clearInterval(interval);
+    return () => {
+      clearInterval(interval);
+      source.close();
+    };
   }, []);
 
   const fetchMapData = async () => {
     try {
-      const binsRes = await api.get('/api/waste/bins');
+      const binsRes = await api.get('/api/waste/bins', { params: { bbox: MAP_VIEWPORT } });
       setBins(binsRes.data);
+      versionRef.current = binsRes.headers['x-change-version'] ?? null;
       
       
       setTrucks([
@@ -46,6 +80,29 @@ const MapView = () => {
     }
   };
 
+  // Polls only the bins that changed since the last version we saw; falls back to a full reload on reset.
+  const fetchChanges = async () => {
+    if (versionRef.current === null) return fetchMapData();
+    try {
+      const res = await api.get('/api/changes', { params: { since: versionRef.current, entities: 'bins' } });
+      if (res.data.reset) return fetchMapData();
+      const changed = new Map(res.data.changes.bins.filter(inViewport).map((bin) => [bin.id, bin]));
+      const deleted = new Set(res.data.deleted.bins);
+      if (changed.size || deleted.size) {
+        setBins((current) => [
+          ...current.filter((bin) => !changed.has(bin.id) && !deleted.has(bin.id)),
+          ...changed.values()
+        ]);
+      }
+      versionRef.current = res.data.version;
+      setIsConnected(true);
+      setLastUpdate(new Date());
+    } catch (error) {
+      console.error('Error fetching map changes:', error);
+      setIsConnected(false);
+    }
+  };
+
   const getCurrentLocation = () => {
     if (navigator.geolocation) {
       navigator.geolocation.getCurrentPosition(